@@ -44,8 +44,143 @@
 
 /* User includes (#include below this line is not maintained by Processor Expert) */
 
+/*Protocolo de bloques (opcional). El host lo pide con un comando de 3 bytes:
+  COMANDO, modo (0: tramas de 4 bytes, 1: bloques) y velocidad (0: 115200,
+  1: 230400, 2: 460800 baud). La tarjeta responde COMANDO 'B' 'O' 'B' modo
+  velocidad en el modo y velocidad actuales y luego cambia. Al reiniciar
+  vuelve a tramas de 4 bytes a 115200 baud.
+
+  Bloque: 0xB5 0x62, secuencia (16 bits, LSB primero), N muestras,
+  N pares A1/A2 de 12 bits en 3 bytes (A1 bajo, A1 alto | A2 bajo << 4,
+  A2 alto), N bits de D1 y N bits de D2 (primera muestra en el bit 0)
+  y Fletcher-16 de la secuencia hasta los bits (suma1, suma2)*/
+#define MUESTRAS 64	//Muestras por bloque (multiplo de 8)
+#define TAM_BLOQUE (5 + 3*MUESTRAS + 2*(MUESTRAS/8) + 2)
+#define BITS (5 + 3*MUESTRAS)	//Inicio de los bits digitales en el bloque
+#define COMANDO 0xC5
+
 int flag = 0;	//Inicializacion del flag
 
+const byte divisores[3] = {4, 2, 1};	//SCI1BD para 115200, 230400 y 460800 baud (bus de 7.47 MHz)
+
+byte modo = 0;	//0: tramas de 4 bytes, 1: bloques
+byte bloques[2][TAM_BLOQUE];	//Uno se llena mientras el otro se envia
+byte llenando = 0;	//Bloque que se esta llenando
+byte muestras = 0;	//Muestras en el bloque que se esta llenando
+word secuencia = 0;	//Numero del proximo bloque
+word enviados = TAM_BLOQUE;	//Bytes enviados del otro bloque (TAM_BLOQUE: nada pendiente)
+
+
+/*Pasa al buffer del puerto serial lo que quepa del bloque pendiente*/
+void Enviar(void)
+{
+	word ptr;
+	
+	if(enviados < TAM_BLOQUE){
+		(void)AS1_SendBlock(&bloques[llenando ^ 1][enviados], TAM_BLOQUE - enviados, &ptr);
+		enviados += ptr;
+	}
+}
+
+
+/*Agrega una muestra al bloque que se esta llenando y lo cierra al completarlo*/
+void Agregar(byte *A, byte *B, byte d1, byte d2)
+{
+	byte *bloque = bloques[llenando];
+	byte *par = bloque + 5 + 3*muestras;
+	byte mascara = (byte)(1 << (muestras & 7));
+	word i, suma1 = 0, suma2 = 0;
+	
+	if(muestras == 0){	//Bloque nuevo: limpiar los bits digitales
+		for(i = BITS; i < TAM_BLOQUE - 2; i++){
+			bloque[i] = 0;
+		}
+	}
+	
+	par[0] = A[1];
+	par[1] = (A[0] & 0x0F) | (byte)(B[1] << 4);
+	par[2] = (B[1] >> 4) | (byte)(B[0] << 4);
+	if(d1){
+		bloque[BITS + muestras/8] |= mascara;
+	}
+	if(d2){
+		bloque[BITS + MUESTRAS/8 + muestras/8] |= mascara;
+	}
+	
+	muestras++;
+	if(muestras < MUESTRAS){
+		return;
+	}
+	
+	//Bloque completo: cabecera y suma de verificacion
+	bloque[0] = 0xB5;
+	bloque[1] = 0x62;
+	bloque[2] = (byte)secuencia;
+	bloque[3] = (byte)(secuencia >> 8);
+	bloque[4] = MUESTRAS;
+	for(i = 2; i < TAM_BLOQUE - 2; i++){
+		suma1 += bloque[i];
+		if(suma1 >= 255) suma1 -= 255;
+		suma2 += suma1;
+		if(suma2 >= 255) suma2 -= 255;
+	}
+	bloque[TAM_BLOQUE - 2] = (byte)suma1;
+	bloque[TAM_BLOQUE - 1] = (byte)suma2;
+	
+	secuencia++;
+	muestras = 0;
+	if(enviados < TAM_BLOQUE){
+		return;	//El anterior aun sale: este se descarta y el host lo nota por la secuencia
+	}
+	llenando ^= 1;
+	enviados = 0;
+}
+
+
+/*Atiende los comandos del host, un byte por llamada*/
+void Atender(void)
+{
+	static byte comando[3], recibidos = 0;
+	byte respuesta[6], c;
+	word i, ptr;
+	
+	if(AS1_RecvChar(&c) != ERR_OK){
+		return;
+	}
+	if(recibidos == 0 && c != COMANDO){
+		return;
+	}
+	comando[recibidos++] = c;
+	if(recibidos < 3){
+		return;
+	}
+	recibidos = 0;
+	if(comando[1] > 1 || comando[2] > 2){
+		return;	//Comando invalido
+	}
+	
+	//Terminar el bloque pendiente y responder antes de cambiar
+	while(enviados < TAM_BLOQUE){
+		Enviar();
+	}
+	respuesta[0] = COMANDO;
+	respuesta[1] = 'B';
+	respuesta[2] = 'O';
+	respuesta[3] = 'B';
+	respuesta[4] = comando[1];
+	respuesta[5] = comando[2];
+	for(i = 0; i < sizeof(respuesta); i += ptr){
+		(void)AS1_SendBlock(respuesta + i, sizeof(respuesta) - i, &ptr);
+	}
+	while(AS1_GetCharsInTxBuf() != 0 || SCI1S1_TC == 0){}	//Esperar que salga el ultimo bit
+	
+	SCI1BDH = 0x00U;
+	SCI1BDL = divisores[comando[2]];
+	modo = comando[1];
+	muestras = 0;
+	secuencia = 0;
+}
+
 void main(void)
 {
   /* Write your local variable definition here */
@@ -64,6 +199,9 @@ void main(void)
   
   for(;;){
 	  
+	  Atender();	//Comandos del host
+	  Enviar();		//Bloque pendiente, si lo hay
+	  
 	  if(flag != 0){	//Condicion para que muestree a 2 KHz
 		  
 	      //Adquisicin de seales analgicas
@@ -81,6 +219,12 @@ void main(void)
 	  	  B[1] = B[1]>>4 | B[0]<<4;
 	  	  B[0] = B[0]>>4;	  	 
 	  	  
+	  	  if(modo != 0){	//Protocolo de bloques
+	  		  Agregar((byte*)A, (byte*)B, PTA6_GetVal() != 0, PTA7_GetVal() != 0);
+	  		  flag = 0;
+	  		  continue;
+	  	  }
+	  	  
 	  	  //Entramado
 	  	  trama[0] = (A[0] << 2 | A[1] >> 6) & 0b00111111;
 	  	  trama[1] = (A[1] & 0b00111111) | 0b10000000;
@@ -0,0 +1,238 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : acquisition.py
+## Description  : Background readers that drain
+## serial ports into sample rings
+#################################################
+
+import selectors
+import threading
+import time
+
+import numpy as np
+
+from buffers import SampleRing
+from com import DECODERS, FRAME_SIZE, SAMPLE_RATE, FrameDecoder
+from instrumentation import INSTRUMENTS
+
+
+class AcquisitionThread(threading.Thread):
+    """ Dedicated reader for a DEMOQE serial port.
+
+        Drains the port continuously with large reads, decodes the frames
+        in bulk and writes them into a SampleRing. Rendering never touches
+        the port so a slow redraw cannot make the UART overrun. Corrupt
+        bytes are dropped by the decoder and accounted in ``stats``. The
+        decoder (com.FrameDecoder by default) has to match the protocol
+        negotiated with the board. The port is closed when the reader
+        finishes unless closePort is False, e.g. to negotiate the board
+        back to frames after join().
+    """
+
+    def __init__(self, dataSerial, ring, decoder=None, closePort=True):
+        super().__init__(daemon=True)
+        self.dataSerial = dataSerial
+        self.closePort = closePort
+        self.ring = ring
+        self.decoder = decoder or FrameDecoder()
+        self.stats = {'bytesReceived': 0, 'framesReceived': 0,
+                      'syncLosses': 0, 'bytesDiscarded': 0, 'framesDiscarded': 0}
+        self.running = threading.Event()
+        self.running.set()
+
+    def run(self):
+        try:
+            while self.running.is_set():
+                #block for at least one frame, then take everything already waiting
+                waiting = getattr(self.dataSerial, 'in_waiting', 0)
+                data = self.dataSerial.read(max(waiting, FRAME_SIZE))
+                if not data:
+                    continue
+
+                start = INSTRUMENTS.clock()
+                channelA1, channelA2, channelD1, channelD2 = self.decoder.decode(data, self.stats)
+                self.ring.write(channelA1, channelA2, channelD1, channelD2)
+                INSTRUMENTS.record('decode', start)
+                self.stats['bytesReceived'] += len(data)
+                self.stats['framesReceived'] += len(channelA1)
+        finally:
+            if self.closePort:
+                self.dataSerial.close() #only this thread reads it, so never under a read
+
+    def stop(self):
+
+        """ Asks the reader to finish after its current read, join() to
+            wait for it (and the port to be closed)
+        """
+
+        self.running.clear()
+
+
+class Board:
+    """ One device serviced by an AcquisitionManager.
+
+        Decoded samples go to the board's own SampleRing, numbered from
+        the first one read. Frames the decoder had to drop are replaced,
+        where they were dropped, by repeating the sample before them so
+        numbering keeps following the board's clock (counted as filled).
+        Every block is timestamped on arrival; a running least squares fit
+        of arrival time against sample number gives the board's real rate
+        (drift, in ppm of the nominal rate) and the time its sample 0 was
+        taken.
+    """
+
+    def __init__(self, dataSerial, capacity=1 << 17, rate=SAMPLE_RATE, decoder=None):
+        self.dataSerial = dataSerial
+        self.ring = SampleRing(capacity)
+        self.rate = rate
+        self.decoder = decoder or FrameDecoder()
+        self.shift = None #global sample number of the board's sample 0, fixed on the first block
+        self.missing = 0 #frames dropped by a chunk that decoded to nothing, filled before the next
+        self.origin = None #(samples, arrival) of the first block, fit is relative to it
+        self.fit = np.zeros(5) #n, sum x, sum y, sum xx, sum xy of the arrival fit
+        self.stats = {'port': getattr(dataSerial, 'port', None), 'samples': 0, 'blocks': 0,
+                      'syncLosses': 0, 'bytesDiscarded': 0, 'framesDiscarded': 0,
+                      'filled': 0, 'driftPpm': 0.0, 'latency': 0.0}
+
+    def service(self, arrival, startTime):
+
+        """ Reads and decodes whatever the port has, arrival being the time
+            it became readable
+        """
+
+        data = self.dataSerial.read(max(getattr(self.dataSerial, 'in_waiting', 0), FRAME_SIZE))
+        if not data:
+            return
+        block = self.decoder.decode(data, self.stats)
+        gaps = list(getattr(self.decoder, 'gaps', []))
+        if len(block[0]) == 0:
+            self.missing += sum(frames for position, frames in gaps)
+            return
+        if self.missing:
+            gaps.insert(0, (0, self.missing))
+            self.missing = 0
+        self.ring.write(*self._fill(block, gaps))
+
+        #the newest sample was taken (at the latest) when the block arrived
+        newest = self.ring.written - 1
+        if self.shift is None:
+            self.shift = int(round((arrival - startTime)*self.rate)) - newest
+            self.origin = (newest, arrival)
+        x, y = newest - self.origin[0], arrival - self.origin[1]
+        self.fit += (1, x, y, x*x, x*y)
+        n, sx, sy, sxx, sxy = self.fit
+        if n > 2 and n*sxx - sx*sx > 0:
+            slope = (n*sxy - sx*sy)/(n*sxx - sx*sx) #seconds per sample
+            self.stats['driftPpm'] = float((1/(slope*self.rate) - 1)*1e6)
+            self.stats['latency'] = float(y - (sy - slope*sx)/n - slope*x) #vs. the fit, i.e. jitter
+        self.stats['samples'] = self.ring.written
+        self.stats['blocks'] += 1
+
+
+    def _fill(self, block, gaps):
+
+        """ Inserts frames repeating the sample before every gap (the
+            newest in the ring for a gap at 0, none if there is none yet)
+            :returns:
+                The block with its gaps filled
+        """
+
+        last = self.ring.latest(1) if self.ring.written else None
+        gaps = [(position, frames) for position, frames in gaps if position > 0 or last is not None]
+        if not gaps:
+            return block
+        positions = np.repeat([position for position, frames in gaps], [frames for position, frames in gaps])
+        filled = []
+        for i, channel in enumerate(block):
+            #previous[p] is the sample before position p
+            previous = np.concatenate((last[i][-1:] if last is not None else channel[:1], channel))
+            filled.append(np.insert(channel, positions, previous[positions]))
+        self.stats['filled'] += len(positions)
+        return tuple(filled)
+
+
+class AcquisitionManager(threading.Thread):
+    """ Reader for several boards at once, serviced from one selector
+        loop over their file descriptors instead of a thread per board.
+
+        Each board keeps its own ring; all of them are placed on one
+        global timeline at the nominal rate, counted from the moment the
+        manager started, by the arrival time of their first block.
+        read() returns the samples every board already has for a range
+        of that timeline as one block of 4 channels per board.
+    """
+
+    def __init__(self, serials, capacity=1 << 17, rate=SAMPLE_RATE, protocol='frames'):
+        super().__init__(daemon=True)
+        self.rate = rate
+        self.boards = [Board(dataSerial, capacity, rate, DECODERS[protocol]()) for dataSerial in serials]
+        self.selector = selectors.DefaultSelector()
+        for board in self.boards:
+            board.dataSerial.timeout = 0 #reads only take what the selector saw arrive
+            board.dataSerial.reset_input_buffer() #backlog would skew alignment
+            self.selector.register(board.dataSerial, selectors.EVENT_READ, board)
+        self.startTime = None
+        self.running = threading.Event()
+        self.running.set()
+
+    def run(self):
+        self.startTime = time.perf_counter()
+        while self.running.is_set():
+            for key, events in self.selector.select(timeout=0.1):
+                key.data.service(time.perf_counter(), self.startTime)
+        self.selector.close()
+
+    def stop(self):
+
+        """ Asks the loop to finish after its current pass
+        """
+
+        self.running.clear()
+
+    def written(self):
+
+        """ :returns:
+                Global sample number up to which every board has samples
+        """
+
+        if not self.boards or any(board.shift is None for board in self.boards):
+            return 0
+        return min(board.ring.written + board.shift for board in self.boards)
+
+    def read(self, cursor, count=None):
+
+        """ Copies out every aligned sample since cursor (global numbering).
+            If count is given only the newest count are returned
+            :returns:
+                A tuple (block, cursor, lost) where block holds the four
+                channel arrays of every board in order
+        """
+
+        stop = self.written()
+        if stop == 0:
+            return tuple(np.zeros(0, dtype) for board in self.boards
+                         for dtype in (np.uint16, np.uint16, np.uint8, np.uint8)), cursor, 0
+        first = max(board.shift for board in self.boards) #every board has started
+        held = max(board.ring.written - board.ring.capacity + board.shift for board in self.boards)
+        cursor = max(cursor, first)
+        lost = max(0, held - cursor)
+        start = cursor + lost
+        if count is not None:
+            start = max(start, stop - count)
+
+        blocks = [board.ring.slice(start - board.shift, stop - board.shift) for board in self.boards]
+        skip = max(overrun for block, overrun in blocks) #keep boards aligned if one was lapped
+        lost += skip
+        block = tuple(channel[skip - overrun:] for channels, overrun in blocks for channel in channels)
+        return block, stop, lost
+
+    def stats(self):
+
+        """ :returns:
+                A list with the statistics of every board
+        """
+
+        return [dict(board.stats) for board in self.boards]
@@ -0,0 +1,291 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : benchmark.py
+## Description  : Throughput and latency benchmarks
+## for decoding, buffering and rendering
+#################################################
+
+""" Usage: python benchmark.py [--output results.json] [--only decode,history]
+
+    Results are written as JSON together with the commit they were taken
+    at, so runs from different commits can be compared directly.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from buffers import ChannelStore, SampleRing
+from com import BLOCK_SAMPLES, SAMPLE_RATE, BlockDecoder, frameBlock, packBlock, receiveData, unframeBlock
+from emulator import Emulator, corrupt
+from persistence import Persistence
+from pyramid import MinMaxPyramid
+
+
+def rate(fn, items, seconds=1.0):
+
+    """ Calls fn repeatedly for about the given time
+        :returns:
+            items processed per second (items being processed per call)
+    """
+
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn()
+        calls += 1
+    return calls*items/(time.perf_counter() - start)
+
+
+def testFrames(n, corruption=0.0):
+
+    """ n samples of random data framed like the firmware does
+    """
+
+    rng = np.random.default_rng(0)
+    data = frameBlock(rng.integers(0, 4096, n), rng.integers(0, 4096, n),
+                      rng.integers(0, 2, n), rng.integers(0, 2, n))
+    return corrupt(data, corruption)
+
+
+def testBlocks(n, corruption=0.0):
+
+    """ n samples of random data packed in blocks like the firmware does
+        in block mode
+    """
+
+    rng = np.random.default_rng(0)
+    channels = (rng.integers(0, 4096, n), rng.integers(0, 4096, n),
+                rng.integers(0, 2, n), rng.integers(0, 2, n))
+    data = b''.join(packBlock(i//BLOCK_SAMPLES, *[channel[i:i + BLOCK_SAMPLES] for channel in channels])
+                    for i in range(0, n, BLOCK_SAMPLES))
+    return corrupt(data, corruption)
+
+
+def benchDecode(seconds):
+
+    """ Frames/s through the com.py decode paths
+    """
+
+    results = {}
+    data = testFrames(20000)
+
+    def legacy():
+        source = io.BytesIO(data)
+        for i in range(len(data)//4):
+            receiveData(source)
+    results['receiveData_frames_per_s'] = rate(legacy, len(data)//4, seconds)
+
+    big = testFrames(1 << 18)
+    results['unframeBlock_frames_per_s'] = rate(lambda: unframeBlock(big), len(big)//4, seconds)
+    results['unframeBlock_MB_per_s'] = results['unframeBlock_frames_per_s']*4/1e6
+
+    noisy = testFrames(1 << 18, 1e-4)
+    results['unframeBlock_noisy_frames_per_s'] = rate(lambda: unframeBlock(noisy, {}), len(noisy)//4, seconds)
+
+    blocks = testBlocks(1 << 18)
+    results['blocks_bytes_per_sample'] = len(blocks)/(1 << 18)
+    results['BlockDecoder_samples_per_s'] = rate(lambda: BlockDecoder().decode(blocks), 1 << 18, seconds)
+
+    noisy = testBlocks(1 << 18, 1e-4)
+    results['BlockDecoder_noisy_samples_per_s'] = rate(lambda: BlockDecoder().decode(noisy, {}), 1 << 18, seconds)
+
+    return results
+
+
+def benchHistory(seconds, depth=2000, block=300):
+
+    """ Samples/s through channel history updates
+    """
+
+    results = {}
+    samples = np.arange(block, dtype=np.uint16)
+
+    history = [0.0]*depth
+    def legacy():
+        for sample in samples.tolist():
+            history.pop(0)
+            history.append(sample*3/4096)
+    results['list_pop_append_samples_per_s'] = rate(legacy, block, seconds)
+
+    for size in (depth, 100*depth):
+        store = ChannelStore(size)
+        results['channelstore_%d_samples_per_s' % size] = rate(lambda: store.append(samples), block, seconds)
+
+    ring = SampleRing()
+    digital = np.zeros(block, dtype=np.uint8)
+    def ringRoundTrip():
+        ring.write(samples, samples, digital, digital)
+        ring.read(ring.written - block)
+    results['samplering_write_read_samples_per_s'] = rate(ringRoundTrip, block, seconds)
+
+    return results
+
+
+def benchPyramid(seconds, hours=1.0, block=300, pixels=1000):
+
+    """ Samples/s appended to a min/max pyramid and time to view spans
+        from the whole history down to one screen, which should not
+        depend on the span
+    """
+
+    results = {}
+    samples = np.random.default_rng(0).integers(0, 4096, block).astype(np.uint16)
+    pyramid = MinMaxPyramid()
+    results['pyramid_append_samples_per_s'] = rate(lambda: pyramid.append(samples), block, seconds)
+
+    pyramid = MinMaxPyramid()
+    hour = np.resize(samples, int(hours*3600*SAMPLE_RATE))
+    pyramid.append(hour)
+    for span in (len(hour), len(hour)//60, SAMPLE_RATE, pixels):
+        views = rate(lambda: pyramid.view(len(hour)//3, len(hour)//3 + span, pixels), 1, seconds)
+        results['pyramid_view_%d_ms' % span] = 1e3/views
+    return results
+
+
+def benchPersistence(seconds, points=SAMPLE_RATE):
+
+    """ Points/s binned into persistence images and time to fade and
+        color one for drawing, which depends on the image size only
+    """
+
+    results = {}
+    rng = np.random.default_rng(0)
+    x, y = rng.random(points), rng.random(points)
+    for width, height in ((250, 185), (500, 370)):
+        persistence = Persistence(width, height)
+        results['persistence_%dx%d_points_per_s' % (width, height)] = rate(lambda: persistence.add(x, y), points, seconds)
+        frames = rate(lambda: (persistence.fade(), persistence.levels()), 1, seconds)
+        results['persistence_%dx%d_frame_ms' % (width, height)] = 1e3/frames
+    return results
+
+
+def newCanvas(port):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    from oscilloscope import MplCanvas
+    app = QApplication.instance() or QApplication(sys.argv)
+    return app, MplCanvas(port=port)
+
+
+def closeCanvas(canvas, emulator):
+    canvas.reader.stop()
+    canvas.reader.join() #port closed by the reader, before the pty goes away
+    emulator.stop()
+
+
+def waitFilled(canvas, app, timeout=10.0):
+    start = time.perf_counter()
+    while len(canvas.channelA1) < len(canvas.timescale) and time.perf_counter() - start < timeout:
+        canvas.update_figure([True]*4)
+        app.processEvents()
+        time.sleep(0.01)
+
+
+def benchRender(seconds):
+
+    """ update_figure frames/s and per frame latency on an offscreen canvas
+    """
+
+    emulator = Emulator()
+    emulator.start()
+    app, canvas = newCanvas(emulator.port)
+    waitFilled(canvas, app)
+
+    latencies = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        t = time.perf_counter()
+        canvas.update_figure([True]*4)
+        app.processEvents()
+        latencies.append(time.perf_counter() - t)
+
+    closeCanvas(canvas, emulator)
+    latencies = np.array(latencies)*1e3
+    return {'update_figure_fps': len(latencies)/(time.perf_counter() - start),
+            'update_figure_ms_mean': float(latencies.mean()),
+            'update_figure_ms_p95': float(np.percentile(latencies, 95))}
+
+
+def benchEndToEnd(seconds, sampleRate=SAMPLE_RATE):
+
+    """ Sample to pixel latency against the emulated board: time from the
+        moment the newest drawn sample was generated until its frame is
+        on the canvas
+    """
+
+    emulator = Emulator(rate=sampleRate)
+    emulator.start()
+    app, canvas = newCanvas(emulator.port)
+    waitFilled(canvas, app)
+
+    latencies = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        canvas.update_figure([True]*4)
+        app.processEvents()
+        newest = canvas.cursor - 1 #samples are numbered like the emulator ones
+        latencies.append(time.perf_counter() - (emulator.startTime + newest/sampleRate))
+
+    closeCanvas(canvas, emulator)
+    latencies = np.array(latencies)*1e3
+    return {'sample_rate': sampleRate,
+            'sample_to_pixel_ms_mean': float(latencies.mean()),
+            'sample_to_pixel_ms_p95': float(np.percentile(latencies, 95))}
+
+
+BENCHMARKS = {
+    'decode': benchDecode,
+    'history': benchHistory,
+    'pyramid': benchPyramid,
+    'persistence': benchPersistence,
+    'render': benchRender,
+    'endtoend': benchEndToEnd,
+}
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BOB performance benchmarks')
+    parser.add_argument('--output', help='JSON file to write results to (default stdout)')
+    parser.add_argument('--only', default=','.join(BENCHMARKS), help='comma separated benchmarks to run')
+    parser.add_argument('--seconds', type=float, default=2.0, help='time spent on each measurement')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only.split(','):
+        results[name] = BENCHMARKS[name](args.seconds)
+        print(name, json.dumps(results[name]), file=sys.stderr)
+
+    report = {'commit': commit(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'numpy': np.__version__,
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,424 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : bob.py
+## Description  : Headless acquisition library and
+## command line interface for the BOB oscilloscope
+#################################################
+
+""" Usage: python bob.py capture SECONDS -o run.bob [--port PORT]
+           python bob.py stream [--seconds S] [--output samples.csv] [--volts]
+                                [--math "a1 - a2" [--filter notch:50] [--decimate N]]
+           python bob.py stats [--seconds S] [--interval I]
+           python bob.py measure [--seconds S] [--interval I] [--window W]
+           python bob.py boards --port PORT --port PORT... [--output merged.csv]
+           python bob.py serve --listen tcp://127.0.0.1:5025 [--port PORT]
+           python bob.py gui [--port PORT]
+
+    Every command takes --port, --playback (a capture file instead of a
+    board) or --emulate (a virtual board, see emulator.py). A port may
+    also be the address of a running serve command, so several commands
+    can share one board. --protocol blocks and --baudrate ask boards
+    whose firmware supports it for the block protocol (see com.negotiate);
+    older boards keep sending 4 byte frames. --processes moves reading,
+    decoding and measuring to worker processes (see pipeline.py). Scope can be
+    used the same way from scripts. Nothing here imports PyQt5 or
+    matplotlib, the gui command loads them only when it runs.
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from acquisition import AcquisitionManager, AcquisitionThread
+from buffers import SampleRing
+from dsp import MathStage
+from com import BAUDRATES, DECODERS, PROTOCOLS, SAMPLE_RATE, convertAnalog, convertDigital, findBoard, negotiate, openPort, openPorts
+from measurements import Measurements, describe
+from pipeline import MeasureStage, Pipeline
+from recorder import CaptureReader, CaptureWriter, PlaybackThread
+from server import ClientThread, SampleServer, isAddress
+from instrumentation import INSTRUMENTS, StatsLogger
+
+
+class Scope:
+    """ Headless oscilloscope: a sample source drained into a SampleRing
+        by a background thread.
+
+        The source is the serial port of a board (port, or the one
+        com.findBoard finds), the address of a server.SampleServer or a
+        capture file played back at its recorded rate. A board is asked
+        for the given protocol and baud rate and stays with 4 byte frames
+        at 115200 baud if it does not answer (``protocol`` tells which one
+        is in use). With processes the board is read and decoded by a
+        worker process (pipeline.Pipeline) into a ring in shared memory
+        instead of a thread. Samples are raw ADC codes and digital bits; read() returns
+        whatever arrived since the previous call and acquire() blocks
+        until a number of seconds worth of samples is in.
+    """
+
+    def __init__(self, port=None, capture=None, capacity=1 << 17, baudrate=115200, protocol='frames',
+                 processes=False):
+        self.ring = SampleRing(capacity)
+        self.dataSerial = None
+        self.protocol = 'frames'
+        if capture:
+            playback = CaptureReader(capture)
+            self.sampleRate = playback.sampleRate
+            self.reader = PlaybackThread(playback, self.ring, loop=False)
+        elif isAddress(port):
+            self.reader = ClientThread(port, self.ring)
+            self.sampleRate = self.reader.sampleRate
+        elif processes:
+            self.reader = Pipeline(port, capacity, protocol=protocol, baudrate=baudrate)
+            self.ring = self.reader.ring
+            self.sampleRate = self.reader.sampleRate
+        else:
+            #boards always start with frames at the first baud rate
+            self.dataSerial = openPort([port], BAUDRATES[0]) if port else findBoard(sys.platform, BAUDRATES[0])
+            if self.dataSerial is None:
+                raise EnvironmentError('No BOB board found on %s' % (port or 'any port'))
+            if (protocol, baudrate) != (self.protocol, BAUDRATES[0]) and negotiate(self.dataSerial, protocol, baudrate):
+                self.protocol = protocol
+            self.sampleRate = SAMPLE_RATE
+            self.reader = AcquisitionThread(self.dataSerial, self.ring, DECODERS[self.protocol](), closePort=False)
+        self.cursor = 0
+        self.lost = 0 #samples overwritten in the ring before being read
+        self.startTime = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.reader.start()
+        self.startTime = time.perf_counter() #after a pipeline has spawned its workers
+        if isinstance(self.reader, Pipeline): #negotiated by the worker
+            self.protocol = self.reader.stats.get('protocol', self.protocol)
+        return self
+
+    def stop(self):
+
+        """ Stops the reader thread and releases the port
+        """
+
+        self.reader.stop()
+        self.reader.join()
+        if self.dataSerial is not None:
+            if self.dataSerial.baudrate != BAUDRATES[0] or self.protocol != 'frames':
+                negotiate(self.dataSerial, 'frames', BAUDRATES[0]) #leave the board as found
+            self.dataSerial.close()
+
+    def running(self):
+        return self.reader.is_alive()
+
+    def read(self, count=None):
+
+        """ Samples published since the previous call (at most count)
+            :returns:
+                A tuple of the four channel arrays
+        """
+
+        block, self.cursor, lost = self.ring.read(self.cursor, count)
+        self.lost += lost
+        return block
+
+    def acquire(self, seconds, period=0.01):
+
+        """ Blocks until seconds worth of samples have arrived (or the
+            source ends)
+            :returns:
+                A tuple of the four channel arrays
+        """
+
+        wanted = int(seconds*self.sampleRate)
+        blocks = []
+        got = 0
+        while got < wanted:
+            block = self.read(wanted - got)
+            if len(block[0]) == 0:
+                if not self.running():
+                    break
+                time.sleep(period)
+                continue
+            blocks.append(block)
+            got += len(block[0])
+        if not blocks:
+            return self.read(0)
+        return tuple(np.concatenate(channel) for channel in zip(*blocks))
+
+    def stats(self):
+
+        """ :returns:
+                A dict with samples acquired, average rate, ring fill (0-1)
+                and samples lost by this consumer, the reader counters and
+                the stage timers if enabled
+        """
+
+        elapsed = time.perf_counter() - self.startTime if self.startTime else 0.0
+        stats = {'samples': self.ring.written,
+                 'seconds': elapsed,
+                 'samplesPerSecond': self.ring.written/elapsed if elapsed else 0.0,
+                 'ringFill': (self.ring.written - self.cursor)/self.ring.capacity,
+                 'lost': self.lost}
+        stats.update(getattr(self.reader, 'stats', {}))
+        if INSTRUMENTS.enabled:
+            stats['timers'] = INSTRUMENTS.snapshot()
+        return stats
+
+
+def toVolts(block):
+
+    """ Converts a block of raw samples to volts
+        :returns:
+            A tuple of the four channel arrays as floats
+    """
+
+    return (convertAnalog(block[0]), convertAnalog(block[1]), convertDigital(block[2]), convertDigital(block[3]))
+
+
+def capture(scope, args):
+    writer = CaptureWriter(args.output, scope.sampleRate)
+    wanted = int(args.seconds*scope.sampleRate)
+    while writer.samples + writer.buffered < wanted:
+        block = scope.read(wanted - writer.samples - writer.buffered)
+        if len(block[0]) == 0:
+            if not scope.running():
+                break
+            time.sleep(0.01)
+            continue
+        writer.write(*block)
+    writer.close()
+    print('%d samples written to %s' % (writer.samples, args.output), file=sys.stderr)
+
+
+def stream(scope, args):
+    #with --math a single column derived from the channels is written instead
+    math = MathStage(args.math, args.filter, args.decimate, scope.sampleRate) if args.math else None
+    out = open(args.output, 'w') if args.output else sys.stdout
+    fmt = '%.6g' if math else '%.4f' if args.volts else '%d'
+    end = time.perf_counter() + args.seconds if args.seconds else None
+    try:
+        print(args.math if math else 'a1,a2,d1,d2', file=out)
+        while end is None or time.perf_counter() < end:
+            block = scope.read()
+            if math and len(block[0]):
+                np.savetxt(out, math.process(block), fmt=fmt)
+                out.flush()
+            elif len(block[0]):
+                np.savetxt(out, np.column_stack(toVolts(block) if args.volts else block), fmt=fmt, delimiter=',')
+                out.flush()
+            elif not scope.running():
+                break
+            else:
+                time.sleep(0.01)
+    except BrokenPipeError: #e.g. piped into head
+        pass
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def stats(scope, args):
+    logger = StatsLogger(args.log, scope.stats, args.interval) if args.log else None
+    if logger:
+        logger.start()
+    end = time.perf_counter() + args.seconds if args.seconds else None
+    while (end is None or time.perf_counter() < end) and scope.running():
+        time.sleep(args.interval)
+        stats = scope.stats() #before catching up, so ring fill shows the backlog
+        scope.read() #keep up with the ring so lost only counts real overruns
+        timers = stats.pop('timers', {})
+        stats.update(('%s_ms' % name, timer['recent_ms']) for name, timer in timers.items())
+        print(' '.join('%s=%s' % (key, round(value, 3) if isinstance(value, float) else value)
+                       for key, value in stats.items()), flush=True)
+    if logger:
+        logger.stop()
+
+
+def measure(scope, args):
+    window = int(args.window*scope.sampleRate)
+    pipeline = scope.reader if isinstance(scope.reader, Pipeline) else None
+    if pipeline: #measured by a worker process
+        pipeline.add('measure', MeasureStage(window, scope.sampleRate))
+    else:
+        measurements = Measurements(window, scope.sampleRate)
+    end = time.perf_counter() + args.seconds if args.seconds else None
+    while (end is None or time.perf_counter() < end) and scope.running():
+        time.sleep(args.interval)
+        if pipeline:
+            scope.read() #keep the cursor up with the ring
+            values = pipeline.result('measure') or [None for i in range(4)]
+        else:
+            measurements.feed(scope.read())
+            values = measurements.measure()
+        print(' | '.join(describe(channel, value) for channel, value in enumerate(values)), flush=True)
+
+
+def serve(scope, args):
+    server = SampleServer(scope.ring, args.listen, scope.sampleRate)
+    server.start()
+    print('serving on', server.address, file=sys.stderr, flush=True)
+    try:
+        while scope.running():
+            time.sleep(args.interval)
+            print(' '.join('%s=%s' % item for item in server.stats.items()), flush=True)
+    finally:
+        server.stop()
+        server.join()
+
+
+def boards(args):
+
+    """ Acquires from several boards at once, printing the statistics of
+        every board and optionally writing the time aligned samples of all
+        of them as CSV (four columns per board)
+    """
+
+    serials = openPorts(args.port)
+    if not serials:
+        raise EnvironmentError('No BOB board found on %s' % ', '.join(args.port))
+    protocol = args.protocol
+    if (protocol, args.baudrate) != ('frames', BAUDRATES[0]):
+        #one decoder for all boards, so every board has to switch
+        if not all([negotiate(dataSerial, protocol, args.baudrate) for dataSerial in serials]):
+            for dataSerial in serials:
+                negotiate(dataSerial, 'frames', BAUDRATES[0])
+            protocol = 'frames'
+    manager = AcquisitionManager(serials, protocol=protocol)
+    manager.start()
+    out = open(args.output, 'w') if args.output else None
+    if out:
+        print(','.join('%s%d' % (name, board) for board in range(len(serials))
+                       for name in ('a1_', 'a2_', 'd1_', 'd2_')), file=out)
+    cursor = 0
+    end = time.perf_counter() + args.seconds if args.seconds else None
+    try:
+        while end is None or time.perf_counter() < end:
+            time.sleep(args.interval)
+            block, cursor, lost = manager.read(cursor)
+            if out and len(block[0]):
+                np.savetxt(out, np.column_stack(block), fmt='%d', delimiter=',')
+            for board in manager.stats():
+                print(' '.join('%s=%s' % (key, round(value, 4) if isinstance(value, float) else value)
+                               for key, value in board.items()), flush=True)
+    finally:
+        manager.stop()
+        manager.join()
+        for dataSerial in serials:
+            if dataSerial.baudrate != BAUDRATES[0] or protocol != 'frames':
+                negotiate(dataSerial, 'frames', BAUDRATES[0]) #leave the boards as found
+            dataSerial.close()
+        if out:
+            out.close()
+
+
+COMMANDS = {
+    'capture': capture,
+    'stream': stream,
+    'stats': stats,
+    'measure': measure,
+    'serve': serve,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='BOB oscilloscope acquisition')
+    source = argparse.ArgumentParser(add_help=False)
+    source.add_argument('--port', help='serial port of the board (default: search for it)')
+    source.add_argument('--playback', help='capture file to read instead of a board')
+    source.add_argument('--emulate', action='store_true', help='acquire from a virtual board')
+    link = argparse.ArgumentParser(add_help=False)
+    link.add_argument('--protocol', choices=PROTOCOLS, default='frames', help='protocol to ask the board for')
+    link.add_argument('--baudrate', type=int, choices=BAUDRATES, default=BAUDRATES[0], help='baud rate to ask the board for')
+    source.add_argument('--processes', action='store_true', help='read the board and analyse in worker processes')
+    source = argparse.ArgumentParser(add_help=False, parents=[source, link])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('capture', parents=[source], help='record a number of seconds to a capture file')
+    command.add_argument('seconds', type=float)
+    command.add_argument('-o', '--output', required=True, help='capture file to write')
+
+    command = commands.add_parser('stream', parents=[source], help='print decoded samples as CSV')
+    command.add_argument('--seconds', type=float, help='stop after this time (default: run until interrupted)')
+    command.add_argument('--output', help='file to write to (default stdout)')
+    command.add_argument('--volts', action='store_true', help='convert samples to volts')
+    command.add_argument('--math', help='write this expression of a1, a2 (volts), d1 and d2 instead, e.g. "a1 - a2"')
+    command.add_argument('--filter', action='append', default=[],
+                         help='filter the math channel, e.g. lowpass:50, notch:60:30 or fir:100 (repeatable)')
+    command.add_argument('--decimate', type=int, default=1, help='keep one math sample out of N after anti-aliasing')
+
+    command = commands.add_parser('stats', parents=[source], help='print live acquisition statistics')
+    command.add_argument('--seconds', type=float, help='stop after this time (default: run until interrupted)')
+    command.add_argument('--interval', type=float, default=1.0, help='seconds between reports')
+    command.add_argument('--timers', action='store_true', help='also time the decoder')
+    command.add_argument('--log', help='append every report to this file as JSON lines')
+
+    command = commands.add_parser('measure', parents=[source], help='print live measurements of every channel')
+    command.add_argument('--seconds', type=float, help='stop after this time (default: run until interrupted)')
+    command.add_argument('--interval', type=float, default=1.0, help='seconds between reports')
+    command.add_argument('--window', type=float, default=1.0, help='seconds measured')
+
+    command = commands.add_parser('serve', parents=[source], help='share live samples with local clients')
+    command.add_argument('--listen', default='tcp://127.0.0.1:5025', help='tcp://host:port or unix:///path')
+    command.add_argument('--interval', type=float, default=5.0, help='seconds between reports')
+
+    command = commands.add_parser('boards', parents=[link], help='acquire from several boards at once, time aligned')
+    command.add_argument('--port', action='append', default=[], help='serial port of a board (repeat for each)')
+    command.add_argument('--emulate', type=int, default=0, help='number of virtual boards to add')
+    command.add_argument('--seconds', type=float, help='stop after this time (default: run until interrupted)')
+    command.add_argument('--interval', type=float, default=1.0, help='seconds between reports')
+    command.add_argument('--output', help='CSV file for the aligned samples of every board')
+
+    commands.add_parser('gui', parents=[source], help='open the oscilloscope window')
+    args = parser.parse_args(argv)
+    if args.command == 'gui' and args.playback:
+        parser.error('gui reads a board, open captures from its File menu')
+    if args.command == 'gui' and (args.protocol, args.baudrate) != ('frames', BAUDRATES[0]):
+        parser.error('gui reads frames at %d baud, --protocol and --baudrate do not apply' % BAUDRATES[0])
+    if args.command == 'stream' and (args.filter or args.decimate != 1) and not args.math:
+        parser.error('--filter and --decimate apply to --math')
+    if args.command == 'stream' and args.math:
+        try:
+            MathStage(args.math, args.filter, args.decimate) #checked before opening the board
+        except (SyntaxError, ValueError) as error:
+            parser.error('bad math channel: %s' % error)
+
+    INSTRUMENTS.enabled = getattr(args, 'timers', False)
+    emulators = []
+    for i in range(int(args.emulate)):
+        from emulator import Emulator
+        emulators.append(Emulator())
+        emulators[-1].start()
+    if emulators and args.command == 'boards':
+        args.port += [emulator.port for emulator in emulators]
+    elif emulators:
+        args.port = emulators[0].port
+
+    try:
+        if args.command == 'boards':
+            return boards(args)
+        if args.command == 'gui':
+            from oscilloscope import main as gui #PyQt5 and matplotlib load here only
+            return gui(args.port, args.processes)
+        with Scope(args.port, args.playback, baudrate=args.baudrate, protocol=args.protocol,
+                   processes=args.processes) as scope:
+            COMMANDS[args.command](scope, args)
+    except KeyboardInterrupt:
+        pass
+    except EnvironmentError as error: #no board, or a worker that could not open it
+        parser.exit(1, '%s\n' % error)
+    finally:
+        for emulator in emulators:
+            emulator.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
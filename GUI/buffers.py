@@ -0,0 +1,243 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : buffers.py
+## Description  : Preallocated sample buffers shared
+## between acquisition and rendering
+#################################################
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class ChannelStore:
+    """ Fixed size history of one channel.
+
+        Every sample is written twice, at its slot and at its slot plus
+        capacity, so any run of the newest samples is contiguous in memory
+        and can be handed out as a view in time order without copying.
+        Appending a block costs the same whatever the history depth.
+        Storage may be given as data (2*capacity samples), e.g. to place
+        it in shared memory.
+    """
+
+    def __init__(self, capacity, dtype=np.uint16, data=None):
+        self.capacity = capacity
+        self.data = np.zeros(2*capacity, dtype=dtype) if data is None else data
+        self.written = 0 #total samples ever appended
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def append(self, block):
+
+        """ Appends a block of samples, only the newest capacity are kept
+        """
+
+        n = len(block)
+        if n > self.capacity:
+            block = block[n - self.capacity:]
+        m = len(block)
+        start = (self.written + n - m) % self.capacity
+        first = min(m, self.capacity - start)
+
+        self.data[start:start + first] = block[:first]
+        self.data[start + self.capacity:start + self.capacity + first] = block[:first]
+        self.data[:m - first] = block[first:]
+        self.data[self.capacity:self.capacity + m - first] = block[first:]
+
+        self.written += n
+
+    def view(self, start, stop):
+
+        """ Samples numbered start to stop, which must still be held
+            :returns:
+                A read only view of the samples in time order
+        """
+
+        if start < self.written - self.capacity or stop > self.written or start > stop:
+            raise IndexError('samples %d:%d are not held' % (start, stop))
+        first = start % self.capacity
+        view = self.data[first:first + stop - start]
+        view.flags.writeable = False
+        return view
+
+    def last(self, count):
+
+        """ Newest count samples (fewer if not yet available)
+            :returns:
+                A read only view of the samples in time order
+        """
+
+        count = min(count, len(self))
+        return self.view(self.written - count, self.written)
+
+
+class SampleRing:
+    """ Single producer / single consumer ring of decoded samples.
+
+        Storage is preallocated once as one ChannelStore per channel. The
+        producer reserves the slots it is about to overwrite, copies whole
+        blocks in and then publishes them by advancing ``written``;
+        consumers keep their own cursor so no lock is ever taken. If a consumer falls
+        more than ``capacity`` samples behind, the oldest samples are
+        overwritten and reported as lost on its next read.
+    """
+
+    def __init__(self, capacity=1 << 17):
+        self.capacity = capacity
+        self.channelA1 = ChannelStore(capacity, np.uint16)
+        self.channelA2 = ChannelStore(capacity, np.uint16)
+        self.channelD1 = ChannelStore(capacity, np.uint8)
+        self.channelD2 = ChannelStore(capacity, np.uint8)
+        self.written = 0 #total samples ever published, only the producer writes it
+        self.reserved = 0 #samples published or being written right now
+
+    def _channels(self):
+        return self.channelA1, self.channelA2, self.channelD1, self.channelD2
+
+    def write(self, channelA1, channelA2, channelD1, channelD2):
+
+        """ Copies a block of samples into the ring and publishes it
+        """
+
+        n = len(channelA1)
+        self.reserved = self.written + n
+        for store, block in zip(self._channels(), (channelA1, channelA2, channelD1, channelD2)):
+            store.append(block)
+
+        self.written += n
+
+    def read(self, cursor, count=None):
+
+        """ Copies out every sample published since cursor. If count is
+            given only the newest count samples are returned, older ones
+            are skipped on purpose and not reported as lost.
+            :returns:
+                A tuple (block, cursor, lost) where block is a tuple of the
+                four channel arrays, cursor is the position to pass on the
+                next call and lost the number of samples overwritten before
+                they could be read
+        """
+
+        written = self.written
+        lost = max(0, written - self.capacity - cursor)
+        start = cursor + lost
+        if count is not None:
+            start = max(start, written - count)
+
+        block = self._copy(start, written)
+
+        #the producer may have lapped us while copying, drop what it touched
+        overrun = min(self.reserved - self.capacity - start, written - start)
+        if overrun > 0:
+            block = tuple(channel[overrun:] for channel in block)
+            lost += overrun
+
+        return block, written, lost
+
+    def slice(self, start, stop):
+
+        """ Copies out samples numbered start to stop, as far as published
+            :returns:
+                A tuple (block, lost) where lost is how many samples at the
+                beginning of the range were already overwritten, block
+                holding only the ones after them
+        """
+
+        written = self.written
+        stop = min(stop, written)
+        lost = max(0, min(stop, written - self.capacity) - start)
+        start += lost
+        block = self._copy(start, max(start, stop))
+
+        overrun = min(self.reserved - self.capacity - start, stop - start)
+        if overrun > 0:
+            block = tuple(channel[overrun:] for channel in block)
+            lost += overrun
+
+        return block, lost
+
+    def latest(self, count):
+
+        """ Snapshot of the newest count samples (fewer if not yet available)
+            :returns:
+                A tuple of the four channel arrays in time order
+        """
+
+        block, _, _ = self.read(0, count)
+        return block
+
+    def _copy(self, start, stop):
+        #straight from storage, the producer may already be past store.written checks
+        first = start % self.capacity
+        return tuple(store.data[first:first + stop - start].copy() for store in self._channels())
+
+
+class SharedSampleRing(SampleRing):
+    """ SampleRing whose storage and counters live in one shared memory
+        block, so a producer and consumers in other processes see the
+        same samples without copying them through pipes.
+
+        A ring pickles as the name of its block: handing it to another
+        process (e.g. as a multiprocessing.Process argument) attaches
+        that process to the same memory. The process that created it
+        owns the block and removes it on close().
+    """
+
+    DTYPES = (np.uint16, np.uint16, np.uint8, np.uint8)
+    COUNTERS = 2 #written, reserved as int64 at the start of the block
+
+    def __init__(self, capacity=1 << 17, name=None):
+        size = 8*self.COUNTERS + 2*capacity*sum(np.dtype(dtype).itemsize for dtype in self.DTYPES)
+        self.owner = name is None
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.capacity = capacity
+
+        self.counters = np.ndarray(self.COUNTERS, dtype=np.int64, buffer=self.memory.buf)
+        offset = self.counters.nbytes
+        stores = []
+        for dtype in self.DTYPES:
+            data = np.ndarray(2*capacity, dtype=dtype, buffer=self.memory.buf, offset=offset)
+            offset += data.nbytes
+            store = ChannelStore(capacity, dtype, data)
+            store.written = self.written #a producer attaching later carries on from here
+            stores.append(store)
+        self.channelA1, self.channelA2, self.channelD1, self.channelD2 = stores
+
+    def __reduce__(self):
+        return SharedSampleRing, (self.capacity, self.memory.name)
+
+    @property
+    def written(self):
+        return int(self.counters[0])
+
+    @written.setter
+    def written(self, value):
+        self.counters[0] = value
+
+    @property
+    def reserved(self):
+        return int(self.counters[1])
+
+    @reserved.setter
+    def reserved(self, value):
+        self.counters[1] = value
+
+    def close(self):
+
+        """ Detaches this process from the ring (removing the shared block
+            if this process created it). The ring cannot be used afterwards
+        """
+
+        if self.memory is None:
+            return
+        #views into the block have to go before it can be unmapped
+        self.counters = self.channelA1 = self.channelA2 = self.channelD1 = self.channelD2 = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+        self.memory = None
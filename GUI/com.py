@@ -8,23 +8,143 @@
 ## unframing and processing for MC9S08QE128 uC
 #################################################
 
-def openPort(ports,baudrate=115200):
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-    """ Opens proper port from a given list
+import numpy as np
+
+
+FRAME_SIZE = 4
+SAMPLE_RATE = 2000 #samples/s sent by the DEMOQE firmware
+
+#bit 7 of every byte in a frame: 0 for the first one, 1 for the rest.
+#read as a little endian 32 bit word this is the frame start pattern
+FRAME_SYNC_MASK = 0x80808080
+FRAME_SYNC_BITS = 0x80808000
+
+#optional block protocol (BOB/Sources/main.c), asked for by negotiate():
+#magic, sequence (uint16), sample count (uint8), packed A1/A2 pairs (3
+#bytes each), D1 and D2 bits (little bit order) and a Fletcher-16 of
+#everything between the magic and the checksum
+BLOCK_MAGIC = b'\xb5\x62'
+BLOCK_HEADER = 5
+BLOCK_SAMPLES = 64 #samples per block sent by the firmware
+
+#negotiation command: COMMAND, protocol index, baud rate index. The board
+#answers COMMAND_ACK + both indexes before switching
+COMMAND = 0xC5
+COMMAND_ACK = b'\xc5BOB'
+PROTOCOLS = ('frames', 'blocks')
+BAUDRATES = (115200, 230400, 460800)
+
+PORT_CACHE = os.path.join(os.path.expanduser('~'), '.bob_port') #last port a board answered on
+
+
+def probePort(port, baudrate=115200, timeout=0.2, frames=3):
+
+    """ Opens a port and checks it is a BOB board: it has to send at
+        least the given number of valid frames within timeout seconds
         :returns:
-            A serial.Serial instance for the proper port
+            A serial.Serial instance for the port, or None
     """
 
     import serial
-    for port in ports:
-        s = serial.Serial(port,baudrate=baudrate,timeout=0.1)
-        if s.read(4) != b'':
+    try:
+        s = serial.Serial(port,baudrate=baudrate,timeout=timeout)
+    except (OSError, serial.SerialException):
+        return None
+    try:
+        #one frame more than needed, the first one may be cut
+        data = s.read((frames + 1)*FRAME_SIZE)
+        if len(unframeBlock(data)[0]) >= frames:
+            s.timeout = 0.1
             return s
+    except (OSError, serial.SerialException):
+        pass
+    s.close()
+    return None
+
+
+def openPort(ports,baudrate=115200,timeout=0.2):
+
+    """ Opens proper port from a given list. All ports are probed at once,
+        the first one sending valid frames is kept and remembered
+        :returns:
+            A serial.Serial instance for the proper port, or None
+    """
+
+    found = None
+    with ThreadPoolExecutor(max_workers=max(1, min(32, len(ports)))) as pool:
+        probes = [pool.submit(probePort, port, baudrate, timeout) for port in ports]
+        for probe in as_completed(probes):
+            s = probe.result()
+            if s is None:
+                continue
+            if found is None:
+                found = s
+            else:
+                s.close()
+
+    if found is not None:
+        rememberPort(found.port)
+    return found
+
+
+def openPorts(ports,baudrate=115200,timeout=0.2):
+
+    """ Opens every board found in a given list of ports, probing them
+        all at once
+        :returns:
+            A list of serial.Serial instances, in the order of ports
+    """
+
+    with ThreadPoolExecutor(max_workers=max(1, min(32, len(ports)))) as pool:
+        found = list(pool.map(lambda port: probePort(port, baudrate, timeout), ports))
+    return [s for s in found if s is not None]
+
+
+def cachedPort():
+
+    """ :returns:
+            The port a board was last found on, or None
+    """
+
+    try:
+        with open(PORT_CACHE) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def rememberPort(port):
+    try:
+        with open(PORT_CACHE, 'w') as f:
+            f.write(port)
+    except OSError:
+        pass
+
+
+def findBoard(platform,baudrate=115200):
+
+    """ Connects to the board, trying the port it was last found on before
+        listing and probing every port of the platform
+        :returns:
+            A serial.Serial instance for the board, or None
+    """
+
+    port = cachedPort()
+    if port:
+        s = probePort(port, baudrate)
+        if s is not None:
+            return s
+    return openPort(listPorts(platform), baudrate)
         
 
 def listPorts(platform):
 
-    """ Lists ports for specific platform
+    """ Lists ports for specific platform, checking them concurrently
         :returns:
             A list of ports (strings)
 
@@ -42,26 +162,26 @@ def listPorts(platform):
         ports = glob.glob('/dev/tty.*')
     else:
         raise EnvironmentError('Unsuported Platform')
-    
-    portList = []
-    for port in ports:
+
+    def available(port):
         try: 
-            s = serial.Serial(port,baudrate=115200,timeout=1)
+            s = serial.Serial(port,baudrate=115200,timeout=0)
             s.close()
-            portList.append(port)
+            return True
         except (OSError, serial.SerialException):
-            pass
-    
-    return portList
+            return False
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        return [port for port, ok in zip(ports, pool.map(available, ports)) if ok]
 
 def convertDigital(data, max=3):
 
-    data_converted = int(data*(max))
+    data_converted = data*(max)
     return data_converted
 
 
 def convertAnalog(data, max=3, min=0, bitnum=12): 
-    data_converted = float(data*(max-min)/(2**bitnum))
+    data_converted = data*(max-min)/(2**bitnum)
     return data_converted
 
 
@@ -83,27 +203,375 @@ def unframeData(frame,channel=1,digital=False):
             return (frame[1] & 0x40) >> 6
 
 
-def synchronize(dataSerial):
-    """ Synchronize data received from serial port
+def countDiscarded(stats, discarded):
+
+    """ Accounts a run of corrupt bytes dropped while resynchronizing
+        into stats (a dict), if given
     """
+
+    if stats is None or discarded == 0:
+        return
+    stats['syncLosses'] = stats.get('syncLosses', 0) + 1
+    stats['bytesDiscarded'] = stats.get('bytesDiscarded', 0) + discarded
+    stats['framesDiscarded'] = stats.get('framesDiscarded', 0) + -(-discarded // FRAME_SIZE)
+
+
+def countGap(gaps, pieces, discarded):
+
+    """ Lists a run of corrupt bytes into gaps (a list), if given, at the
+        number of frames unframed before it
+    """
+
+    if gaps is not None and discarded:
+        gaps.append((sum(len(piece) for piece in pieces), -(-discarded // FRAME_SIZE)))
+
+
+def isFrameStart(frame):
+
+    """ Checks the frame start bits (bit 7 is 0,1,1,1) of the bytes given,
+        which may be a partial frame
+    """
+
+    return all((b >> 7) == (i != 0) for i, b in enumerate(frame[:FRAME_SIZE]))
+
+
+def frameStarts(data):
+
+    """ Finds every position of a buffered chunk where a complete valid
+        frame starts, in one vectorized pass
+        :returns:
+            A sorted array of byte indexes
+    """
+
+    bit7 = np.frombuffer(data, dtype=np.uint8) >> 7
+    n = len(bit7) - FRAME_SIZE + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.intp)
+    found = (bit7[:n] == 0) & (bit7[1:n + 1] == 1) & (bit7[2:n + 2] == 1) & (bit7[3:] == 1)
+    return np.flatnonzero(found)
+
+
+def synchronize(dataSerial, frame=b'', stats=None):
+    """ Synchronize data received from serial port. Starting from the
+        bytes of a bad frame already read (if any), drops corrupt bytes
+        until a valid frame start shows up, never reading past that frame
+        :returns:
+            The first valid frame (4 bytes), or None if a read timed out
+            (the port's timeout) before one was complete
+    """
+    discarded = 0
     while(True):
-        b = dataSerial.read(1)
-        if ((b[0] & 0x8f) >> 7 ) == 0x00:
-            garbage = dataSerial.read(3)
-            break
+        #drop leading bytes until what is left could still be a frame start
+        while not isFrameStart(frame):
+            frame = frame[1:]
+            discarded += 1
+        if len(frame) == FRAME_SIZE:
+            countDiscarded(stats, discarded)
+            return frame
+        data = dataSerial.read(FRAME_SIZE - len(frame))
+        if not data: #nothing arrived, the board may be gone
+            countDiscarded(stats, discarded)
+            return None
+        frame += data
+
+def receiveData(dataSerial, stats=None):
+
+    """ Reads one frame, resynchronizing if it is corrupt
+        :returns:
+            A tuple (channelA1, channelA2, channelD1, channelD2) of one
+            sample, or None if no frame arrived within the port's timeout
+    """
 
-def receiveData(dataSerial):
-    
     frames = dataSerial.read(4)
-    if ((frames[0] & 0x8f) >> 7) == 0 and ((frames[1] & 0x8f) >> 7) == 1 and ((frames[2] & 0x8f) >> 7) == 1 and ((frames[3] & 0x8f) >> 7) == 1 : 
-        channelA1 = unframeData(frames)
-        channelA2 = unframeData(frames,2)
-        channelD1 = unframeData(frames,1,True)
-        channelD2 = unframeData(frames,2,True)
+    if len(frames) != FRAME_SIZE or not isFrameStart(frames):
+        #resync and use the next good frame instead of a fabricated sample
+        frames = synchronize(dataSerial, frames, stats)
+        if frames is None:
+            return None
+
+    channelA1 = unframeData(frames)
+    channelA2 = unframeData(frames,2)
+    channelD1 = unframeData(frames,1,True)
+    channelD2 = unframeData(frames,2,True)
+
+    return channelA1,channelA2,channelD1,channelD2
+
+
+def unframeBlock(data, stats=None, gaps=None):
+
+    """ Unframe every complete frame contained in a chunk of data
+        received from serial port. Frame start bits are validated for
+        the whole chunk at once; where they fail the chunk is scanned for
+        the next valid frame start and only the corrupt bytes in between
+        are dropped (and accounted in stats, a dict, if given). If gaps
+        (a list) is given, a tuple (position, frames) is appended to it
+        for every run of dropped bytes, position being the index of the
+        first sample after it.
+        :returns:
+            A tuple (channelA1, channelA2, channelD1, channelD2, remainder)
+            where analog channels are uint16 arrays, digital channels are
+            uint8 arrays and remainder holds the bytes of a trailing
+            incomplete frame
+    """
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    #whole frame as one little endian word: trama[0] is the lowest byte
+    n = len(buf) // FRAME_SIZE * FRAME_SIZE
+    words = buf[:n].view('<u4')
+    valid = (words & FRAME_SYNC_MASK) == FRAME_SYNC_BITS
+
+    if not valid.all():
+        #desynced: find every valid frame start once, then hop between runs
+        starts = frameStarts(buf)
+        last = len(buf) - FRAME_SIZE #last byte a complete frame can start at
+        isStart = np.zeros(len(buf), dtype=bool)
+        isStart[starts] = True
+        #for each alignment, the frame positions that fail the start bits
+        broken = [np.flatnonzero(~isStart[r:last + 1:FRAME_SIZE])*FRAME_SIZE + r
+                  for r in range(FRAME_SIZE)]
+
+        good = int(np.argmin(valid))
+        pieces = [np.arange(0, good*FRAME_SIZE, FRAME_SIZE)]
+        pos = good*FRAME_SIZE
+
+        while True:
+            following = np.searchsorted(starts, pos + 1)
+            if following == len(starts):
+                #keep a trailing partial frame only if it still looks like one
+                nxt = len(buf)
+                for i in range(max(pos + 1, last + 1), len(buf)):
+                    if isFrameStart(buf[i:]):
+                        nxt = i
+                        break
+                countDiscarded(stats, nxt - pos)
+                countGap(gaps, pieces, nxt - pos)
+                pos = nxt
+                break
+            nxt = int(starts[following])
+            countDiscarded(stats, nxt - pos)
+            countGap(gaps, pieces, nxt - pos)
+            pos = nxt
+
+            #frames stay aligned from here until the first one failing
+            fails = broken[pos % FRAME_SIZE]
+            k = np.searchsorted(fails, pos)
+            end = int(fails[k]) if k < len(fails) else pos + ((last - pos)//FRAME_SIZE + 1)*FRAME_SIZE
+            pieces.append(np.arange(pos, end, FRAME_SIZE))
+            pos = end
+            if pos > last:
+                break
+
+        frames = np.concatenate(pieces)
+        index = frames[:, None] + np.arange(FRAME_SIZE)
+        words = buf[index].copy().view('<u4').ravel()
+    else:
+        pos = n
+
+    remainder = buf[pos:].tobytes()
+
+    channelA1 = (((words & 0x3f) << 6) | ((words >> 8) & 0x3f)).astype(np.uint16)
+    channelA2 = (((words >> 10) & 0xfc0) | ((words >> 24) & 0x3f)).astype(np.uint16)
+    channelD1 = ((words >> 6) & 0x01).astype(np.uint8)
+    channelD2 = ((words >> 14) & 0x01).astype(np.uint8)
+
+    return channelA1, channelA2, channelD1, channelD2, remainder
+
+
+def frameBlock(channelA1, channelA2, channelD1, channelD2):
+
+    """ Frame blocks of samples exactly as the DEMOQE firmware does
+        (BOB/Sources/main.c), inverse of unframeBlock
+        :returns:
+            A bytes object holding one 4 byte frame per sample
+    """
+
+    channelA1 = np.asarray(channelA1, dtype=np.uint32) & 0xfff
+    channelA2 = np.asarray(channelA2, dtype=np.uint32) & 0xfff
+    channelD1 = np.asarray(channelD1, dtype=np.uint32) & 0x01
+    channelD2 = np.asarray(channelD2, dtype=np.uint32) & 0x01
+
+    words = ((channelA1 >> 6) | (channelD1 << 6)                    #trama[0]
+             | ((channelA1 & 0x3f) | 0x80 | (channelD2 << 6)) << 8   #trama[1]
+             | ((channelA2 >> 6) | 0x80) << 16                       #trama[2]
+             | ((channelA2 & 0x3f) | 0x80) << 24)                    #trama[3]
+    return words.astype('<u4').tobytes()
+
+
+def negotiate(dataSerial, protocol='blocks', baudrate=115200, timeout=0.5):
+
+    """ Asks the board to switch to a protocol (one of PROTOCOLS) and baud
+        rate (one of BAUDRATES), following it on the host side once it
+        acknowledges. Firmware without block support ignores the request
+        and keeps sending 4 byte frames at 115200 baud
+        :returns:
+            True if the board switched, False otherwise
+    """
+
+    command = bytes((COMMAND, PROTOCOLS.index(protocol), BAUDRATES.index(baudrate)))
+    ack = COMMAND_ACK + command[1:]
+    dataSerial.reset_input_buffer()
+    dataSerial.write(command)
+
+    received = b''
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        received += dataSerial.read(max(getattr(dataSerial, 'in_waiting', 0), 1))
+        if ack in received:
+            dataSerial.baudrate = baudrate
+            dataSerial.reset_input_buffer() #bytes sent while switching are garbage
+            return True
+        received = received[-(len(ack) - 1):]
+    return False
+
+
+def countStats(stats, **counts):
+
+    """ Adds counts to the keys of stats (a dict), if given
+    """
+
+    if stats is None:
+        return
+    for key, n in counts.items():
+        stats[key] = stats.get(key, 0) + n
+
+
+def fletcher16(data):
+
+    """ Fletcher-16 checksum of a uint8 array, as computed by the firmware
+        :returns:
+            An int, sum2 << 8 | sum1
+    """
+
+    data = np.asarray(data, dtype=np.int64)
+    weights = np.arange(len(data), 0, -1) #byte i is added to sum2 once per byte from i on
+    return int((data*weights).sum() % 255) << 8 | int(data.sum() % 255)
+
+
+def blockLength(count):
+    return BLOCK_HEADER + 3*count + 2*((count + 7)//8) + 2
+
+
+def packBlock(sequence, channelA1, channelA2, channelD1, channelD2):
+
+    """ Packs samples into one block exactly as the firmware does in
+        block mode, inverse of BlockDecoder
+        :returns:
+            The bytes of the block
+    """
+
+    channelA1 = np.asarray(channelA1, dtype=np.uint16) & 0xfff
+    channelA2 = np.asarray(channelA2, dtype=np.uint16) & 0xfff
+    pairs = np.empty((len(channelA1), 3), dtype=np.uint8)
+    pairs[:, 0] = channelA1 & 0xff
+    pairs[:, 1] = (channelA1 >> 8) | (channelA2 & 0x0f) << 4
+    pairs[:, 2] = channelA2 >> 4
+
+    body = b''.join((struct.pack('<HB', sequence & 0xffff, len(channelA1)), pairs.tobytes(),
+                     np.packbits(np.asarray(channelD1, dtype=np.uint8) & 1, bitorder='little').tobytes(),
+                     np.packbits(np.asarray(channelD2, dtype=np.uint8) & 1, bitorder='little').tobytes()))
+    return BLOCK_MAGIC + body + struct.pack('<H', fletcher16(np.frombuffer(body, dtype=np.uint8)))
+
+
+class FrameDecoder:
+    """ Decoder of the 4 byte frame protocol, unframeBlock keeping the
+        trailing incomplete frame of a chunk for the next one. ``gaps``
+        tells where frames were dropped in the last decoded chunk, see
+        unframeBlock
+    """
+
+    def __init__(self):
+        self.remainder = b''
+        self.gaps = []
+
+    def decode(self, data, stats=None):
+
+        """ :returns:
+                A tuple (channelA1, channelA2, channelD1, channelD2) of the
+                samples completed by data, like unframeBlock
+        """
+
+        self.gaps = []
+        channelA1, channelA2, channelD1, channelD2, self.remainder = unframeBlock(self.remainder + data, stats,
+                                                                                  self.gaps)
+        return channelA1, channelA2, channelD1, channelD2
+
+
+class BlockDecoder:
+    """ Decoder of the block protocol.
+
+        Blocks are found by their magic and only kept if their checksum
+        matches, so corrupt bytes cost at most the block they hit. The
+        sequence number tells exactly how many blocks went missing in
+        between, which are accounted in stats as blocksLost and their
+        samples as framesDiscarded, like dropped frames, and listed in
+        ``gaps`` like FrameDecoder's.
+    """
+
+    def __init__(self):
+        self.remainder = b''
+        self.gaps = []
+        self.sequence = None #expected sequence number of the next block
+
+    def decode(self, data, stats=None):
+
+        """ :returns:
+                A tuple (channelA1, channelA2, channelD1, channelD2) of the
+                samples of every complete block, like unframeBlock
+        """
+
+        buf = self.remainder + data
+        view = np.frombuffer(buf, dtype=np.uint8)
+        pairs, bits = [], []
+        self.gaps = []
+        pos = clean = 0 #scan position, end of the last good block
+
+        while True:
+            start = buf.find(BLOCK_MAGIC, pos)
+            if start < 0:
+                #a trailing first magic byte may start the next block
+                pos = max(clean, len(buf) - 1) if buf.endswith(BLOCK_MAGIC[:1]) else len(buf)
+                break
+            if len(buf) - start < BLOCK_HEADER:
+                pos = start
+                break
+            sequence, count = struct.unpack_from('<HB', buf, start + 2)
+            end = start + blockLength(count)
+            if end > len(buf):
+                pos = start
+                break
+            if fletcher16(view[start + 2:end - 2]) != struct.unpack_from('<H', buf, end - 2)[0]:
+                countStats(stats, checksumErrors=1)
+                pos = start + 1
+                continue
+
+            if start > clean:
+                countStats(stats, syncLosses=1, bytesDiscarded=start - clean)
+            if self.sequence is not None and sequence != self.sequence:
+                lost = (sequence - self.sequence) & 0xffff
+                countStats(stats, blocksLost=lost, framesDiscarded=lost*count)
+                self.gaps.append((sum(count for d1, d2, count in bits), lost*count))
+            self.sequence = (sequence + 1) & 0xffff
+            countStats(stats, blocksReceived=1)
+
+            packed = (count + 7)//8
+            first = start + BLOCK_HEADER + 3*count
+            pairs.append(view[start + BLOCK_HEADER:first])
+            bits.append((view[first:first + packed], view[first + packed:first + 2*packed], count))
+            pos = clean = end
+
+        if pos > clean:
+            countStats(stats, syncLosses=1, bytesDiscarded=pos - clean)
+        self.remainder = buf[pos:]
 
-        return channelA1,channelA2,channelD1,channelD2
-    else: 
-        synchronize(dataSerial)
-        return 0,0,0,0
+        if not pairs:
+            return (np.zeros(0, dtype=np.uint16), np.zeros(0, dtype=np.uint16),
+                    np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=np.uint8))
+        pairs = np.concatenate(pairs).reshape(-1, 3).astype(np.uint16)
+        channelA1 = pairs[:, 0] | (pairs[:, 1] & 0x0f) << 8
+        channelA2 = pairs[:, 1] >> 4 | pairs[:, 2] << 4
+        channelD1 = np.concatenate([np.unpackbits(d1, count=count, bitorder='little') for d1, d2, count in bits])
+        channelD2 = np.concatenate([np.unpackbits(d2, count=count, bitorder='little') for d1, d2, count in bits])
+        return channelA1, channelA2, channelD1, channelD2
 
 
+DECODERS = {'frames': FrameDecoder, 'blocks': BlockDecoder}
@@ -0,0 +1,133 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : decimation.py
+## Description  : Min/max reduction of sample
+## windows to screen resolution
+#################################################
+
+import numpy as np
+
+
+def minMax(data, size):
+
+    """ Per bucket min and max of data split in buckets of size samples
+        (data length must be a multiple of size)
+        :returns:
+            A tuple (lowAt, low, highAt, high) with the position within
+            data and the value of every bucket's minimum and maximum
+    """
+
+    buckets = data.reshape(-1, size)
+    offsets = np.arange(0, len(data), size)
+    lowAt = buckets.argmin(axis=1) + offsets
+    highAt = buckets.argmax(axis=1) + offsets
+    return lowAt, data[lowAt], highAt, data[highAt]
+
+
+class Decimator:
+    """ Reduces a window of samples to about two points per pixel.
+
+        Each pixel column gets a bucket of samples and is drawn as the
+        bucket's minimum and maximum, in the order they occurred, so
+        glitches and peaks narrower than a pixel stay visible. Buckets
+        are aligned to absolute sample numbers: when the window just
+        slides forward by newly arrived samples, the buckets computed
+        on previous frames are reused and only the new ones are scanned.
+    """
+
+    def __init__(self):
+        self.size = 0 #samples per bucket of the cached summaries
+        self.first = 0 #absolute bucket number of the first cached summary
+        self.cache = None #lowAt, low, highAt, high in absolute positions
+
+    def decimate(self, data, pixels, start=None):
+
+        """ data is the window to draw and start the absolute number of its
+            first sample (None if unknown, then nothing is cached)
+            :returns:
+                A tuple (indexes, values) of the points to draw, indexes
+                being positions within data
+        """
+
+        size = len(data)//max(1, int(pixels))
+        if size < 2:
+            return np.arange(len(data)), data
+        if start is None:
+            self.cache = None
+            start = 0
+            cacheable = False
+        else:
+            cacheable = True
+
+        stop = start + len(data)
+        firstBucket = -(-start//size)
+        lastBucket = stop//size
+        if self.cache is None or size != self.size or not cacheable:
+            self.cache, self.first, self.size = None, firstBucket, size
+
+        #reuse cached buckets still in the window, scan only those after them
+        if self.cache is not None and self.first <= firstBucket <= self.first + len(self.cache[0]):
+            keep = slice(firstBucket - self.first, lastBucket - self.first)
+            kept = [part[keep] for part in self.cache]
+            scanFrom = self.first + len(self.cache[0])
+        else:
+            kept = [np.zeros(0, dtype=np.intp), data[:0], np.zeros(0, dtype=np.intp), data[:0]]
+            scanFrom = firstBucket
+        scanFrom = max(scanFrom, firstBucket)
+        if lastBucket > scanFrom:
+            lowAt, low, highAt, high = minMax(data[scanFrom*size - start:lastBucket*size - start], size)
+            shift = scanFrom*size
+            kept = [np.concatenate((kept[0], lowAt + shift)), np.concatenate((kept[1], low)),
+                    np.concatenate((kept[2], highAt + shift)), np.concatenate((kept[3], high))]
+        if cacheable:
+            self.cache, self.first = kept, firstBucket
+
+        #partial buckets at both ends are summarized on the fly
+        lowAt, low, highAt, high = kept
+        lowAt, highAt = lowAt - start, highAt - start
+        pieces = []
+        head, tail = data[:firstBucket*size - start], data[lastBucket*size - start:]
+        if len(head):
+            pieces.append(minMax(head, len(head)))
+        pieces.append((lowAt, low, highAt, high))
+        if len(tail):
+            at = lastBucket*size - start
+            lo, l, hi, h = minMax(tail, len(tail))
+            pieces.append((lo + at, l, hi + at, h))
+        lowAt, low, highAt, high = [np.concatenate(part) for part in zip(*pieces)]
+
+        #two points per bucket, in time order
+        first = lowAt <= highAt
+        indexes = np.empty(2*len(lowAt), dtype=np.intp)
+        values = np.empty(2*len(lowAt), dtype=data.dtype)
+        indexes[0::2] = np.where(first, lowAt, highAt)
+        indexes[1::2] = np.where(first, highAt, lowAt)
+        values[0::2] = np.where(first, low, high)
+        values[1::2] = np.where(first, high, low)
+        return indexes, values
+
+
+def envelope(indexes, values):
+
+    """ Outline of the band covered by decimated min/max pairs. A signal
+        swinging inside most buckets (noise, fast clocks) turns into a
+        zigzag line retracing the same pixels over and over, which is far
+        slower to rasterize than one filled polygon covering them
+        :returns:
+            A tuple (indexes, values) of the polygon vertices, bucket
+            maxima forward then bucket minima backward, or None when the
+            plain line is the cheaper one to draw
+    """
+
+    high = np.maximum(values[0::2], values[1::2]).astype(np.int32)
+    low = np.minimum(values[0::2], values[1::2]).astype(np.int32)
+    zigzag = np.abs(np.diff(values.astype(np.int32))).sum()
+    outline = np.abs(np.diff(high)).sum() + np.abs(np.diff(low)).sum()
+    if zigzag < 4*outline:
+        return None
+
+    at = indexes[0::2]
+    return np.concatenate((at, at[::-1])), np.concatenate((high, low[::-1])).astype(values.dtype)
@@ -0,0 +1,275 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : dsp.py
+## Description  : Streaming filters, decimation and
+## math channels over blocks of samples
+#################################################
+
+""" Every stage here takes whole blocks and keeps the state it needs
+    between them, so a signal processed block by block comes out exactly
+    as if it had been processed in one go: no edge artifacts where
+    blocks meet.
+
+    Filters are given as specs like the emulator's waveforms:
+    "lowpass:F[:Q]", "highpass:F[:Q]", "bandpass:F[:Q]", "notch:F[:Q]"
+    (second order IIR sections) or "fir:F[:TAPS]" (windowed sinc
+    lowpass), F in Hz.
+"""
+
+import ast
+
+import numpy as np
+
+from buffers import ChannelStore
+from com import SAMPLE_RATE, convertAnalog
+
+
+class FirFilter:
+    """ FIR filter, the last len(taps) - 1 inputs are carried over to
+        the next block
+    """
+
+    def __init__(self, taps):
+        self.taps = np.asarray(taps, dtype=np.float64)
+        self.reset()
+
+    def reset(self):
+        self.state = np.zeros(len(self.taps) - 1)
+
+    def process(self, block):
+
+        """ :returns:
+                The filtered block, as many samples as block
+        """
+
+        if len(block) == 0: #the state alone would still give one output
+            return np.zeros(0)
+        data = np.concatenate((self.state, block))
+        self.state = data[len(data) - len(self.state):]
+        return np.convolve(data, self.taps, mode='valid')
+
+
+class IirFilter:
+    """ IIR filter with coefficients b, a (a[0] normalizes), run as a
+        state space system (transposed direct form II) chunk samples at
+        a time.
+
+        Within a chunk the output is the chunk times a precomputed lower
+        triangular matrix of the impulse response plus the response to
+        the state left by the previous chunk, so the recursion costs two
+        matrix products per chunk instead of a Python loop per sample,
+        and is exact (no truncated impulse response).
+    """
+
+    def __init__(self, b, a, chunk=256):
+        b = np.asarray(b, dtype=np.float64)/a[0]
+        a = np.asarray(a, dtype=np.float64)/a[0]
+        order = max(len(a), len(b)) - 1
+        b = np.pad(b, (0, order + 1 - len(b)))
+        a = np.pad(a, (0, order + 1 - len(a)))
+        self.chunk = chunk
+
+        A = np.zeros((order, order))
+        A[:, 0] = -a[1:]
+        A[:-1, 1:] = np.eye(order - 1)
+        B = b[1:] - a[1:]*b[0]
+        powers = np.empty((chunk + 1, order, order)) #A^j
+        powers[0] = np.eye(order)
+        for j in range(1, chunk + 1):
+            powers[j] = A @ powers[j - 1]
+
+        response = np.concatenate(([b[0]], powers[:chunk - 1, 0] @ B)) #impulse response, C = e0
+        lag = np.arange(chunk)[:, None] - np.arange(chunk)[None, :]
+        self.toeplitz = np.where(lag >= 0, response[np.clip(lag, 0, None)], 0.0)
+        self.observe = powers[:chunk, 0] #output due to the state, n samples later
+        self.powers = powers
+        self.inputs = powers[chunk - 1::-1] @ B #effect of input k on the state after the chunk
+        self.reset()
+
+    def reset(self):
+        self.state = np.zeros(self.powers.shape[1])
+
+    def process(self, block):
+
+        """ :returns:
+                The filtered block, as many samples as block
+        """
+
+        data = np.asarray(block, dtype=np.float64)
+        out = np.empty(len(data))
+        for first in range(0, len(data), self.chunk):
+            piece = data[first:first + self.chunk]
+            m = len(piece)
+            out[first:first + m] = self.toeplitz[:m, :m] @ piece + self.observe[:m] @ self.state
+            self.state = self.powers[m] @ self.state + piece @ self.inputs[self.chunk - m:]
+        return out
+
+
+def biquad(kind, frequency, rate=SAMPLE_RATE, q=np.sqrt(0.5)):
+
+    """ Second order section from the RBJ audio EQ cookbook
+        :returns:
+            An IirFilter
+    """
+
+    w = 2*np.pi*frequency/rate
+    alpha = np.sin(w)/(2*q)
+    cos = np.cos(w)
+    if kind == 'lowpass':
+        b = [(1 - cos)/2, 1 - cos, (1 - cos)/2]
+    elif kind == 'highpass':
+        b = [(1 + cos)/2, -(1 + cos), (1 + cos)/2]
+    elif kind == 'bandpass':
+        b = [alpha, 0, -alpha]
+    elif kind == 'notch':
+        b = [1, -2*cos, 1]
+    else:
+        raise ValueError('Unknown filter %s' % kind)
+    return IirFilter(b, [1 + alpha, -2*cos, 1 - alpha])
+
+
+def windowedSinc(frequency, rate=SAMPLE_RATE, taps=63):
+
+    """ Lowpass FIR taps (Hamming windowed sinc) with unity gain at DC
+        :returns:
+            A float array of taps
+    """
+
+    n = np.arange(taps) - (taps - 1)/2
+    taps = np.sinc(2*frequency/rate*n)*np.hamming(taps)
+    return taps/taps.sum()
+
+
+def makeFilter(spec, rate=SAMPLE_RATE):
+
+    """ Builds a filter from a spec (see the module docstring)
+        :returns:
+            A FirFilter or IirFilter
+    """
+
+    kind, *args = spec.split(':')
+    if not args:
+        raise ValueError('Filter %s needs a frequency' % spec)
+    frequency = float(args[0])
+    if not 0 < frequency < rate/2:
+        raise ValueError('Filter frequency must be between 0 and %g Hz' % (rate/2))
+    if kind == 'fir':
+        return FirFilter(windowedSinc(frequency, rate, int(args[1]) if len(args) > 1 else 63))
+    return biquad(kind, frequency, rate, *[float(arg) for arg in args[1:2]])
+
+
+class Downsampler:
+    """ Keeps one sample out of factor after an anti-aliasing FIR
+        lowpass, picking up where the previous block left off
+    """
+
+    def __init__(self, factor, rate=SAMPLE_RATE):
+        self.factor = factor
+        self.filter = FirFilter(windowedSinc(0.4*rate/factor, rate, 8*factor + 1))
+        self.reset()
+
+    def reset(self):
+        self.filter.reset()
+        self.phase = 0 #position in the next block of the next sample kept
+
+    def process(self, block):
+        data = self.filter.process(block)
+        out = data[self.phase::self.factor]
+        self.phase = (self.phase - len(data)) % self.factor
+        return out
+
+
+#what math expressions may use
+CHANNELS = ('a1', 'a2', 'd1', 'd2')
+FUNCTIONS = {'abs': np.abs, 'sqrt': np.sqrt, 'exp': np.exp, 'log': np.log, 'log10': np.log10,
+             'sin': np.sin, 'cos': np.cos, 'minimum': np.minimum, 'maximum': np.maximum}
+CONSTANTS = {'pi': np.pi}
+OPERATORS = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load, ast.Constant,
+             ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod, ast.USub, ast.UAdd)
+
+
+class MathChannel:
+    """ Channel computed from the others by a vectorized expression, e.g.
+        "a1 - a2" or "a1*a2". Analog channels are in volts, digital ones
+        0/1; numbers, pi, + - * / ** % and the FUNCTIONS are allowed.
+        The expression is checked once and evaluated once per block
+    """
+
+    def __init__(self, expression):
+        tree = ast.parse(expression, mode='eval')
+        for node in ast.walk(tree):
+            if not isinstance(node, OPERATORS):
+                raise ValueError('%s is not allowed in math channels' % type(node).__name__)
+            if isinstance(node, ast.Name) and node.id not in CHANNELS + tuple(FUNCTIONS) + tuple(CONSTANTS):
+                raise ValueError('Unknown name %s' % node.id)
+            if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS):
+                raise ValueError('Only %s can be called' % ', '.join(FUNCTIONS))
+            if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+                raise ValueError('Only numbers are allowed as constants')
+        self.expression = expression
+        self.code = compile(tree, '<math channel>', 'eval')
+        self.uses = [i for i, name in enumerate(CHANNELS)
+                     if any(isinstance(node, ast.Name) and node.id == name for node in ast.walk(tree))]
+
+    def evaluate(self, block):
+
+        """ :returns:
+                A float array, one value per sample of block
+        """
+
+        names = dict(FUNCTIONS, **CONSTANTS)
+        for i in self.uses: #only the channels the expression needs are converted
+            names[CHANNELS[i]] = convertAnalog(block[i].astype(np.float64)) if i < 2 else block[i].astype(np.float64)
+        with np.errstate(all='ignore'): #e.g. log(0) gives -inf like on a scope, not an exception
+            values = eval(self.code, {'__builtins__': {}}, names)
+        return np.broadcast_to(np.asarray(values, dtype=np.float64), (len(block[0]),)).copy()
+
+
+class MathStage:
+    """ One derived channel: a math expression over the channels, then a
+        chain of filters, then optional decimation by factor. Output is
+        kept in a history of depth samples at rate/factor samples/s.
+
+        It is only computed while fed, i.e. while its output is shown or
+        recorded; reset() starts it over after a pause. feed/result make
+        it usable as a pipeline stage too
+    """
+
+    def __init__(self, expression='a1', filters=(), factor=1, rate=SAMPLE_RATE, depth=SAMPLE_RATE):
+        if factor < 1:
+            raise ValueError('Decimation factor must be at least 1')
+        self.math = MathChannel(expression)
+        self.filters = [makeFilter(spec, rate) if isinstance(spec, str) else spec for spec in filters]
+        self.downsampler = Downsampler(factor, rate) if factor > 1 else None
+        self.factor = factor
+        self.rate = rate/factor
+        self.history = ChannelStore(depth, np.float64)
+
+    def reset(self):
+        for stage in self.filters + [self.downsampler]:
+            if stage is not None:
+                stage.reset()
+        self.history = ChannelStore(self.history.capacity, np.float64)
+
+    def process(self, block):
+
+        """ :returns:
+                The output for a block of samples (tuple of the four
+                channels), len(block[0])/factor values
+        """
+
+        data = self.math.evaluate(block)
+        for stage in self.filters:
+            data = stage.process(data)
+        if self.downsampler is not None:
+            data = self.downsampler.process(data)
+        return data
+
+    def feed(self, block):
+        self.history.append(self.process(block))
+
+    def result(self):
+        return self.history.last(len(self.history)).copy()
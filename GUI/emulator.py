@@ -0,0 +1,225 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : emulator.py
+## Description  : Virtual DEMOQE board serving
+## frames over a pseudo-terminal
+#################################################
+
+import argparse
+import os
+import threading
+import time
+import tty
+
+import numpy as np
+
+from com import BAUDRATES, BLOCK_SAMPLES, COMMAND, COMMAND_ACK, PROTOCOLS, SAMPLE_RATE, convertAnalog, frameBlock, packBlock
+
+
+def analogWave(spec, t):
+
+    """ Generates 12 bit ADC codes for a waveform spec
+        "kind[:frequency[:amplitude[:offset]]]" (Hz and volts), kind being
+        one of sine, square, triangle, sawtooth, noise or dc
+        :returns:
+            A uint16 array, one code per time in t
+    """
+
+    kind, *args = spec.split(':')
+    frequency, amplitude, offset = [float(a) for a in args] + [50.0, 1.5, 1.5][len(args):]
+    phase = (t*frequency) % 1.0
+
+    if kind == 'sine':
+        wave = np.sin(2*np.pi*phase)
+    elif kind == 'square':
+        wave = np.where(phase < 0.5, 1.0, -1.0)
+    elif kind == 'triangle':
+        wave = 4*np.abs(phase - 0.5) - 1
+    elif kind == 'sawtooth':
+        wave = 2*phase - 1
+    elif kind == 'noise':
+        wave = np.random.uniform(-1, 1, len(t))
+    elif kind == 'dc':
+        wave = np.zeros(len(t))
+    else:
+        raise ValueError('Unknown waveform %s' % kind)
+
+    volts = offset + amplitude*wave
+    return np.clip(np.round(volts/convertAnalog(1)), 0, 4095).astype(np.uint16)
+
+
+def digitalPattern(spec, t, n):
+
+    """ Generates PTA6/PTA7 levels for a pattern spec: "low", "high",
+        "square:frequency", "random" or "bits:0110..." (one bit per sample,
+        repeated). n is the number of the first sample
+        :returns:
+            A uint8 array of 0/1, one level per time in t
+    """
+
+    kind, _, arg = spec.partition(':')
+
+    if kind == 'low':
+        return np.zeros(len(t), dtype=np.uint8)
+    elif kind == 'high':
+        return np.ones(len(t), dtype=np.uint8)
+    elif kind == 'square':
+        return ((t*float(arg or 100)) % 1.0 < 0.5).astype(np.uint8)
+    elif kind == 'random':
+        return np.random.randint(0, 2, len(t)).astype(np.uint8)
+    elif kind == 'bits':
+        bits = np.array([int(b) for b in arg], dtype=np.uint8)
+        return bits[np.arange(n, n + len(t)) % len(bits)]
+    raise ValueError('Unknown digital pattern %s' % kind)
+
+
+def corrupt(data, probability, rng=np.random):
+
+    """ Injects byte errors like a noisy cable: each byte is, with the
+        given probability, flipped, dropped or followed by a stray byte
+        :returns:
+            The corrupted bytes
+    """
+
+    if probability <= 0:
+        return data
+    buf = np.frombuffer(data, dtype=np.uint8).copy()
+    hits = np.flatnonzero(rng.random_sample(len(buf)) < probability)
+    if len(hits) == 0:
+        return data
+    kinds = rng.randint(0, 3, len(hits))
+    buf[hits[kinds == 0]] ^= rng.randint(1, 256, np.count_nonzero(kinds == 0)).astype(np.uint8)
+    keep = np.ones(len(buf), dtype=bool)
+    keep[hits[kinds == 1]] = False
+    stray = hits[kinds == 2]
+    out = np.insert(buf, stray + 1, rng.randint(0, 256, len(stray)).astype(np.uint8))
+    keep = np.insert(keep, stray + 1, True)
+    return out[keep].tobytes()
+
+
+class Emulator(threading.Thread):
+    """ Software DEMOQE128 running the BOB firmware.
+
+        Frames are produced exactly like BOB/Sources/main.c (see
+        com.frameBlock) and written to the master side of a pseudo-terminal
+        at the requested sample rate; the slave side (``port``) can be
+        opened by com.openPort like the real board. Like a UART with
+        nobody reading, bytes that do not fit in the pty are lost. It
+        answers com.negotiate the way the firmware does, switching to
+        whole blocks of BLOCK_SAMPLES samples (the pty has no baud rate).
+    """
+
+    def __init__(self, rate=SAMPLE_RATE, channelA1='sine:50', channelA2='triangle:10',
+                 channelD1='square:100', channelD2='bits:1100', corruption=0.0, period=0.002):
+        super().__init__(daemon=True)
+        self.rate = rate
+        self.waves = (channelA1, channelA2, channelD1, channelD2)
+        self.corruption = corruption
+        self.period = period
+        self.samples = 0
+        self.bytesDropped = 0
+        self.startTime = None #perf_counter time of sample 0
+        self.protocol = 'frames' #as after a reset
+        self.sequence = 0 #number of the next block
+        self.received = b'' #command bytes read so far
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave) #no echo nor newline translation of frames
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+
+        self.running = threading.Event()
+        self.running.set()
+
+    def frames(self, n):
+
+        """ Next n samples framed as the firmware would send them
+        """
+
+        t = np.arange(self.samples, self.samples + n)/self.rate
+        channelA1 = analogWave(self.waves[0], t)
+        channelA2 = analogWave(self.waves[1], t)
+        channelD1 = digitalPattern(self.waves[2], t, self.samples)
+        channelD2 = digitalPattern(self.waves[3], t, self.samples)
+        self.samples += n
+        if self.protocol == 'frames':
+            return corrupt(frameBlock(channelA1, channelA2, channelD1, channelD2), self.corruption)
+
+        blocks = []
+        for first in range(0, n, BLOCK_SAMPLES):
+            piece = slice(first, first + BLOCK_SAMPLES)
+            blocks.append(packBlock(self.sequence, channelA1[piece], channelA2[piece],
+                                    channelD1[piece], channelD2[piece]))
+            self.sequence += 1
+        return corrupt(b''.join(blocks), self.corruption)
+
+    def command(self):
+
+        """ Reads what the host sent and answers complete negotiation
+            commands
+        """
+
+        try:
+            self.received += os.read(self.master, 64)
+        except (BlockingIOError, OSError):
+            return
+        while True:
+            start = self.received.find(bytes((COMMAND,)))
+            if start < 0 or len(self.received) - start < 3:
+                self.received = self.received[start:] if start >= 0 else b''
+                return
+            protocol, baudrate = self.received[start + 1:start + 3]
+            self.received = self.received[start + 3:]
+            if protocol < len(PROTOCOLS) and baudrate < len(BAUDRATES):
+                os.write(self.master, COMMAND_ACK + bytes((protocol, baudrate)))
+                self.protocol = PROTOCOLS[protocol]
+                self.sequence = 0
+
+    def run(self):
+        self.startTime = time.perf_counter()
+        while self.running.is_set():
+            self.command()
+            due = int((time.perf_counter() - self.startTime)*self.rate) - self.samples
+            if self.protocol == 'blocks':
+                due -= due % BLOCK_SAMPLES #the firmware only sends complete blocks
+            if due > 0:
+                data = self.frames(due)
+                try:
+                    sent = os.write(self.master, data)
+                except BlockingIOError:
+                    sent = 0
+                self.bytesDropped += len(data) - sent
+            time.sleep(self.period)
+
+    def stop(self):
+        self.running.clear()
+        self.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Virtual DEMOQE board on a pseudo-terminal')
+    parser.add_argument('--rate', type=float, default=SAMPLE_RATE, help='samples/s')
+    parser.add_argument('--a1', default='sine:50', help='channel 1 waveform')
+    parser.add_argument('--a2', default='triangle:10', help='channel 2 waveform')
+    parser.add_argument('--d1', default='square:100', help='channel 3 (PTA6) pattern')
+    parser.add_argument('--d2', default='bits:1100', help='channel 4 (PTA7) pattern')
+    parser.add_argument('--corrupt', type=float, default=0.0, help='per byte error probability')
+    args = parser.parse_args()
+
+    emulator = Emulator(args.rate, args.a1, args.a2, args.d1, args.d2, args.corrupt)
+    emulator.start()
+    print(emulator.port, flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        emulator.stop()
+
+
+if __name__ == '__main__':
+    main()
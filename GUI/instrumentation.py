@@ -0,0 +1,125 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : instrumentation.py
+## Description  : Stage timers and periodic stats
+## logging for acquisition and rendering
+#################################################
+
+import json
+import threading
+import time
+
+import numpy as np
+
+
+class Timer:
+    """ Durations of one stage: totals since the last reset plus the
+        last size values for percentiles
+    """
+
+    def __init__(self, size=256):
+        self.recent = np.zeros(size)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        self.recent[self.count % len(self.recent)] = duration
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def summary(self):
+
+        """ :returns:
+                A dict with count, mean (overall and of the recent values),
+                p95 and max in ms
+        """
+
+        recent = self.recent[:min(self.count, len(self.recent))]
+        return {'count': self.count,
+                'mean_ms': 1e3*self.total/self.count if self.count else 0.0,
+                'recent_ms': 1e3*float(recent.mean()) if len(recent) else 0.0,
+                'p95_ms': 1e3*float(np.percentile(recent, 95)) if len(recent) else 0.0,
+                'max_ms': 1e3*self.max}
+
+
+class Instruments:
+    """ Stage timers, switched off by default.
+
+        Code being measured calls start = clock() before a stage and
+        record(name, start) after it; while disabled clock() returns 0
+        and record() returns straight away, so instrumented code pays one
+        attribute check per call. tick(name) times the interval between
+        consecutive calls, e.g. between frames.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.timers = {}
+        self.ticks = {}
+
+    def clock(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def record(self, name, start):
+        if not self.enabled:
+            return
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = Timer()
+        timer.add(time.perf_counter() - start)
+
+    def tick(self, name):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        last = self.ticks.get(name)
+        self.ticks[name] = now
+        if last is not None:
+            self.record(name, last)
+
+    def reset(self):
+        self.timers = {}
+        self.ticks = {}
+
+    def snapshot(self):
+
+        """ :returns:
+                A dict with the summary of every timer
+        """
+
+        return {name: timer.summary() for name, timer in list(self.timers.items())}
+
+
+#shared by acquisition threads and canvases of this process
+INSTRUMENTS = Instruments()
+
+
+class StatsLogger(threading.Thread):
+    """ Appends a snapshot of some stats to a file every period seconds,
+        one JSON object per line with the time it was taken
+    """
+
+    def __init__(self, path, snapshot, period=1.0):
+        super().__init__(daemon=True)
+        self.path = path
+        self.snapshot = snapshot #callable returning a JSON serializable dict
+        self.period = period
+        self.running = threading.Event()
+        self.running.set()
+
+    def run(self):
+        with open(self.path, 'a') as f:
+            while self.running.is_set():
+                time.sleep(self.period)
+                entry = {'time': time.time()}
+                entry.update(self.snapshot())
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+
+    def stop(self):
+        self.running.clear()
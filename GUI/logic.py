@@ -0,0 +1,219 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : logic.py
+## Description  : Edge list storage and queries for
+## the digital channels (logic analyzer)
+#################################################
+
+import numpy as np
+
+
+class EdgeStore:
+    """ History of a digital channel kept as the sample numbers of its
+        edges instead of one level per sample.
+
+        D1/D2 are mostly constant, so the memory used grows with the
+        number of edges, not with the number of samples. Levels are 0/1
+        and alternate at every edge, so the level of any sample is the
+        first level flipped once per edge before it. With a depth only
+        the last depth samples are kept, otherwise everything is.
+    """
+
+    def __init__(self, depth=None):
+        self.depth = depth
+        self.edges = np.zeros(1024, dtype=np.int64)
+        self.first = 0 #index in edges of the oldest edge still held
+        self.count = 0 #edges stored in edges (held ones are first:count)
+        self.start = 0 #oldest sample held
+        self.initial = 0 #level of sample start
+        self.level = None #level of the newest sample
+        self.written = 0 #total samples ever appended
+
+    def __len__(self):
+        return self.written - self.start
+
+    @property
+    def nbytes(self):
+        return (self.count - self.first)*self.edges.itemsize
+
+    def held(self):
+
+        """ :returns:
+                A read only view of the sample numbers of every edge held
+        """
+
+        view = self.edges[self.first:self.count]
+        view.flags.writeable = False
+        return view
+
+    def append(self, block):
+
+        """ Appends a block of 0/1 samples
+        """
+
+        if len(block) == 0:
+            return
+        block = np.asarray(block)
+        if self.level is None:
+            self.initial = self.level = int(block[0])
+        changes = np.flatnonzero(block[1:] != block[:-1]) + 1
+        if block[0] != self.level:
+            changes = np.concatenate(([0], changes))
+        self._store(changes + self.written)
+        self.level = int(block[-1])
+        self.written += len(block)
+        if self.depth is not None and self.written - self.depth > self.start:
+            self.discard(self.written - self.depth)
+
+    def _store(self, changes):
+        if self.count + len(changes) > len(self.edges):
+            held = self.count - self.first
+            size = max(2*(held + len(changes)), 1024)
+            edges = np.zeros(size, dtype=np.int64)
+            edges[:held] = self.edges[self.first:self.count]
+            self.edges, self.first, self.count = edges, 0, held
+        self.edges[self.count:self.count + len(changes)] = changes
+        self.count += len(changes)
+
+    def discard(self, before):
+
+        """ Forgets every sample older than before
+        """
+
+        if before <= self.start:
+            return
+        dropped = int(np.searchsorted(self.held(), before, side='right'))
+        self.initial ^= dropped & 1
+        self.first += dropped
+        self.start = before
+
+    def levelAt(self, sample):
+
+        """ :returns:
+                The level (0/1) of a held sample
+        """
+
+        return self.initial ^ (int(np.searchsorted(self.held(), sample, side='right')) & 1)
+
+    def between(self, start, stop):
+
+        """ :returns:
+                Sample numbers of the edges at start <= sample < stop
+        """
+
+        held = self.held()
+        return held[np.searchsorted(held, start):np.searchsorted(held, stop)]
+
+    def nextEdge(self, sample):
+
+        """ :returns:
+                Sample number of the first edge after sample, or None
+        """
+
+        held = self.held()
+        i = np.searchsorted(held, sample, side='right')
+        return int(held[i]) if i < len(held) else None
+
+    def previousEdge(self, sample):
+
+        """ :returns:
+                Sample number of the last edge before sample, or None
+        """
+
+        held = self.held()
+        i = np.searchsorted(held, sample)
+        return int(held[i - 1]) if i > 0 else None
+
+    def levels(self, start, stop):
+
+        """ Expands samples start to stop back to one level per sample
+            :returns:
+                A uint8 array of 0/1
+        """
+
+        toggles = np.zeros(stop - start, dtype=np.uint8)
+        toggles[self.between(start + 1, stop) - start] = 1
+        return (np.cumsum(toggles, dtype=np.uint8) & 1) ^ self.levelAt(start)
+
+    def steps(self, start, stop):
+
+        """ Outline of samples start to stop as a step line ("steps-post"
+            drawstyle): one vertex per edge plus both ends
+            :returns:
+                A tuple (samples, levels) of the vertices
+        """
+
+        edges = self.between(start + 1, stop)
+        samples = np.concatenate(([start], edges, [stop - 1]))
+        levels = (np.arange(len(samples)) & 1) ^ self.levelAt(start)
+        levels[-1] = levels[-2] if len(levels) > 1 else levels[-1]
+        return samples, levels.astype(np.uint8)
+
+    def view(self, start, stop, pixels):
+
+        """ Samples start to stop reduced to about two points per pixel
+            like pyramid.MinMaxPyramid.view, from the edges only: a column
+            holds both levels if an edge falls inside it and the level at
+            its start otherwise
+            :returns:
+                A tuple (indexes, values), indexes being absolute sample
+                numbers
+        """
+
+        start, stop = max(self.start, start), min(stop, self.written)
+        pixels = max(1, int(pixels))
+        perPixel = (stop - start)/pixels
+        if perPixel < 2: #every sample
+            return np.arange(start, stop), self.levels(start, stop)
+
+        column = -(-(stop - start)//pixels) #at most one column per pixel, besides the partial ones
+        first = -(-start//column)*column #columns aligned to absolute sample numbers
+        at = np.concatenate(([start], np.arange(first + column*(first == start), stop, column)))
+        held = self.held()
+        after = np.searchsorted(held, at, side='right') #edges up to each column start
+        inside = np.searchsorted(held, np.append(at[1:], stop)) > after
+        levels = ((after & 1) ^ self.initial).astype(np.uint8)
+
+        indexes = np.repeat(at, 2)
+        values = np.empty(2*len(at), dtype=np.uint8)
+        values[0::2] = np.where(inside, 0, levels)
+        values[1::2] = np.where(inside, 1, levels)
+        return indexes, values
+
+    def runs(self, start=None, stop=None):
+
+        """ Runs of constant level between start and stop (whole held
+            history by default)
+            :returns:
+                A tuple (levels, lengths) of every run in order, the first
+                and last ones cut by start and stop
+        """
+
+        start = self.start if start is None else start
+        stop = self.written if stop is None else stop
+        bounds = np.concatenate(([start], self.between(start + 1, stop), [stop]))
+        levels = ((np.arange(len(bounds) - 1) & 1) ^ self.levelAt(start)).astype(np.uint8)
+        return levels, np.diff(bounds)
+
+    def pulseWidths(self, level=1, start=None, stop=None):
+
+        """ :returns:
+                Lengths in samples of every complete pulse at the given level
+                (runs cut by start or stop are left out)
+        """
+
+        levels, lengths = self.runs(start, stop)
+        levels, lengths = levels[1:-1], lengths[1:-1]
+        return lengths[levels == level]
+
+    def histogram(self, level=1, bins=50, start=None, stop=None):
+
+        """ Histogram of pulse widths at the given level
+            :returns:
+                A tuple (counts, bin edges in samples) like np.histogram
+        """
+
+        return np.histogram(self.pulseWidths(level, start, stop), bins=bins)
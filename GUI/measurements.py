@@ -0,0 +1,184 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : measurements.py
+## Description  : Streaming measurements of every
+## channel over a sliding window of samples
+#################################################
+
+from collections import deque
+
+import numpy as np
+
+from buffers import ChannelStore
+from com import SAMPLE_RATE, convertAnalog
+from trigger import schmitt
+
+
+class ChannelMeter:
+    """ Running statistics of one channel over its last window samples.
+
+        Every sample is accounted once when it arrives and once when it
+        leaves the window: sums of samples and squares are updated by
+        both ends, min/max are kept per chunk of chunk samples so a
+        query only scans chunk summaries plus two partial chunks, and
+        edges found by a Schmitt trigger are queued with their sample
+        number until they fall out of the window. Analog channels switch
+        at the middle of their current min/max with 10% hysteresis,
+        digital ones at every 0/1 change.
+    """
+
+    def __init__(self, window=2000, digital=False, rate=SAMPLE_RATE, chunk=64):
+        self.window = window
+        self.digital = digital
+        self.rate = rate
+        self.chunk = chunk
+        dtype = np.uint8 if digital else np.uint16
+        #window plus the samples leaving it, and at least the chunk being completed
+        self.history = ChannelStore(max(2*window, window + chunk), dtype)
+        self.chunkMin = ChannelStore(window//chunk + 2, dtype) #one entry per completed chunk
+        self.chunkMax = ChannelStore(window//chunk + 2, dtype)
+        self.total = 0 #sum of samples in the window
+        self.squares = 0 #sum of squared samples in the window
+        self.state = -1 #Schmitt trigger output before the next sample
+        self.rising = deque() #sample numbers of edges within the window
+        self.falling = deque()
+
+    def feed(self, data):
+
+        """ Takes the next samples of the channel (raw units)
+        """
+
+        for first in range(0, len(data), self.window): #pieces never overrun the history
+            self._feed(data[first:first + self.window])
+
+    def _feed(self, piece):
+        history = self.history
+        if len(piece) == 0:
+            return
+        level, hysteresis = (1, 1) if self.digital else self._threshold()
+
+        start = history.written - self.window
+        history.append(piece)
+        leaving = history.view(max(0, start), max(0, start + len(piece)))
+        wide = piece.astype(np.int64)
+        self.total += int(wide.sum()) - int(leaving.sum(dtype=np.int64))
+        self.squares += int((wide*wide).sum()) - int((leaving.astype(np.int64)**2).sum())
+
+        #summaries of the chunks this piece completed
+        done, complete = self.chunkMin.written, history.written//self.chunk
+        if complete > done:
+            chunks = history.view(done*self.chunk, complete*self.chunk).reshape(-1, self.chunk)
+            self.chunkMin.append(chunks.min(axis=1))
+            self.chunkMax.append(chunks.max(axis=1))
+
+        #edges, numbered like the samples
+        state = schmitt(piece, level, level - hysteresis, self.state)
+        previous = np.concatenate(([self.state], state[:-1]))
+        self.state = int(state[-1])
+        offset = history.written - len(piece)
+        self.rising.extend((np.flatnonzero((state == 1) & (previous == 0)) + offset).tolist())
+        self.falling.extend((np.flatnonzero((state == 0) & (previous == 1)) + offset).tolist())
+        start = history.written - self.window
+        for edges in (self.rising, self.falling):
+            while edges and edges[0] < start:
+                edges.popleft()
+
+    def _threshold(self):
+        if len(self.history) == 0:
+            return 2048, 200
+        low, high = self.extremes()
+        return (low + high)//2, max(8, (high - low)//10)
+
+    def extremes(self):
+
+        """ :returns:
+                A tuple (min, max) of the window in raw units
+        """
+
+        history, size = self.history, self.chunk
+        start = max(0, history.written - self.window)
+        first, last = -(-start//size), history.written//size #full chunks in the window
+        if first >= last:
+            data = history.view(start, history.written)
+            return int(data.min()), int(data.max())
+        parts = [self.chunkMin.view(first, last).min(), self.chunkMax.view(first, last).max()]
+        for edge in (history.view(start, first*size), history.view(last*size, history.written)):
+            if len(edge):
+                parts += [edge.min(), edge.max()]
+        return int(min(parts)), int(max(parts))
+
+    def measure(self):
+
+        """ Measurements of the window, voltages in V, frequency in Hz and
+            period in s (None while fewer than two rising edges are seen)
+            :returns:
+                For analog channels a dict with min, max, vpp, mean, rms,
+                frequency and period; for digital ones a dict with edges,
+                rising, falling, frequency, period and duty (0-1). None
+                before any sample
+        """
+
+        n = min(len(self.history), self.window)
+        if n == 0:
+            return None
+        frequency = period = None
+        if len(self.rising) >= 2:
+            period = (self.rising[-1] - self.rising[0])/(len(self.rising) - 1)/self.rate
+            frequency = 1/period
+
+        if self.digital:
+            return {'edges': len(self.rising) + len(self.falling), 'rising': len(self.rising),
+                    'falling': len(self.falling), 'frequency': frequency, 'period': period,
+                    'duty': self.total/n}
+
+        low, high = self.extremes()
+        return {'min': float(convertAnalog(low)), 'max': float(convertAnalog(high)),
+                'vpp': float(convertAnalog(high - low)), 'mean': float(convertAnalog(self.total/n)),
+                'rms': float(convertAnalog(np.sqrt(self.squares/n))),
+                'frequency': frequency, 'period': period}
+
+
+class Measurements:
+    """ ChannelMeters for the four channels (A1, A2, D1, D2) fed together
+        from blocks of samples
+    """
+
+    def __init__(self, window=2000, rate=SAMPLE_RATE):
+        self.window = window
+        self.rate = rate
+        self.meters = [ChannelMeter(window, channel >= 2, rate) for channel in range(4)]
+
+    def feed(self, block):
+
+        """ Takes the next block of samples (tuple of the four channels)
+        """
+
+        for meter, channel in zip(self.meters, block):
+            meter.feed(channel)
+
+    def measure(self):
+
+        """ :returns:
+                A list with the measurements of every channel
+        """
+
+        return [meter.measure() for meter in self.meters]
+
+
+def describe(channel, values):
+
+    """ One line summary of a channel's measurements
+        :returns:
+            A string
+    """
+
+    if values is None:
+        return "channel %d: --" % (channel + 1)
+    frequency = '%.1f Hz' % values['frequency'] if values['frequency'] else '-- Hz'
+    if channel >= 2:
+        return "channel %d: %s  duty %.0f%%  %d edges" % (channel + 1, frequency, 100*values['duty'], values['edges'])
+    return "channel %d: %.2f Vpp  %.2f Vavg  %.2f Vrms  %s" % (channel + 1, values['vpp'], values['mean'],
+                                                              values['rms'], frequency)
@@ -13,15 +13,29 @@
 
 import sys 
 from com import *
+from buffers import ChannelStore, SampleRing
+from acquisition import AcquisitionThread
+from decimation import Decimator, envelope
+from spectrum import AVERAGING, WINDOWS, Spectrum
+from measurements import Measurements, describe
+from logic import EdgeStore
+from pyramid import MinMaxPyramid
+from persistence import Persistence
+from dsp import MathStage
+from server import ClientThread, isAddress
+from pipeline import MeasureStage, Pipeline, SpectrumStage
+from instrumentation import INSTRUMENTS, StatsLogger
+from trigger import MODES, Trigger
+from recorder import CaptureReader, CaptureWriter, PlaybackThread, RecorderThread
 import numpy as np
 import math
 from PyQt5 import QtGui, QtWidgets, QtCore
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
+import matplotlib
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
+from matplotlib.patches import Polygon
 
 
 
@@ -55,13 +69,36 @@ def scaleYAxis(scl):
         return 1/9
 
 
-def scaleTimeAxis(time=0):
+#raw sample -> screen Y lookup tables for every V/div setting of showScale,
+#so scaling a screen is one indexing operation and never touches the history
+ANALOG_TABLES = [scaleYAxis(scl)*convertAnalog(np.arange(4096)) for scl in range(3)]
+DIGITAL_TABLES = [scaleYAxis(scl)*convertDigital(np.arange(2)) for scl in range(3)]
+
+#display modes and persistence half lives (seconds, None never fades) offered
+DISPLAYS = [('&Traces', 'yt'), ('&Persistence', 'persistence'), ('&XY (channel 2 vs 1)', 'xy')]
+HALF_LIVES = [('Fade in 0.2 s', 0.2), ('Fade in 1 s', 1.0), ('Fade in 5 s', 5.0), ('Infinite persistence', None)]
+#screen pixels per side of a persistence bin and colors of its levels, level 0 left transparent
+PERSISTENCE_PIXELS = 2
+PALETTE = (matplotlib.colormaps['inferno_r'](np.linspace(0.15, 1, 256))*255).astype(np.uint8)
+PALETTE[0] = 0
+
+#narrowest span of the history view, in samples
+MIN_VIEW = 10
+#samples of live history kept for the history view (an hour)
+HISTORY_DEPTH = 3600*SAMPLE_RATE
+
+#filters offered for the math channel, see dsp.makeFilter
+MATH_FILTERS = ['none', 'lowpass:50', 'lowpass:200', 'highpass:5', 'notch:50', 'notch:60', 'bandpass:50:5']
+
+
+def scaleTimeAxis(time=0, points=SAMPLE_RATE):
     
-    """ Calculates time axis scaling factor 
+    """ Calculates time axis scaling factor for a screen of points samples
+        (one second at the sample rate)
         :returns:
             A float, X-axis (time) number of data points
     """
-    return 2000//(10**(time))
+    return points//(10**(time))
 
 
 def timeScaleFactor(time=0):
@@ -75,59 +112,265 @@ def timeScaleFactor(time=0):
 
 
 def showDivScales(self,ch1: str,ch2: str, ch3: str, ch4: str, xpos, timeScale ) -> None:
-    """ Shows V/div for every channel accordingly
+    """ Shows V/div for every channel accordingly. Text artists are
+        created on first call and only updated afterwards
     """
-    self.axes.text(xpos,1.80,"channel 1: %.1f V/div" % ch1,color='r')
-    self.axes.text(xpos,1.50,"channel 2: %.1f V/div" % ch2,color='r')
-    self.axes.text(xpos,1.15,"channel 3: %.1f V/div" % ch3, color='r')
-    self.axes.text(xpos,0.8,"channel 4: %.1f V/div" % ch4, color='r')
-    self.axes.text(xpos,0.45,"time scale: %.1f s/div" % timeScale, color='r')
+    labels = ["channel 1: %.1f V/div" % ch1,
+              "channel 2: %.1f V/div" % ch2,
+              "channel 3: %.1f V/div" % ch3,
+              "channel 4: %.1f V/div" % ch4,
+              "time scale: %.1f s/div" % timeScale]
+    ypos = [1.80, 1.50, 1.15, 0.8, 0.45]
+
+    if not getattr(self, 'scaleTexts', None):
+        self.scaleTexts = [self.axes.text(xpos, y, "", color='r') for y in ypos]
+    for text, label in zip(self.scaleTexts, labels):
+        text.set_x(xpos)
+        text.set_text(label)
 
 class MplCanvas(FigureCanvas):
     """ Matplotlib Canvas object for creating plotting window
 
     """
 
-    def __init__(self, parent=None, width=1, height=1, dpi=100):
+    def __init__(self, parent=None, width=1, height=1, dpi=100, depth=2000, port=None, rate=SAMPLE_RATE,
+                 processes=False, historyDepth=HISTORY_DEPTH):
 
         #Plot config
-        self.fig = plt.figure()  
+        self.fig = Figure() #owned by the canvas, pyplot's global figure manager is not needed
         FigureCanvas.__init__(self, self.fig)
         self.axes = self.fig.add_subplot(111)
         #hide x's and y's labels 
-        self.axes.set_yticklabels([])
-        self.axes.set_xticklabels([])
+        self.axes.tick_params(which='both', labelbottom=False, labelleft=False)
 
         #Grid configuration
         
-        self.axes.grid(b=True,which='major',color='k',linestyle='-')
+        self.axes.grid(True,which='major',color='k',linestyle='-')
         self.axes.minorticks_on()
-        self.axes.grid(b=True,which='minor',linestyle='--')
+        self.axes.grid(True,which='minor',linestyle='--')
         
         
         self.canvas = FigureCanvas(self.fig)
         self.canvas.setParent(parent) #really important to do this for the gui to show image
         self.canvas.move(60,80) 
 
-        #these are empty arrays for channel data 
-        self.channelA1 = []
-        self.channelA2 = []
-        self.channelD1 = []
-        self.channelD2 = []
+        #channel history as raw ADC codes and digital bits, depth samples deep
+        self.rate = rate
+        depth = max(depth, rate) #at least one screen
+        self.channelA1 = ChannelStore(depth, np.uint16)
+        self.channelA2 = ChannelStore(depth, np.uint16)
+        self.channelD1 = EdgeStore(depth) #digital channels are kept as their edges
+        self.channelD2 = EdgeStore(depth)
 
         
-        self.timescale = np.linspace(start=0,stop=1,num=2000,endpoint=True)
+        self.timescale = np.linspace(start=0,stop=1,num=rate,endpoint=True) #one second per screen
         
         self.xticks = np.linspace(0,1,10) #these both are based on project requirements
         self.yticks = np.linspace(0,3,10)
         self.axes.xaxis.set_ticks(self.xticks) 
         self.axes.yaxis.set_ticks(self.yticks)
+        self.axes.set_ylim([0.0, 3.0])
 
-        #open serial port for serial communication with DEM0QE
-        self.dataSerial = openPort(listPorts(sys.platform))
-
+        #one persistent line per channel, drawn by blitting over a cached background
+        self.lines = [self.axes.plot([], [], color='k', animated=True)[0] for i in range(4)]
+        #decimated channels are drawn as their filled min/max band instead
+        self.envelopes = [self.axes.add_patch(Polygon(np.zeros((1, 2)), closed=True, color='k', animated=True))
+                          for i in range(4)]
+        #derived channel (math expression and filters), drawn over the others while set
+        self.math = None
+        self.mathOrigin = None
+        self.mathLine = self.axes.plot([], [], color='b', animated=True)[0]
+        self.mathDecimator = Decimator()
+        #intensity graded and XY modes accumulate into one image instead of drawing lines
+        self.display = 'yt'
+        self.persistence = None
+        #already colored (PALETTE), the cheapest image for matplotlib to resample
+        self.image = self.axes.imshow(PALETTE[np.zeros((1, 1), dtype=np.uint8)], extent=(0, 1, 0, 3), origin='lower',
+                                      aspect='auto', interpolation='none', animated=True, visible=False)
+        self.axes.set_xlim([0.0, 1.0])
+        self.axes.set_ylim([0.0, 3.0])
+        self.background = None
+        self.settings = None #scales the cached background was drawn with
+        self.canvas.mpl_connect('draw_event', self.cacheBackground)
+
+        #the last historyDepth samples as min/max pyramids (digital ones as their edges),
+        #to zoom from all of them down to single samples
+        self.history = [MinMaxPyramid(np.uint16, depth=historyDepth), MinMaxPyramid(np.uint16, depth=historyDepth),
+                        EdgeStore(historyDepth), EdgeStore(historyDepth)]
+        self.historyLive = True #appended to as samples arrive, not while a capture is played back
+        self.capture = None #recorder.CaptureReader played back, whose pyramids may still be building
+        self.view = None #(start, stop) samples of the history on screen, None for the live screen
+        self.follow = False #view slides along with new samples
+        self.drag = None
+        self.arguments = None #settings of the last update_figure, to redraw with
+        self.historyText = self.axes.text(0.01, 0.96, '', color='b', transform=self.axes.transAxes, animated=True)
+        self.canvas.mpl_connect('scroll_event', self.zoomHistory)
+        self.canvas.mpl_connect('button_press_event', self.grabHistory)
+        self.canvas.mpl_connect('motion_notify_event', self.dragHistory)
+        self.canvas.mpl_connect('button_release_event', self.releaseHistory)
+
+        #serial port is drained by its own thread, rendering only reads the ring
+        self.ring = SampleRing()
+        self.cursor = 0
+        self.pipeline = None
+        if isAddress(port): #samples served by another process (server.py)
+            self.dataSerial = None
+            self.reader = ClientThread(port, self.ring)
+        elif processes: #read, decoded and measured by worker processes, the ring is shared memory
+            self.dataSerial = None
+            self.reader = self.pipeline = Pipeline(port)
+            self.ring = self.pipeline.ring
+        else:
+            #open serial port for serial communication with DEM0QE (or a given one, e.g. emulator.py's)
+            self.dataSerial = openPort([port]) if port else findBoard(sys.platform)
+            self.reader = AcquisitionThread(self.dataSerial, self.ring)
+        self.reader.start()
+        self.recorder = None
+        self.backlog = 0 #samples waiting in the ring at the last refresh
+        self.lost = 0 #samples overwritten in the ring before being drawn
+
+        #reduces windows wider than the screen to min/max pairs per pixel
+        self.decimators = [Decimator() for i in range(4)]
+
+        #free running unless a Trigger is set, then only complete sweeps are drawn
+        self.trigger = None
+        self.sweep = None
+        self.shown = None #what is on screen: enabled channels and scales
         
     
+    def startRecording(self, path, scales=(0, 0, 0, 0, 0)):
+
+        """ Streams every sample acquired from now on into a capture file
+        """
+
+        self.stopRecording()
+        self.recorder = RecorderThread(self.ring, CaptureWriter(path, scales=scales))
+        self.recorder.start()
+
+    def stopRecording(self):
+        if self.recorder:
+            self.recorder.stop()
+            self.recorder.join()
+            self.recorder = None
+
+    def openRecording(self, path):
+
+        """ Replaces the live serial source by playback of a capture file
+        """
+
+        self.stopRecording()
+        self.reader.stop()
+        self.reader.join() #port closed, or workers gone and shared ring released
+        self.pipeline = None #its ring cannot be handed to new workers any more
+        self.ring = SampleRing()
+        self.cursor = 0
+        reader = CaptureReader(path)
+        self.history = reader.pyramids(background=True) #the whole capture, mapped, instead of what was acquired
+        self.historyLive = False
+        self.capture = reader
+        self.reader = PlaybackThread(reader, self.ring)
+        self.reader.start()
+
+    def setMath(self, stage=None):
+
+        """ Shows a dsp.MathStage computed from the samples arriving from
+            now on (None removes it, and it is not computed any more)
+        """
+
+        self.math = stage
+        self.mathOrigin = None #sample number (as in channelA1) of the first one fed to it
+        self.mathDecimator = Decimator() #its cache belongs to the previous stage
+        self.shown = None
+
+    def setDisplay(self, display='yt', halfLife=0.5):
+
+        """ Switches between plain traces ('yt'), intensity graded traces
+            with persistence ('persistence') and channel 2 against channel
+            1 ('xy'). The last two accumulate into an image the size of
+            the plot in pixels, fading with halfLife seconds
+        """
+
+        self.display = display
+        bbox = self.axes.bbox
+        self.persistence = Persistence(bbox.width/PERSISTENCE_PIXELS, bbox.height/PERSISTENCE_PIXELS,
+                                       halfLife) if display != 'yt' else None
+        self.image.set_visible(self.persistence is not None)
+        self.shown = None
+
+    def setView(self, start=0, stop=None):
+
+        """ Shows samples start to stop of the history instead of the live
+            screen (up to the newest one by default). A view reaching the
+            newest sample keeps following new ones
+        """
+
+        written, oldest = self.history[0].written, self.history[0].start
+        stop = written if stop is None else int(round(stop))
+        span = min(max(stop - int(round(start)), MIN_VIEW), max(written - oldest, MIN_VIEW))
+        start = max(oldest, min(stop, written) - span)
+        self.view = (start, start + span)
+        self.follow = start + span >= written
+
+    def showLive(self):
+        self.view = None
+        self.shown = None
+
+    def redraw(self):
+
+        """ Draws again with the last settings, e.g. after the view moved
+        """
+
+        if self.arguments is not None:
+            self.update_figure(*self.arguments)
+
+    def zoomHistory(self, event):
+
+        """ Mouse wheel over the history view zooms in (up) or out around
+            the pointer
+        """
+
+        if self.view is None or event.xdata is None:
+            return
+        start, stop = self.view
+        at = start + event.xdata/self.axes.get_xlim()[1]*(stop - start)
+        factor = 0.8 if event.button == 'up' else 1.25
+        self.setView(at - (at - start)*factor, at + (stop - at)*factor)
+        self.redraw()
+
+    def grabHistory(self, event):
+
+        """ Dragging the history view pans it, a double click shows all
+            of the history
+        """
+
+        if self.view is None or event.button != 1 or event.xdata is None:
+            return
+        if event.dblclick:
+            self.setView()
+            self.redraw()
+            return
+        self.drag = (event.x, self.view)
+
+    def dragHistory(self, event):
+        if self.drag is None or self.view is None:
+            return
+        x, (start, stop) = self.drag
+        shift = (x - event.x)/self.axes.bbox.width*(stop - start)
+        self.setView(start + shift, stop + shift)
+        self.redraw()
+
+    def releaseHistory(self, event):
+        self.drag = None
+
+    def setTrigger(self, trigger=None):
+
+        """ Switches between free running display (None) and showing only
+            the sweeps aligned by a trigger.Trigger
+        """
+
+        self.trigger = trigger
+        self.sweep = None
+
     def plot(self,enabledChannels,ch1=0, ch2=0, ch3=0, ch4=0,time=0):
         
         """ Closure function for _plot to be call with parameters
@@ -142,139 +385,471 @@ class MplCanvas(FigureCanvas):
 
     def update_figure(self,enableCh=[False for i in range(4)],ch1=0, ch2=0, ch3=0, ch4=0, time=0):
         
-        self.axes.clear()
-        data = [] #empty array to receive data from DEM0QE
-        
-        
-        if len(self.channelA1) != len(self.timescale): #fill channels with data if completely empty
-            while len(self.channelA1) != len(self.timescale):
-                
-                data = receiveData(self.dataSerial) #receive data from DEM0QE
-
-                """ 
-                    Convert data from binary to proper voltage value and scale 
-                    to adjust view scale in gui. Then, append to both of analog channels.
-                    For digital channels just receive and append, 1-> 3V and 0 -> 0V. 
-
-                """
-                self.channelA1.append(scaleYAxis(ch1)*convertAnalog(data[0]))
-                self.channelA2.append(scaleYAxis(ch2)*convertAnalog(data[1]))
-                self.channelD1.append(scaleYAxis(ch3)*convertDigital(data[2]))
-                self.channelD2.append(scaleYAxis(ch4)*convertDigital(data[3]))
-        else: 
-        
-            """
-                If array already full then refresh partly in order to  
-                enhance rendering performance and not get too stuck on
-                data reception 
-            """
-            i = 0
-            while i < 300:
-                
-                data = receiveData(self.dataSerial)
-                
-                #pop data from first element in order to add new ones
-                self.channelA1.pop(0)
-                self.channelA2.pop(0)
-                self.channelD1.pop(0)
-                self.channelD2.pop(0)
-                self.channelA1.append(scaleYAxis(ch1)*convertAnalog(data[0]))
-                self.channelA2.append(scaleYAxis(ch2)*convertAnalog(data[1]))
-                self.channelD1.append(scaleYAxis(ch3)*convertDigital(data[2]))
-                self.channelD2.append(scaleYAxis(ch4)*convertDigital(data[3]))
-                i = i + 1
+        INSTRUMENTS.tick('frame')
+        clock = INSTRUMENTS.clock()
+        self.arguments = (enableCh, ch1, ch2, ch3, ch4, time)
+        #take what arrived since last refresh, all of it for the history but never
+        #more than the live screen history for the rest
+        self.backlog = self.ring.written - self.cursor
+        block, self.cursor, lost = self.ring.read(self.cursor)
+        self.lost += lost
+        if self.historyLive:
+            for pyramid, channel in zip(self.history, block):
+                pyramid.append(channel)
+        block = tuple(channel[-self.channelA1.capacity:] for channel in block)
+        self.channelA1.append(block[0])
+        self.channelA2.append(block[1])
+        self.channelD1.append(block[2])
+        self.channelD2.append(block[3])
+        if self.math is not None:
+            if self.mathOrigin is None:
+                self.mathOrigin = self.channelA1.written - len(block[0])
+            self.math.feed(block)
+        INSTRUMENTS.record('buffer', clock)
+
+        if self.view is not None:
+            self.drawHistory(enableCh, ch1, ch2, ch3, ch4, time)
+            return
+        if self.display == 'xy': #every sample that just arrived, in volts on screen (0-3)
+            self.persistence.add(ANALOG_TABLES[ch1][block[0]]/3.0, ANALOG_TABLES[ch2][block[1]]/3.0)
+            self.drawImage(ch1, ch2, ch3, ch4, time)
+            return
+
+        shown = (tuple(enableCh), ch1, ch2, ch3, ch4, time)
+        if self.trigger:
+            sweep = self.trigger.feed(block)
+            if sweep is None and shown == self.shown:
+                return #no new sweep, screen is still up to date
+            self.sweep = sweep if sweep is not None else self.sweep
+            if self.sweep is None:
+                return
+            window = self.sweep
+            start = None #sweeps are not contiguous, nothing to cache
+            fresh = sweep is not None
+        elif len(self.channelA1) < len(self.timescale): #wait until one screen is filled
+            return
+        else:
+            n = len(self.timescale)
+            window = (self.channelA1.last(n), self.channelA2.last(n), self.channelD1, self.channelD2)
+            start = self.channelA1.written - n
+            fresh = True
+        self.shown = shown
+
+        ts = scaleTimeAxis(time, len(self.timescale))
+
+        if self.display == 'persistence': #every sweep (or screen when free running) adds up once
+            if fresh:
+                tables = (ANALOG_TABLES[ch1], ANALOG_TABLES[ch2], DIGITAL_TABLES[ch3], DIGITAL_TABLES[ch4])
+                for i, (channel, table, enabled) in enumerate(zip(window, tables, enableCh)):
+                    if not enabled:
+                        continue
+                    if i >= 2 and start is not None:
+                        channel = channel.levels(start, start + ts)
+                    self.persistence.add(np.arange(ts)/ts, table[channel[0:ts]]/3.0)
+            self.drawImage(ch1, ch2, ch3, ch4, time)
+            return
+
+        if (ch1, ch2, ch3, ch4, time) != self.settings or self.background is None:
+            self.drawBackground(ch1, ch2, ch3, ch4, time)
+
+        """ 
+            Reduce the visible part of the screen to at most two points per
+            pixel, then convert it from binary to proper voltage value,
+            scaled to adjust view scale in gui, through the lookup tables.
+            For digital channels 1-> 3V and 0 -> 0V, drawn as step lines
+            straight from their edges unless there are more edges than
+            pixels. 
+        """
+        clock = INSTRUMENTS.clock()
+        pixels = self.axes.bbox.width
+        tables = (ANALOG_TABLES[ch1], ANALOG_TABLES[ch2], DIGITAL_TABLES[ch3], DIGITAL_TABLES[ch4])
+
+        artists = [] #prepared first, then drawn in one go
+        for i, (line, band, decimator, table, channel, enabled) in enumerate(zip(self.lines, self.envelopes,
+                                                                                 self.decimators, tables, window, enableCh)):
+            line.set_visible(False)
+            band.set_visible(False)
+            if not enabled:
+                continue
+            line.set_drawstyle('default')
+            if i >= 2:
+                edges, first = channel, start
+                if start is None: #sweep samples, find their edges
+                    edges, first = EdgeStore(), 0
+                    edges.append(channel[0:ts])
+                if len(edges.between(first + 1, first + ts)) < pixels:
+                    samples, levels = edges.steps(first, first + ts)
+                    line.set_drawstyle('steps-post')
+                    line.set_data(self.timescale[samples - first], table[levels])
+                    line.set_visible(True)
+                    artists.append(line)
+                    continue
+                channel = edges.levels(first, first + ts)
+            indexes, values = decimator.decimate(channel[0:ts], pixels, start)
+            outline = envelope(indexes, values) if len(indexes) < ts else None
+            if outline is not None:
+                indexes, values = outline
+                band.set_xy(np.column_stack((self.timescale[indexes], table[values])))
+                band.set_visible(True)
+                artists.append(band)
+            else:
+                line.set_data(self.timescale[indexes], table[values])
+                line.set_visible(True)
+                artists.append(line)
+
+        #math channel in volts on channel 1's scale, over the same samples as the others:
+        #output k was computed from sample mathOrigin + k*factor
+        self.mathLine.set_visible(False)
+        if self.math is not None and start is not None:
+            factor, history = self.math.factor, self.math.history
+            first = max(-(-(start - self.mathOrigin)//factor), history.written - len(history), 0)
+            last = min(-(-(start + ts - self.mathOrigin)//factor), history.written)
+            if first < last:
+                indexes, values = self.mathDecimator.decimate(history.view(first, last), pixels, first)
+                at = self.mathOrigin + factor*(first + indexes) - start
+                self.mathLine.set_data(self.timescale[at], scaleYAxis(ch1)*values)
+                self.mathLine.set_visible(True)
+                artists.append(self.mathLine)
+        INSTRUMENTS.record('prep', clock)
+
+        clock = INSTRUMENTS.clock()
+        self.canvas.restore_region(self.background)
+        for artist in artists:
+            self.axes.draw_artist(artist)
+        self.canvas.blit(self.axes.bbox) #draw
+        INSTRUMENTS.record('draw', clock)
+
+    def drawImage(self, ch1=0, ch2=0, ch3=0, ch4=0, time=0):
+
+        """ Fades the persistence image and draws it over the background
+            as one artist
+        """
+
+        if (ch1, ch2, ch3, ch4, time) != self.settings or self.background is None:
+            self.drawBackground(ch1, ch2, ch3, ch4, time)
+
+        clock = INSTRUMENTS.clock()
+        self.persistence.fade()
+        self.image.set_data(PALETTE[self.persistence.levels()])
+        self.image.set_extent((0, timeScaleFactor(time), 0, 3.0))
+        INSTRUMENTS.record('prep', clock)
+
+        clock = INSTRUMENTS.clock()
+        self.canvas.restore_region(self.background)
+        self.axes.draw_artist(self.image)
+        self.canvas.blit(self.axes.bbox)
+        INSTRUMENTS.record('draw', clock)
+
+    def drawHistory(self, enableCh, ch1=0, ch2=0, ch3=0, ch4=0, time=0):
+
+        """ Draws self.view from the history pyramids, at about the same
+            cost whatever its span
+        """
+
+        if self.capture is not None and self.capture.summary is not None:
+            self.history = self.capture.summary #levels built, no longer by stride
+            self.capture, self.shown = None, None
+        if self.follow: #slide along, or keep showing everything
+            start, stop = self.view
+            self.setView(start if start <= self.history[0].start else self.history[0].written - (stop - start))
+        shown = (tuple(enableCh), ch1, ch2, ch3, ch4, time, self.view)
+        if shown == self.shown:
+            return
+        self.shown = shown
+        if (ch1, ch2, ch3, ch4, time) != self.settings or self.background is None:
+            self.drawBackground(ch1, ch2, ch3, ch4, time)
+
+        clock = INSTRUMENTS.clock()
+        start, stop = self.view
+        scale = timeScaleFactor(time)/(stop - start) #x per sample
+        pixels = self.axes.bbox.width
+        tables = (ANALOG_TABLES[ch1], ANALOG_TABLES[ch2], DIGITAL_TABLES[ch3], DIGITAL_TABLES[ch4])
+        artists = [self.historyText]
+        self.historyText.set_text('history %.3f s to %.3f s' % (start/self.rate, stop/self.rate))
+        self.mathLine.set_visible(False)
+        for i, (line, band, pyramid, table, enabled) in enumerate(zip(self.lines, self.envelopes, self.history,
+                                                                      tables, enableCh)):
+            line.set_visible(False)
+            band.set_visible(False)
+            if not enabled:
+                continue
+            indexes, values = pyramid.view(start, stop, pixels)
+            summarized = (stop - start)/max(1, int(pixels)) >= 2
+            outline = envelope(indexes, values) if summarized and len(indexes) else None
+            if outline is not None:
+                indexes, values = outline
+                band.set_xy(np.column_stack(((indexes - start)*scale, table[values])))
+                band.set_visible(True)
+                artists.append(band)
+            else:
+                line.set_drawstyle('steps-post' if i >= 2 and not summarized else 'default')
+                line.set_data((indexes - start)*scale, table[values])
+                line.set_visible(True)
+                artists.append(line)
+        INSTRUMENTS.record('prep', clock)
+
+        clock = INSTRUMENTS.clock()
+        self.canvas.restore_region(self.background)
+        for artist in artists:
+            self.axes.draw_artist(artist)
+        self.canvas.blit(self.axes.bbox)
+        INSTRUMENTS.record('draw', clock)
+
+    def drawBackground(self, ch1=0, ch2=0, ch3=0, ch4=0, time=0):
+
+        """ Redraws static parts of the plot (grid, ticks and scale labels).
+            Only needed when a scale or the time base changes
+        """
 
-        
-        ts = scaleTimeAxis(time)
-        
         xlim = [timeScaleFactor(time)*i for i in [0.0, 1.0]] #set new x limit in case of new time scale 
         self.xticks = np.linspace(0,xlim[1],10) #new xticks for new time scale
-        
-        # All False case
-        if enableCh == [False, False, False, False]:
-            pass
-        # All True case
-        elif enableCh == [True, True, True, True]:
-            self.axes.plot(self.timescale[0:ts],self.channelA1[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelA2[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelD1[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelD2[0:ts], color='k')
-        # one False case scenerios
-        elif enableCh == [True, True, True, False]:
-            self.axes.plot(self.timescale[0:ts],self.channelA1[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelA2[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelD1[0:ts], color='k')
-        elif enableCh == [True, True, False, True]:
-            self.axes.plot(self.timescale[0:ts],self.channelA1[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelA2[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelD2[0:ts], color='k')
-        elif enableCh == [True, False, True, True]: 
-            self.axes.plot(self.timescale[0:ts],self.channelA1[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelD1[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelD2[0:ts], color='k')
-        elif enableCh == [False, True, True, True]:
-            self.axes.plot(self.timescale[0:ts], self.channelA2[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelD1[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelD2[0:ts], color='k')
-        #######################################################################################
-        # Falses' cases 
-        elif enableCh == [True, True, False, False]:
-            self.axes.plot(self.timescale[0:ts],self.channelA1[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts],self.channelA2[0:ts], color='k')
-        elif enableCh == [True, False, False, True]:
-            self.axes.plot(self.timescale[0:ts],self.channelA1[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelD2[0:ts], color='k')
-        elif enableCh == [False, False, True, True]:
-            self.axes.plot(self.timescale[0:ts], self.channelD1[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelD2[0:ts], color='k')
-        ########################################################################################
-        ## Falses' pairs separated cases
-        elif enableCh == [True, False, True, False]:
-            self.axes.plot(self.timescale[0:ts],self.channelA1[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelD1[0:ts], color='k')
-        elif enableCh == [False, True, False, True]:
-            self.axes.plot(self.timescale[0:ts], self.channelA2[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelD2[0:ts], color='k')
-        elif enableCh == [False, True, True, False]:
-            self.axes.plot(self.timescale[0:ts], self.channelA2[0:ts], color='k')
-            self.axes.plot(self.timescale[0:ts], self.channelD1[0:ts], color='k')
-        ########################################################################################
-        # Falses' triples cases 
-        elif enableCh == [False, False, False, True]: 
-            self.axes.plot(self.timescale[0:ts],self.channelD2[0:ts], color='k')
-        elif enableCh == [True, False, False, False]:
-            self.axes.plot(self.timescale[0:ts],self.channelA1[0:ts], color='k')
-        ########################################################################################
-        # Remaining cases 
-        # one True cases 
-        elif enableCh == [False, False, False, True]:
-            self.axes.plot(self.timescale[0:ts],self.channelD2[0:ts], color='k')
-        elif enableCh == [False, False, True, False]:
-            self.axes.plot(self.timescale[0:ts],self.channelD1[0:ts], color='k')
-        elif enableCh == [False, True, False, False]:
-            self.axes.plot(self.timescale[0:ts],self.channelA2[0:ts], color='k')
-        elif enableCh == [True, False, False, False]:
-            self.axes.plot(self.timescale[0:ts],self.channelA1[0:ts], color='k')
-        else:
-            pass
-        ########################################################################################
-        
-        
+
         showDivScales(self,showScale(ch1),showScale(ch2), showScale(ch3), showScale(ch4), 0.68*xlim[1], timeScaleFactor(time))
-        
+
         self.axes.xaxis.set_ticks(self.xticks)
-        self.axes.yaxis.set_ticks(self.yticks)
         self.axes.set_xlim(xlim)
-        self.axes.set_ylim([0.0, 3.0])
-        #hide ticks labels 
-        self.axes.set_xticklabels([])
-        self.axes.set_yticklabels([])
-        
-        self.axes.grid(b=True,which='major',color='k',linestyle='-')
-        self.axes.minorticks_on()
-        self.axes.grid(b=True,which='minor',linestyle='--')
-        
-        self.canvas.draw() #draw
+
+        self.settings = (ch1, ch2, ch3, ch4, time)
+        clock = INSTRUMENTS.clock()
+        self.canvas.draw() #background is cached by cacheBackground
+        INSTRUMENTS.record('canvas.draw', clock)
+
+    def stats(self):
+
+        """ :returns:
+                A dict with the acquisition counters of the reader, ring
+                fill (0-1) and overruns, and the stage timers if enabled
+        """
+
+        stats = dict(getattr(self.reader, 'stats', {}))
+        stats.update({'samples': self.ring.written, 'ringFill': self.backlog/self.ring.capacity,
+                      'overruns': self.lost, 'timers': INSTRUMENTS.snapshot()})
+        return stats
+
+    def cacheBackground(self, event):
+
+        """ Keeps a copy of the freshly drawn figure without channel lines
+            for blitting, called on every full draw (including resizes)
+        """
+
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+
+class SpectrumCanvas(FigureCanvas):
+    """ Amplitude spectrum of the analog channels in its own axes.
+
+        Reads the sample ring of an MplCanvas with a cursor of its own and
+        is refreshed by its own slower timer, so FFTs never hold up the
+        time domain refresh. Only enabled channels are transformed, except
+        while the source is a Pipeline: then both are, by a worker process
+        of the pipeline, and only drawn here
+    """
+
+    def __init__(self, scope, parent=None, period=100):
+        self.fig = Figure(figsize=(6.4, 3))
+        FigureCanvas.__init__(self, self.fig)
+        self.setParent(parent)
+        self.move(60,580)
+
+        self.scope = scope #MplCanvas whose samples are analyzed
+        self.axes = self.fig.add_subplot(111)
+        self.axes.grid(True,which='major',color='k',linestyle='-')
+        self.axes.set_xlabel('Hz')
+        self.axes.set_ylabel('dBV')
+        self.axes.set_ylim([-100, 10])
+        self.fig.tight_layout()
+
+        self.lines = [self.axes.plot([], [], color=color, animated=True)[0] for color in ('k', 'r')]
+        self.background = None
+        self.mpl_connect('draw_event', self.cacheBackground)
+
+        self.enabled = [False, False]
+        self.ring = None
+        self.cursor = 0
+        self.shown = None #pipeline result drawn last
+
+        self.period = period
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.update_figure)
+        self.configure()
+
+    def configure(self, length=1024, window='hann', averaging='exponential'):
+
+        """ Restarts both spectra with a new FFT length, window and averaging
+        """
+
+        self.options = {'length': length, 'window': window, 'averaging': averaging, 'rate': self.scope.rate}
+        self.spectra = [Spectrum(**self.options) for i in range(2)]
+        self.axes.set_xlim([0, self.scope.rate/2])
+        self.draw() #background is cached by cacheBackground
+        if self.timer.isActive():
+            self.start()
+
+    def start(self):
+        if self.scope.pipeline and self.scope.reader is self.scope.pipeline:
+            self.scope.pipeline.add('spectrum', SpectrumStage(**self.options))
+        self.timer.start(self.period)
+
+    def stop(self):
+        self.timer.stop()
+        if self.scope.pipeline:
+            self.scope.pipeline.remove('spectrum')
+
+    def update_figure(self):
+        if self.scope.pipeline and self.scope.reader is self.scope.pipeline:
+            magnitudes = self.scope.pipeline.result('spectrum')
+            if magnitudes is None or magnitudes is self.shown or self.background is None:
+                return
+            self.shown = magnitudes
+            self.drawLines(magnitudes)
+            return
+
+        if self.scope.ring is not self.ring: #source changed (e.g. playback), start over
+            self.ring, self.cursor = self.scope.ring, self.scope.ring.written
+            for spectrum in self.spectra:
+                spectrum.restart()
+
+        block, self.cursor, lost = self.ring.read(self.cursor)
+        updated = False
+        for spectrum, channel, enabled in zip(self.spectra, block, self.enabled):
+            if lost or not enabled:
+                spectrum.restart()
+            if enabled:
+                updated = spectrum.feed(channel) or updated
+        if not updated or self.background is None:
+            return
+        self.drawLines([spectrum.magnitude() for spectrum in self.spectra])
+
+    def drawLines(self, magnitudes):
+
+        """ Blits the magnitudes (None for none yet) of the enabled channels
+        """
+
+        self.restore_region(self.background)
+        for line, spectrum, magnitude, enabled in zip(self.lines, self.spectra, magnitudes, self.enabled):
+            line.set_visible(enabled and magnitude is not None)
+            if line.get_visible():
+                line.set_data(spectrum.frequencies, magnitude)
+                self.axes.draw_artist(line)
+        self.blit(self.axes.bbox)
+
+    def cacheBackground(self, event):
+        self.background = self.copy_from_bbox(self.axes.bbox)
+
+class MeasurementPanel(QWidget):
+    """ Readout of the running measurements of every channel over the
+        visible window, above the plot.
+
+        Meters are fed from the sample ring of an MplCanvas through a
+        cursor of their own and the labels are refreshed by a slow timer
+        of their own, independent of the plot refresh
+    """
+
+    def __init__(self, scope, parent=None, period=500):
+        super().__init__(parent)
+        self.setGeometry(60,25,640,50)
+        self.scope = scope #MplCanvas whose samples are measured
+        self.labels = [QLabel(self) for i in range(4)]
+        for i, label in enumerate(self.labels):
+            label.setGeometry(320*(i % 2), 25*(i//2), 320, 25)
+
+        self.enabled = [False for i in range(4)]
+        self.ring = None
+        self.cursor = 0
+        self.window = None #samples measured
+        self.configure()
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.update_labels)
+        self.timer.start(period)
+
+    def configure(self, window=SAMPLE_RATE):
+
+        """ Restarts the meters over a window of the given samples, if it
+            changed
+        """
+
+        if window == self.window:
+            return
+        self.window = window
+        self.measurements = Measurements(window, self.scope.rate)
+        self.ring = None
+        if self.scope.pipeline and self.scope.reader is self.scope.pipeline: #measured by a worker process
+            self.scope.pipeline.add('measure', MeasureStage(window, self.scope.rate))
+
+    def update_labels(self):
+        if self.scope.pipeline and self.scope.reader is self.scope.pipeline:
+            measured = self.scope.pipeline.result('measure') or [None for i in range(4)]
+        else:
+            if self.scope.ring is not self.ring: #source changed (e.g. playback), start over
+                self.ring, self.cursor = self.scope.ring, self.scope.ring.written
+            block, self.cursor, lost = self.ring.read(self.cursor)
+            self.measurements.feed(block)
+            measured = self.measurements.measure()
+
+        for channel, (label, values, enabled) in enumerate(zip(self.labels, measured, self.enabled)):
+            label.setText(describe(channel, values) if enabled else "")
+
+    def stop(self):
+        self.timer.stop()
+
+class FramePacer(QtCore.QObject):
+    """ Refresh loop of an MplCanvas, created once and kept running.
+
+        It ticks once per display refresh (the primary screen's refresh
+        rate, 60 Hz if unknown) and redraws only when samples arrived
+        since the last frame or the settings changed. Qt never queues
+        timer ticks, so a frame longer than the interval makes the next
+        ones to be skipped instead of piling up; the frame after it takes
+        everything that arrived meanwhile. Settings are swapped in place
+        by configure() and shown from the next frame on.
+    """
+
+    def __init__(self, canvas, parent=None, rate=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        if rate is None:
+            screen = QApplication.primaryScreen()
+            rate = screen.refreshRate() if screen else 0
+        self.rate = rate or 60.0
+        self.settings = ([False for i in range(4)], 0, 0, 0, 0, 0)
+        self.pending = True #settings not shown yet
+        self.frames = 0
+        self.skipped = 0 #ticks missed because a frame ran late
+        self.clock = QtCore.QElapsedTimer()
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setInterval(max(1, int(round(1e3/self.rate))))
+        self.timer.timeout.connect(self.frame)
+
+    def configure(self, enabledChannels, chA1=0, chA2=0, chD1=0, chD2=0, time=0):
+
+        """ Replaces the settings drawn by the running loop
+        """
+
+        self.settings = (list(enabledChannels), chA1, chA2, chD1, chD2, time)
+        self.pending = True
+
+    def start(self):
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def isActive(self):
+        return self.timer.isActive()
+
+    def frame(self):
+        canvas = self.canvas
+        if not self.pending and canvas.ring.written == canvas.cursor:
+            return #nothing new to show
+
+        self.pending = False
+        self.clock.start()
+        canvas.update_figure(*self.settings)
+        self.frames += 1
+        self.skipped += self.clock.elapsed()//self.timer.interval() #ticks that went by meanwhile
 
 class textBox(QMainWindow):
 
@@ -317,7 +892,7 @@ class textBox(QMainWindow):
     
 
 class Window(QMainWindow): 
-    def __init__(self):
+    def __init__(self, port=None, processes=False):
         super().__init__()
 
         #Status bar 
@@ -326,17 +901,63 @@ class Window(QMainWindow):
                                  QtCore.Qt.CTRL + QtCore.Qt.Key_Q)
         self.file_menu.addAction('&Save As', self.fileSave,
                                  QtCore.Qt.CTRL + QtCore.Qt.Key_S)
+        self.recordAction = self.file_menu.addAction('&Record', self.fileRecord,
+                                 QtCore.Qt.CTRL + QtCore.Qt.Key_R)
+        self.recordAction.setCheckable(True)
+        self.file_menu.addAction('&Open Recording', self.fileOpenRecording,
+                                 QtCore.Qt.CTRL + QtCore.Qt.Key_O)
         self.menuBar().addMenu(self.file_menu)
+        #Tools option
+        self.tools_menu = QtWidgets.QMenu('&Tools', self)
+        self.timersAction = self.tools_menu.addAction('&Stage Timers', self.toolsTimers)
+        self.timersAction.setCheckable(True)
+        self.logAction = self.tools_menu.addAction('&Log Stats', self.toolsLog)
+        self.logAction.setCheckable(True)
+        self.mathAction = self.tools_menu.addAction('&Math Channel...', self.toolsMath)
+        self.mathAction.setCheckable(True)
+        self.historyAction = self.tools_menu.addAction('&History View', self.toolsHistory,
+                                 QtCore.Qt.CTRL + QtCore.Qt.Key_H)
+        self.historyAction.setCheckable(True)
+        self.menuBar().addMenu(self.tools_menu)
+        #Display option: traces, persistence or XY and how fast persistence fades
+        self.display_menu = QtWidgets.QMenu('&Display', self)
+        self.displayGroup = QtWidgets.QActionGroup(self)
+        for label, display in DISPLAYS:
+            action = self.display_menu.addAction(label, self.displayChanged)
+            action.setCheckable(True)
+            action.setChecked(display == 'yt')
+            action.setData(display)
+            self.displayGroup.addAction(action)
+        self.display_menu.addSeparator()
+        self.halfLifeGroup = QtWidgets.QActionGroup(self)
+        for label, halfLife in HALF_LIVES:
+            action = self.display_menu.addAction(label, self.displayChanged)
+            action.setCheckable(True)
+            action.setChecked(halfLife == 1.0)
+            action.setData(halfLife)
+            self.halfLifeGroup.addAction(action)
+        self.display_menu.addAction('&Clear Persistence', self.displayClear)
+        self.menuBar().addMenu(self.display_menu)
+        self.logger = None
         #Help option
         self.help_menu = QtWidgets.QMenu('&Help', self)
         self.menuBar().addSeparator()
         self.menuBar().addMenu(self.help_menu)
 
         #create canvas object 
-        self.canvas = MplCanvas(self)
+        self.canvas = MplCanvas(self, port=port, processes=processes)
+        self.spectrum = SpectrumCanvas(self.canvas, self)
+        self.spectrum.hide()
+        self.measurements = MeasurementPanel(self.canvas, self)
+
+        #acquisition and render stats, refreshed once a second
+        self.lastStats = None
+        self.statusTimer = QtCore.QTimer(self)
+        self.statusTimer.timeout.connect(self.updateStatus)
+        self.statusTimer.start(1000)
 
-        #timer configuration for refreshing graph
-        self.timer = None
+        #redraws the graph at most once per display refresh, when there is something new
+        self.pacer = FramePacer(self.canvas, self)
 
 
         self.enabledChannels = [False for i in range(4)]
@@ -346,7 +967,7 @@ class Window(QMainWindow):
         self.top = 100
         self.left = 100
         self.width = 1000 
-        self.height = 600 
+        self.height = 625 #room for the status bar
         
         #push button config 
         button = QPushButton("Start", self) 
@@ -441,6 +1062,61 @@ class Window(QMainWindow):
         self.time.setTickInterval(1)
         self.time.valueChanged.connect(self.sliderChangedValue)
 
+        #trigger source/mode, level and position of the trigger point on screen
+        self.text = QLabel("Trigger", self)
+        self.text.move(800,440)
+
+        self.triggerMode = QComboBox(self)
+        self.triggerMode.setGeometry(750,465,170,25)
+        self.triggerMode.addItem("Free run", None)
+        for channel in range(4):
+            for mode in (MODES if channel < 2 else MODES[:2]):
+                self.triggerMode.addItem("Channel %d %s" % (channel + 1, mode), (channel, mode))
+        self.triggerMode.currentIndexChanged.connect(self.triggerChanged)
+
+        self.triggerLevel = QSlider(Qt.Horizontal, self)
+        self.triggerLevel.setGeometry(750,500,170,20)
+        self.triggerLevel.setMinimum(0)
+        self.triggerLevel.setMaximum(4095)
+        self.triggerLevel.setValue(2048)
+        self.triggerLevel.valueChanged.connect(self.triggerChanged)
+
+        self.triggerPosition = QSlider(Qt.Horizontal, self)
+        self.triggerPosition.setGeometry(750,530,170,20)
+        self.triggerPosition.setMinimum(0)
+        self.triggerPosition.setMaximum(100)
+        self.triggerPosition.setValue(50)
+        self.triggerPosition.valueChanged.connect(self.triggerChanged)
+
+        #spectrum of channels 1 and 2: FFT length, window and averaging
+        self.spectrumCheckBox = QCheckBox("Spectrum", self)
+        self.spectrumCheckBox.setGeometry(750,565,170,25) #above the status bar
+        self.spectrumCheckBox.stateChanged.connect(self.spectrumToggled)
+
+        self.spectrumLength = QComboBox(self)
+        self.spectrumLength.setGeometry(750,605,170,25)
+        for length in (256, 512, 1024, 2048, 4096):
+            self.spectrumLength.addItem("%d points" % length, length)
+        self.spectrumLength.setCurrentIndex(2)
+        self.spectrumLength.currentIndexChanged.connect(self.spectrumChanged)
+
+        self.spectrumWindow = QComboBox(self)
+        self.spectrumWindow.setGeometry(750,635,170,25)
+        for window in WINDOWS:
+            self.spectrumWindow.addItem(window, window)
+        self.spectrumWindow.currentIndexChanged.connect(self.spectrumChanged)
+
+        self.spectrumAveraging = QComboBox(self)
+        self.spectrumAveraging.setGeometry(750,665,170,25)
+        for averaging in AVERAGING:
+            self.spectrumAveraging.addItem("%s averaging" % averaging, averaging)
+        self.spectrumAveraging.setCurrentIndex(AVERAGING.index('exponential'))
+        self.spectrumAveraging.currentIndexChanged.connect(self.spectrumChanged)
+        #below the default window, shown with the spectrum once it is grown
+        self.spectrumOptions = [self.spectrumLength, self.spectrumWindow, self.spectrumAveraging]
+        for combo in self.spectrumOptions:
+            combo.hide()
+
         self.InitWindow()
 
     def InitWindow(self):
@@ -454,6 +1130,24 @@ class Window(QMainWindow):
     def fileSave(self):
         self.newTb = textBox(self)
         self.newTb.show()
+
+    def fileRecord(self):
+        if not self.recordAction.isChecked():
+            self.canvas.stopRecording()
+            return
+        path, _ = QFileDialog.getSaveFileName(self, 'Record to', '', 'BOB captures (*.bob)')
+        if not path:
+            self.recordAction.setChecked(False)
+            return
+        scales = (self.channelA1.value(), self.channelA2.value(), self.channelD1.value(),
+                  self.channelD2.value(), self.time.value())
+        self.canvas.startRecording(path, scales)
+
+    def fileOpenRecording(self):
+        path, _ = QFileDialog.getOpenFileName(self, 'Open recording', '', 'BOB captures (*.bob)')
+        if path:
+            self.recordAction.setChecked(False)
+            self.canvas.openRecording(path)
         
     def sliderChangedValue(self):
         channelA1 = self.channelA1.value()
@@ -461,8 +1155,148 @@ class Window(QMainWindow):
         channelD1 = self.channelD1.value()
         channelD2 = self.channelD2.value()
         time      = self.time.value()
+        self.triggerChanged() #sweep length follows the time base
+        self.measurements.configure(scaleTimeAxis(time, len(self.canvas.timescale)))
         self.plot(self.enabledChannels,channelA1,channelA2,channelD1,channelD2,time) 
 
+    def triggerChanged(self):
+
+        """ Rebuilds the canvas trigger from the trigger controls, one
+            sweep being exactly one screen of the current time base
+        """
+
+        setting = self.triggerMode.currentData()
+        if setting is None:
+            self.canvas.setTrigger(None)
+            return
+        channel, mode = setting
+        ts = scaleTimeAxis(self.time.value(), len(self.canvas.timescale))
+        pre = ts*self.triggerPosition.value()//100
+        self.canvas.setTrigger(Trigger(channel, mode, self.triggerLevel.value(), pre=pre, post=ts - pre))
+
+    def toolsTimers(self):
+        INSTRUMENTS.enabled = self.timersAction.isChecked()
+        INSTRUMENTS.reset()
+
+    def toolsLog(self):
+        if self.logger:
+            self.logger.stop()
+            self.logger = None
+        if not self.logAction.isChecked():
+            return
+        path, _ = QFileDialog.getSaveFileName(self, 'Log stats to', '', 'JSON lines (*.jsonl)')
+        if not path:
+            self.logAction.setChecked(False)
+            return
+        self.logger = StatsLogger(path, self.stats)
+        self.logger.start()
+
+    def displayChanged(self):
+        self.canvas.setDisplay(self.displayGroup.checkedAction().data(), self.halfLifeGroup.checkedAction().data())
+        self.canvas.redraw()
+
+    def displayClear(self):
+        if self.canvas.persistence:
+            self.canvas.persistence.clear()
+            self.canvas.redraw()
+
+    def toolsHistory(self):
+
+        """ Switches between the live screen and the whole history, zoomed
+            with the mouse wheel and panned by dragging (a double click
+            shows all of it again)
+        """
+
+        if self.historyAction.isChecked():
+            self.canvas.setView()
+        else:
+            self.canvas.showLive()
+        self.canvas.redraw()
+
+    def toolsMath(self):
+
+        """ Asks for a math expression and a filter and shows the result
+            in blue on channel 1's scale, or removes it
+        """
+
+        self.canvas.setMath(None)
+        if not self.mathAction.isChecked():
+            return
+        expression, ok = QInputDialog.getText(self, 'Math Channel', 'Expression of a1, a2, d1, d2:', text='a1 - a2')
+        if ok:
+            spec, ok = QInputDialog.getItem(self, 'Math Channel', 'Filter:', MATH_FILTERS, 0, False)
+        if not ok:
+            self.mathAction.setChecked(False)
+            return
+        try:
+            self.canvas.setMath(MathStage(expression, [] if spec == 'none' else [spec]))
+        except (SyntaxError, ValueError) as error:
+            QMessageBox.warning(self, 'Math Channel', str(error))
+            self.mathAction.setChecked(False)
+
+    def stats(self):
+
+        """ :returns:
+                The canvas stats plus refresh rate achieved and requested
+        """
+
+        stats = self.canvas.stats()
+        frame = stats['timers'].get('frame')
+        stats['fps'] = 1e3/frame['recent_ms'] if frame and frame['recent_ms'] else None
+        stats['requestedFps'] = self.pacer.rate
+        stats['framesSkipped'] = self.pacer.skipped
+        return stats
+
+    def updateStatus(self):
+
+        """ Shows the stats in the status bar, counters as rates over the
+            last second
+        """
+
+        stats = self.stats()
+        now = QtCore.QTime.currentTime().msecsSinceStartOfDay()/1e3
+        last, self.lastStats = self.lastStats, (now, stats)
+        if last is None or now <= last[0]:
+            return
+        elapsed = now - last[0]
+        rate = lambda key: (stats.get(key, 0) - last[1].get(key, 0))/elapsed
+
+        parts = ["rx %.1f kB/s" % (rate('bytesReceived')/1e3),
+                 "%.0f frames/s" % rate('samples'),
+                 "sync losses %d (%d B)" % (stats.get('syncLosses', 0), stats.get('bytesDiscarded', 0)),
+                 "ring %.1f%%" % (100*stats['ringFill']),
+                 "overruns %d" % stats['overruns'],
+                 "skipped %d" % stats['framesSkipped']]
+        timers = stats['timers']
+        if timers:
+            parts.append(' '.join("%s %.1f ms" % (name, timers[name]['recent_ms'])
+                                  for name in ('decode', 'buffer', 'prep', 'draw', 'canvas.draw') if name in timers))
+        if stats['fps'] is not None:
+            parts.append("%.1f fps of %.0f" % (stats['fps'], stats['requestedFps']))
+        self.statusBar().showMessage('  |  '.join(parts))
+
+    def spectrumToggled(self):
+
+        """ Shows the spectrum axes and their options below the time
+            domain plot, growing the window to fit them
+        """
+
+        shown = self.spectrumCheckBox.isChecked()
+        if shown:
+            self.resize(self.width, 925)
+            self.spectrum.show()
+            self.spectrum.start()
+        else:
+            self.spectrum.stop()
+            self.spectrum.hide()
+            self.resize(self.width, self.height)
+        for combo in self.spectrumOptions:
+            combo.setVisible(shown)
+
+    def spectrumChanged(self):
+        self.spectrum.configure(self.spectrumLength.currentData(), self.spectrumWindow.currentData(),
+                                self.spectrumAveraging.currentData())
+
     def enableChannel(self,channelObj,channel):
         
         """ Closure function for __enableChannel
@@ -478,7 +1312,9 @@ class Window(QMainWindow):
             channelD2 = self.channelD2.value()
             time      = self.time.value()
             self.enabledChannels[channel] = channelObj.isChecked()       
-            self.plot(self.enabledChannels, channelA1, channelA2, channelD1, channelD2)
+            self.spectrum.enabled = self.enabledChannels[:2]
+            self.measurements.enabled = list(self.enabledChannels)
+            self.plot(self.enabledChannels, channelA1, channelA2, channelD1, channelD2, time)
         
         return __enableChannel
         
@@ -507,27 +1343,28 @@ class Window(QMainWindow):
     def plot(self,enabledChannels=[False for i in range(4)], chA1=0, chA2=0, chD1=0, chD2=0, time=0):
         
         """ 
-            Sets timer and calls canvas plot internal function
+            Hands the settings to the frame pacer, which shows them from
+            its next frame on, and starts it if stopped
 
         """
         
-        if self.timer: #if timer is running stop and restart a new one
-            self.timer.stop()
-            self.timer.deleteLater()
-
-        self.timer = QtCore.QTimer(self)
-        self.timer.timeout.connect(self.canvas.plot(enabledChannels, chA1,chA2,chD1,chD2,time))
-        self.timer.start(2.5) 
-        
-        """
-            As 60Hz, indicates a 1/60 s or 16.6ms refreshing time. 
-            As we are partly refresshing the graph. Only 15% 
-            we shall refresh every 2.5ms 
-
-        """
+        self.pacer.configure(enabledChannels, chA1, chA2, chD1, chD2, time)
+        self.pacer.start()
 
     def stop(self):
-        self.timer.stop() #kill timer
+        self.pacer.stop() #screen freezes, acquisition goes on
+
+    def closeEvent(self, event):
+        self.pacer.stop()
+        self.canvas.stopRecording() #complete capture file, if any
+        self.canvas.reader.stop() #release serial reader thread
+        self.spectrum.stop()
+        self.measurements.stop()
+        self.statusTimer.stop()
+        if self.logger:
+            self.logger.stop()
+        self.canvas.reader.join() #port closed, or nothing reads the shared ring any more
+        super().closeEvent(event)
         
 
         
@@ -536,7 +1373,19 @@ class Window(QMainWindow):
     
 #Run GUI 
 
-App = QApplication(sys.argv)
-window = Window()
-window.show()
-sys.exit(App.exec())
+def main(port=None, processes=False):
+
+    """ Launches the oscilloscope window on a given port (or the board
+        found by com.findBoard), reading it from worker processes if asked
+        :returns:
+            The Qt application exit code
+    """
+
+    App = QApplication.instance() or QApplication(sys.argv)
+    window = Window(port, processes)
+    window.show()
+    return App.exec()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else None))
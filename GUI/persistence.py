@@ -0,0 +1,77 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : persistence.py
+## Description  : Phosphor-like accumulation of
+## points into a fading intensity image
+#################################################
+
+import time
+
+import numpy as np
+
+
+class Persistence:
+    """ Fixed size 2D histogram of the points drawn, fading away with a
+        half life like the phosphor of an analog scope, so glitches stay
+        visible for a while and frequent paths show brighter than rare
+        ones.
+
+        Points are binned all at once with np.bincount and the decay is
+        one multiplication per refresh, so both adding and drawing cost
+        depend on the image size and the points added, never on how many
+        were accumulated before. A half life of None never fades, 0 shows
+        only the points added since the last refresh.
+    """
+
+    def __init__(self, width, height, halfLife=0.5):
+        self.width = max(1, int(width))
+        self.height = max(1, int(height))
+        self.halfLife = halfLife
+        self.clear()
+
+    def clear(self):
+        self.image = np.zeros((self.height, self.width), dtype=np.float32)
+        self.last = None #time of the last fade
+        self.points = 0 #points accumulated since cleared
+
+    def fade(self, now=None):
+
+        """ Decays the image by the time elapsed since the last call
+        """
+
+        now = time.perf_counter() if now is None else now
+        if self.last is not None and self.halfLife is not None:
+            self.image *= np.float32(0.5**((now - self.last)/self.halfLife) if self.halfLife > 0 else 0.0)
+        self.last = now
+
+    def add(self, x, y):
+
+        """ Accumulates points given as fractions (0-1) of the width and
+            height, points outside are dropped
+        """
+
+        columns = np.floor(np.asarray(x)*self.width).astype(np.intp)
+        rows = np.floor(np.asarray(y)*self.height).astype(np.intp)
+        inside = (columns >= 0) & (columns < self.width) & (rows >= 0) & (rows < self.height)
+        bins = rows[inside]*self.width + columns[inside]
+        self.image += np.bincount(bins, minlength=self.image.size).reshape(self.image.shape).astype(np.float32)
+        self.points += len(bins)
+
+    def levels(self):
+
+        """ :returns:
+                The image as uint8 levels on a log scale, 1 to 255 up to
+                the brightest pixel and 0 where (almost) nothing is left,
+                e.g. to index a palette with
+        """
+
+        image = np.log1p(self.image)
+        top = image.max()
+        if top <= 0:
+            return np.zeros(image.shape, dtype=np.uint8)
+        levels = (image*(254/top)).astype(np.uint8) + 1
+        levels[self.image < 0.01] = 0
+        return levels
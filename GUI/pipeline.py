@@ -0,0 +1,274 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : pipeline.py
+## Description  : Acquisition and analysis stages
+## running in worker processes over a shared ring
+#################################################
+
+""" Pipeline mode: the serial port is read and decoded by one worker
+    process and every analysis stage runs in a worker process of its
+    own, all of them attached to one buffers.SharedSampleRing. Samples
+    are written once into shared memory and read in place; only the
+    ring's name, stage settings and small results (stats, measurements,
+    spectra) go through multiprocessing queues. The process that owns
+    the Pipeline only maps the ring, e.g. to render it.
+
+    Workers are spawned, not forked, so they do not inherit the Qt or
+    serial threads of the GUI process.
+"""
+
+import multiprocessing
+import queue
+import sys
+import time
+
+from acquisition import AcquisitionThread
+from buffers import SharedSampleRing
+from com import BAUDRATES, DECODERS, SAMPLE_RATE, findBoard, negotiate, openPort
+from measurements import Measurements
+from spectrum import Spectrum
+
+
+CONTEXT = multiprocessing.get_context('spawn')
+
+
+def publish(results, value):
+
+    """ Replaces whatever is waiting in a results queue by value, so the
+        reader always gets the newest one and the queue never grows
+    """
+
+    try:
+        while True:
+            results.get_nowait()
+    except queue.Empty:
+        pass
+    results.put(value)
+
+
+def finish(process, timeout=2.0):
+
+    """ Waits for a stopped worker process, terminating it if it does not
+        finish in time
+    """
+
+    if process.pid is None: #never started
+        return
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+
+
+class MeasureStage:
+    """ Measurements of the four channels over a window of samples
+    """
+
+    def __init__(self, window=SAMPLE_RATE, rate=SAMPLE_RATE):
+        self.measurements = Measurements(window, rate)
+
+    def feed(self, block):
+        self.measurements.feed(block)
+
+    def result(self):
+        return self.measurements.measure()
+
+
+class SpectrumStage:
+    """ Spectra of the analog channels, options as for spectrum.Spectrum.
+        Results are the magnitudes of every channel, None until its first
+        frame
+    """
+
+    def __init__(self, channels=(0, 1), **options):
+        self.channels = channels
+        self.spectra = [Spectrum(**options) for channel in channels]
+
+    def feed(self, block):
+        for spectrum, channel in zip(self.spectra, self.channels):
+            spectrum.feed(block[channel])
+
+    def restart(self):
+        for spectrum in self.spectra:
+            spectrum.restart()
+
+    def result(self):
+        return [spectrum.magnitude() for spectrum in self.spectra]
+
+
+class AcquisitionProcess(CONTEXT.Process):
+    """ Worker process reading a board into a SharedSampleRing, with the
+        same AcquisitionThread as single process mode. Its stats are
+        published every period seconds
+    """
+
+    def __init__(self, port, ring, protocol='frames', baudrate=BAUDRATES[0], period=0.5):
+        super().__init__(daemon=True)
+        self.port = port
+        self.ring = ring
+        self.protocol = protocol
+        self.baudrate = baudrate
+        self.period = period
+        self.results = CONTEXT.Queue()
+        self.running = CONTEXT.Event()
+        self.running.set()
+
+    def run(self):
+        dataSerial = openPort([self.port], BAUDRATES[0]) if self.port else findBoard(sys.platform, BAUDRATES[0])
+        if dataSerial is None:
+            publish(self.results, {'error': 'No BOB board found on %s' % (self.port or 'any port')})
+            return
+        protocol = 'frames'
+        if (self.protocol, self.baudrate) != (protocol, BAUDRATES[0]) and negotiate(dataSerial, self.protocol, self.baudrate):
+            protocol = self.protocol
+
+        reader = AcquisitionThread(dataSerial, self.ring, DECODERS[protocol](), closePort=False)
+        reader.start()
+        try:
+            while self.running.is_set() and reader.is_alive():
+                publish(self.results, dict(reader.stats, protocol=protocol))
+                time.sleep(self.period)
+        finally:
+            reader.stop()
+            reader.join()
+            if dataSerial.baudrate != BAUDRATES[0] or protocol != 'frames':
+                negotiate(dataSerial, 'frames', BAUDRATES[0]) #leave the board as found
+            dataSerial.close()
+            self.ring.close()
+
+    def stop(self):
+        self.running.clear()
+
+
+class AnalysisProcess(CONTEXT.Process):
+    """ Worker process feeding a stage (an object with feed(block) and
+        result()) from a SharedSampleRing through a cursor of its own and
+        publishing its result every period seconds. Stages with restart()
+        are restarted when samples were overwritten before being read
+    """
+
+    def __init__(self, ring, stage, period=0.1):
+        super().__init__(daemon=True)
+        self.ring = ring
+        self.stage = stage
+        self.period = period
+        self.results = CONTEXT.Queue()
+        self.running = CONTEXT.Event()
+        self.running.set()
+
+    def run(self):
+        cursor = self.ring.written
+        try:
+            while self.running.is_set():
+                time.sleep(self.period)
+                block, cursor, lost = self.ring.read(cursor)
+                if lost and hasattr(self.stage, 'restart'):
+                    self.stage.restart()
+                if len(block[0]):
+                    self.stage.feed(block)
+                    publish(self.results, self.stage.result())
+        finally:
+            self.ring.close()
+
+    def stop(self):
+        self.running.clear()
+
+
+class Pipeline:
+    """ Acquisition and analysis workers around one SharedSampleRing.
+
+        Used as the reader of a Scope or MplCanvas: start(), stop(),
+        join(), is_alive() and ``stats`` behave like AcquisitionThread's,
+        except that start() waits for the board to be opened and raises
+        EnvironmentError if there is none.
+        Stages can be added (or replaced) while running and the newest
+        result of each one is returned by result(name). join() also
+        releases the ring, after which it must not be read.
+    """
+
+    def __init__(self, port=None, capacity=1 << 17, stages=None, protocol='frames', baudrate=BAUDRATES[0]):
+        self.ring = SharedSampleRing(capacity)
+        self.sampleRate = SAMPLE_RATE
+        self.acquisition = AcquisitionProcess(port, self.ring, protocol, baudrate)
+        self.workers = {}
+        self.last = {} #newest result of every stage (None: acquisition stats)
+        self.started = False
+        for name, stage in (stages or {}).items():
+            self.add(name, stage)
+
+    def add(self, name, stage):
+
+        """ Runs a stage in a worker of its own, replacing the one with
+            the same name if any
+        """
+
+        if name in self.workers:
+            self.workers[name].stop()
+            finish(self.workers[name]) #within its period, no process left behind
+        self.workers[name] = AnalysisProcess(self.ring, stage)
+        self.last.pop(name, None)
+        if self.started:
+            self.workers[name].start()
+
+    def remove(self, name):
+
+        """ Stops the worker of a stage, if any
+        """
+
+        worker = self.workers.pop(name, None)
+        if worker is not None:
+            worker.stop()
+            finish(worker)
+        self.last.pop(name, None)
+
+    def start(self, timeout=30.0):
+        self.started = True
+        self.acquisition.start()
+        for worker in self.workers.values():
+            worker.start()
+        try:
+            stats = self.last[None] = self.acquisition.results.get(timeout=timeout)
+        except queue.Empty:
+            stats = {'error': 'No answer from the acquisition process'}
+        if 'error' in stats:
+            self.stop()
+            self.join()
+            raise EnvironmentError(stats['error'])
+        return self
+
+    def stop(self):
+        self.acquisition.stop()
+        for worker in self.workers.values():
+            worker.stop()
+
+    def join(self, timeout=2.0):
+        for process in [self.acquisition] + list(self.workers.values()):
+            finish(process, timeout)
+        self.ring.close()
+
+    def is_alive(self):
+        return self.acquisition.is_alive()
+
+    def _latest(self, name, results):
+        try:
+            while True:
+                self.last[name] = results.get_nowait()
+        except queue.Empty:
+            pass
+        return self.last.get(name)
+
+    def result(self, name):
+
+        """ :returns:
+                The newest result of a stage, None before the first one
+        """
+
+        worker = self.workers.get(name)
+        return self._latest(name, worker.results) if worker else None
+
+    @property
+    def stats(self):
+        return self._latest(None, self.acquisition.results) or {}
@@ -0,0 +1,249 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : pyramid.py
+## Description  : Multi-resolution min/max summaries
+## of a channel's whole history
+#################################################
+
+import numpy as np
+
+
+class MinMaxPyramid:
+    """ Min/max summaries of a channel's whole history at every zoom
+        level, kept up to date as samples are appended.
+
+        Level 0 holds the minimum and maximum of every bucket of base
+        samples and every level above merges fan buckets of the one
+        below, so level k buckets span base*fan**k samples. Appending
+        only computes the buckets a block completes, whatever the history
+        length. A view of any range is answered from the coarsest level
+        whose buckets are still no wider than a pixel, reading fewer than
+        fan buckets per pixel: its cost depends on the pixels, not on the
+        range or on how long the history is.
+
+        Samples are kept in memory, or given as data (e.g. the memory
+        mapped samples of a capture, see recorder.CaptureReader.pyramids)
+        and then never copied. levels, as returned by levels(), skips
+        summarizing data again; summarize=False skips it too, and views
+        are then only a sample per column picked by stride, e.g. to show
+        a capture while its levels are built.
+
+        With a depth only the last depth samples (up to twice as many) are
+        kept: old ones are dropped in whole buckets of the top level, which
+        is the widest no wider than depth, so every level stays aligned to
+        absolute sample numbers. Otherwise everything is.
+    """
+
+    def __init__(self, dtype=np.uint16, base=16, fan=4, data=None, levels=None, depth=None, summarize=True):
+        self.base = base
+        self.fan = fan
+        self.depth = depth
+        self.top = None #highest level kept
+        if depth is not None:
+            self.top = 0
+            while self._size(self.top + 1) <= depth:
+                self.top += 1
+        self.external = data is not None
+        self.data = np.zeros(1 << 16, dtype=dtype) if data is None else data
+        self.written = 0 if data is None else len(data) #samples ever appended
+        self.start = 0 #oldest sample held, data[0]
+        self.lows = [] #bucket minima of every level
+        self.highs = []
+        self.counts = [] #buckets completed in every level
+        for low, high in levels or ():
+            self.lows.append(np.array(low))
+            self.highs.append(np.array(high))
+            self.counts.append(len(low))
+        self.summarized = summarize or levels is not None
+        if self.summarized:
+            self._summarize()
+
+    def __len__(self):
+        return self.written
+
+    def _size(self, level):
+        return self.base*self.fan**level if level >= 0 else 1
+
+    def _level(self, level):
+
+        """ :returns:
+                A tuple (lows, highs, count) of a level, level -1 being
+                the samples themselves
+        """
+
+        if level < 0:
+            return self.data, self.data, self.written
+        return self.lows[level], self.highs[level], self.counts[level]
+
+    def _offset(self, level):
+
+        """ :returns:
+                Bucket number (sample number for level -1) of the first one
+                held in a level
+        """
+
+        return self.start//self._size(level)
+
+    def append(self, block):
+
+        """ Appends a block of samples and the buckets it completes
+        """
+
+        n = len(block)
+        held = self.written - self.start
+        if held + n > len(self.data):
+            if self.external:
+                raise ValueError('samples given as data cannot be appended to')
+            data = np.zeros(max(2*(held + n), 1 << 16), dtype=self.data.dtype)
+            data[:held] = self.data[:held]
+            self.data = data
+        self.data[held:held + n] = block
+        self.written += n
+        self._summarize()
+        if self.depth is not None and held + n >= self.depth + self._size(self.top):
+            self.discard(self.written - self.depth)
+
+    def discard(self, before):
+
+        """ Forgets the samples older than before, rounded down to whole
+            buckets of the top level
+        """
+
+        size = self._size(self.top)
+        drop = before//size*size - self.start
+        if drop <= 0:
+            return
+        for level in range(-1, len(self.counts)):
+            lows, highs, count = self._level(level)
+            held, shift = count - self._offset(level), drop//self._size(level)
+            for array in (lows, highs) if level >= 0 else (lows,):
+                array[:held - shift] = array[shift:held].copy()
+        self.start += drop
+
+    def _summarize(self):
+        level = 0
+        while self.written >= self._size(level) and (self.top is None or level <= self.top):
+            if level == len(self.counts):
+                self.lows.append(np.zeros(1024, dtype=self.data.dtype))
+                self.highs.append(np.zeros(1024, dtype=self.data.dtype))
+                self.counts.append(self._offset(level))
+            done, complete = self.counts[level], self.written//self._size(level)
+            if complete > done:
+                #new buckets from the level below (the samples for level 0)
+                group = self.base if level == 0 else self.fan
+                lows, highs, _ = self._level(level - 1)
+                below = self._offset(level - 1)
+                first, last = done*group - below, complete*group - below
+                self._store(level, lows[first:last].reshape(-1, group).min(axis=1),
+                            highs[first:last].reshape(-1, group).max(axis=1))
+            level += 1
+
+    def _store(self, level, low, high):
+        held = self.counts[level] - self._offset(level)
+        if held + len(low) > len(self.lows[level]):
+            size = 2*(held + len(low))
+            for arrays in (self.lows, self.highs):
+                grown = np.zeros(size, dtype=self.data.dtype)
+                grown[:held] = arrays[level][:held]
+                arrays[level] = grown
+        self.lows[level][held:held + len(low)] = low
+        self.highs[level][held:held + len(high)] = high
+        self.counts[level] += len(low)
+
+    def levels(self):
+
+        """ :returns:
+                A list of (lows, highs) of every level, e.g. to be saved
+                and given back to a new pyramid over the same data
+        """
+
+        return [(self.lows[level][:count - self._offset(level)], self.highs[level][:count - self._offset(level)])
+                for level, count in enumerate(self.counts)]
+
+    def extent(self, start, stop):
+
+        """ Minimum and maximum of samples start to stop, from the
+            coarsest buckets that fit in the range and the samples at its
+            ends, so it costs about 2*fan buckets per level
+            :returns:
+                A tuple (low, high), None for an empty range
+        """
+
+        start, stop = max(self.start, start), min(stop, self.written)
+        if start >= stop:
+            return None
+        lows, highs = [], []
+        level, first, last = -1, start, stop #range in buckets of level
+        while level + 1 < len(self.counts):
+            group = self.base if level < 0 else self.fan
+            up = -(-first//group)
+            down = min(last//group, self.counts[level + 1])
+            if up >= down:
+                break
+            #ends that do not fill a bucket of the level above stay at this one
+            offset = self._offset(level)
+            for a, b in ((first, up*group), (down*group, last)):
+                if a < b:
+                    levelLows, levelHighs, _ = self._level(level)
+                    lows.append(levelLows[a - offset:b - offset].min())
+                    highs.append(levelHighs[a - offset:b - offset].max())
+            level, first, last = level + 1, up, down
+        levelLows, levelHighs, _ = self._level(level)
+        offset = self._offset(level)
+        lows.append(levelLows[first - offset:last - offset].min())
+        highs.append(levelHighs[first - offset:last - offset].max())
+        return min(lows), max(highs)
+
+    def view(self, start, stop, pixels):
+
+        """ Samples start to stop reduced to about two points per pixel,
+            the minimum and maximum of the samples under each pixel
+            column. Columns are aligned to absolute sample numbers, so
+            panning does not make the trace shimmer
+            :returns:
+                A tuple (indexes, values) like decimation.Decimator's,
+                indexes being absolute sample numbers
+        """
+
+        start, stop = max(self.start, start), min(stop, self.written)
+        pixels = max(1, int(pixels))
+        perPixel = (stop - start)/pixels
+        if perPixel < 2: #every sample
+            return np.arange(start, stop), self.data[start - self.start:stop - self.start]
+        if not self.summarized: #one sample per column, as both its minimum and maximum
+            indexes = np.repeat(np.arange(start, stop, int(perPixel)), 2)
+            return indexes, self.data[indexes - self.start]
+
+        level = -1
+        while level + 1 < len(self.counts) and self._size(level + 1) <= perPixel:
+            level += 1
+        size = self._size(level)
+        column = size*int(perPixel//size)
+        group = column//size
+        lows, highs, count = self._level(level)
+        offset = self._offset(level)
+
+        #whole columns from this level, the partial ones at both ends from extent()
+        first = -(-start//column)*column
+        end = max(min(stop//size, count), first//size)
+        buckets = np.arange(first//size, end, group)
+        at = [buckets*size]
+        low = [np.minimum.reduceat(lows[:end - offset], buckets - offset) if len(buckets) else lows[:0]]
+        high = [np.maximum.reduceat(highs[:end - offset], buckets - offset) if len(buckets) else highs[:0]]
+        for position, edge in ((0, (start, min(first, stop))), (None, (max(end*size, start), stop))):
+            extent = self.extent(*edge)
+            if extent is not None:
+                position = len(at) if position is None else position
+                at.insert(position, [edge[0]])
+                low.insert(position, [extent[0]])
+                high.insert(position, [extent[1]])
+        at = np.concatenate(at)
+
+        indexes = np.repeat(at, 2)
+        values = np.empty(2*len(at), dtype=self.data.dtype)
+        values[0::2] = np.concatenate(low)
+        values[1::2] = np.concatenate(high)
+        return indexes, values
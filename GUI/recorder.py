@@ -0,0 +1,317 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : recorder.py
+## Description  : Capture of decoded samples to
+## disk and memory mapped playback
+#################################################
+
+""" Capture file layout (little endian):
+
+    header   HEADER_SIZE bytes, see HEADER_FORMAT
+    samples  SAMPLE_DTYPE records, contiguous from the first to the last
+             chunk so sample n is always at HEADER_SIZE + n*itemsize
+    index    INDEX_DTYPE entries, one per chunk written, appended on close
+
+    A capture that was never closed has indexOffset 0; its samples are
+    still readable, only the chunk timestamps are missing.
+"""
+
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from com import SAMPLE_RATE
+from logic import EdgeStore
+from pyramid import MinMaxPyramid
+
+
+MAGIC = b'BOBCAP\x00\x01'
+VERSION = 1
+
+#magic, version, channels, sample rate, start time, V/div settings of the
+#four channels and time base, total samples, index offset, index entries
+HEADER_FORMAT = '<8sHHdd5BxxxQQQ'
+HEADER_SIZE = 64
+
+SAMPLE_DTYPE = np.dtype([('a1', '<u2'), ('a2', '<u2'), ('d1', 'u1'), ('d2', 'u1')])
+INDEX_DTYPE = np.dtype([('sample', '<u8'), ('count', '<u4'), ('time', '<f8')])
+
+#min/max pyramid levels cached next to a capture, see CaptureReader.pyramids
+LEVELS_SUFFIX = '.levels.npz'
+
+
+class CaptureWriter:
+    """ Streams sample blocks into a capture file.
+
+        Blocks are gathered in memory and appended to the file in chunks
+        of chunkSize samples, each chunk gets an index entry with the
+        arrival time of its first sample.
+    """
+
+    def __init__(self, path, sampleRate=SAMPLE_RATE, scales=(0, 0, 0, 0, 0), chunkSize=1 << 16):
+        self.path = path
+        self.sampleRate = sampleRate
+        self.scales = tuple(scales)
+        self.startTime = time.time()
+        self.file = open(path, 'wb')
+        self.buffer = np.zeros(chunkSize, dtype=SAMPLE_DTYPE)
+        self.buffered = 0
+        self.bufferTime = None
+        self.samples = 0 #samples already on disk
+        self.index = []
+        self._writeHeader(0, 0)
+
+    def _writeHeader(self, indexOffset, indexCount):
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, 4, self.sampleRate, self.startTime,
+                             *self.scales, self.samples, indexOffset, indexCount)
+        self.file.seek(0)
+        self.file.write(header.ljust(HEADER_SIZE, b'\x00'))
+        self.file.seek(0, 2)
+
+    def write(self, channelA1, channelA2, channelD1, channelD2, timestamp=None):
+
+        """ Queues a block of samples, flushing every full chunk to disk
+        """
+
+        now = time.time() if timestamp is None else timestamp
+        done = 0
+        while done < len(channelA1):
+            if self.buffered == 0:
+                self.bufferTime = now
+            n = min(len(channelA1) - done, len(self.buffer) - self.buffered)
+            chunk = self.buffer[self.buffered:self.buffered + n]
+            chunk['a1'] = channelA1[done:done + n]
+            chunk['a2'] = channelA2[done:done + n]
+            chunk['d1'] = channelD1[done:done + n]
+            chunk['d2'] = channelD2[done:done + n]
+            self.buffered += n
+            done += n
+            if self.buffered == len(self.buffer):
+                self.flush()
+
+    def flush(self):
+
+        """ Appends the gathered samples to the file as one chunk
+        """
+
+        if self.buffered == 0:
+            return
+        self.file.write(self.buffer[:self.buffered].tobytes())
+        self.index.append((self.samples, self.buffered, self.bufferTime))
+        self.samples += self.buffered
+        self.buffered = 0
+
+    def close(self):
+
+        """ Flushes pending samples, appends the chunk index and completes
+            the header
+        """
+
+        self.flush()
+        indexOffset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=INDEX_DTYPE).tobytes())
+        self._writeHeader(indexOffset, len(self.index))
+        self.file.close()
+
+
+class CaptureReader:
+    """ Memory mapped view of a capture file.
+
+        Nothing is loaded up front, so a capture of any length opens
+        instantly and any range of it is sliced straight from the mapping.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        fields = struct.unpack(HEADER_FORMAT, header[:struct.calcsize(HEADER_FORMAT)])
+        if fields[0] != MAGIC:
+            raise ValueError('%s is not a BOB capture' % path)
+        (_, self.version, self.channels, self.sampleRate, self.startTime,
+         *scales, total, indexOffset, indexCount) = fields
+        self.scales = tuple(scales)
+
+        if indexOffset == 0: #never closed, trust the file size
+            total = (os.path.getsize(path) - HEADER_SIZE) // SAMPLE_DTYPE.itemsize
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        else:
+            self.index = np.memmap(path, dtype=INDEX_DTYPE, mode='r', offset=indexOffset, shape=(indexCount,))
+
+        self.samples = np.memmap(path, dtype=SAMPLE_DTYPE, mode='r', offset=HEADER_SIZE, shape=(total,)) \
+            if total else np.zeros(0, dtype=SAMPLE_DTYPE)
+        self.summary = None #pyramids() with their levels, once built
+
+    def __len__(self):
+        return len(self.samples)
+
+    def duration(self):
+
+        """ :returns:
+                Length of the capture in seconds
+        """
+
+        return len(self.samples)/self.sampleRate
+
+    def slice(self, start, stop):
+
+        """ Samples between start and stop seconds from the beginning
+            :returns:
+                A tuple of the four channel arrays (memory mapped views)
+        """
+
+        block = self.samples[int(start*self.sampleRate):int(stop*self.sampleRate)]
+        return block['a1'], block['a2'], block['d1'], block['d2']
+
+    def edges(self, channel='d1', chunk=1 << 20):
+
+        """ Edge list of a digital channel ('d1' or 'd2'), built a chunk
+            of the mapping at a time so captures of any length fit
+            :returns:
+                A logic.EdgeStore of the whole capture
+        """
+
+        store = EdgeStore()
+        for first in range(0, len(self.samples), chunk):
+            store.append(self.samples[channel][first:first + chunk])
+        return store
+
+    def pyramids(self, background=False):
+
+        """ Min/max pyramids of the four channels over the mapped samples
+            for zooming through the whole capture. Their levels are saved
+            next to the capture (path + LEVELS_SUFFIX) the first time, so
+            later opens do not scan the samples again. In background, a
+            first open returns at once pyramids without levels (see
+            MinMaxPyramid's summarize) and a thread builds the real ones,
+            found in ``summary`` when done
+            :returns:
+                A list of four pyramid.MinMaxPyramid
+        """
+
+        names = SAMPLE_DTYPE.names
+        try:
+            with np.load(self.path + LEVELS_SUFFIX) as saved:
+                if int(saved['samples']) == len(self.samples):
+                    levels = [[(saved['%s_%d_low' % (name, level)], saved['%s_%d_high' % (name, level)])
+                               for level in range(int(saved['%s_levels' % name]))] for name in names]
+                    self.summary = [MinMaxPyramid(self.samples.dtype[name], data=self.samples[name], levels=level)
+                                    for name, level in zip(names, levels)]
+                    return self.summary
+        except (OSError, KeyError, ValueError): #missing, stale or not ours: rebuilt below
+            pass
+
+        if not background:
+            self._summarize()
+            return self.summary
+        threading.Thread(target=self._summarize, daemon=True).start()
+        return [MinMaxPyramid(self.samples.dtype[name], data=self.samples[name], summarize=False) for name in names]
+
+    def _summarize(self):
+
+        """ Builds the pyramids with their levels into summary, saving
+            the levels
+        """
+
+        names = SAMPLE_DTYPE.names
+        pyramids = [MinMaxPyramid(self.samples.dtype[name], data=self.samples[name]) for name in names]
+        arrays = {'samples': len(self.samples)}
+        for name, pyramid in zip(names, pyramids):
+            arrays['%s_levels' % name] = len(pyramid.counts)
+            for level, (low, high) in enumerate(pyramid.levels()):
+                arrays['%s_%d_low' % (name, level)] = low
+                arrays['%s_%d_high' % (name, level)] = high
+        try:
+            with open(self.path + LEVELS_SUFFIX, 'wb') as f:
+                np.savez(f, **arrays)
+        except OSError: #e.g. read only directory, they just are not kept
+            pass
+        self.summary = pyramids
+
+    def timeOf(self, sample):
+
+        """ Wall clock time a sample arrived at, interpolated from the
+            chunk index
+        """
+
+        if len(self.index) == 0:
+            return self.startTime + sample/self.sampleRate
+        chunk = max(0, np.searchsorted(self.index['sample'], sample, side='right') - 1)
+        entry = self.index[chunk]
+        return float(entry['time']) + (sample - int(entry['sample']))/self.sampleRate
+
+
+class RecorderThread(threading.Thread):
+    """ Consumer of a SampleRing that streams everything it publishes into
+        a CaptureWriter, keeping disk writes off the acquisition thread
+    """
+
+    def __init__(self, ring, writer, period=0.05):
+        super().__init__(daemon=True)
+        self.ring = ring
+        self.writer = writer
+        self.period = period
+        self.cursor = ring.written
+        self.lost = 0
+        self.running = threading.Event()
+        self.running.set()
+
+    def run(self):
+        while self.running.is_set():
+            self._drain()
+            time.sleep(self.period)
+        self._drain()
+        self.writer.close()
+
+    def _drain(self):
+        block, self.cursor, lost = self.ring.read(self.cursor)
+        self.lost += lost
+        self.writer.write(*block)
+
+    def stop(self):
+
+        """ Writes what is left and closes the capture
+        """
+
+        self.running.clear()
+
+
+class PlaybackThread(threading.Thread):
+    """ Feeds a capture into a SampleRing at its recorded rate (times
+        speed) so it can be displayed in place of the serial port
+    """
+
+    def __init__(self, reader, ring, speed=1.0, loop=True, period=0.01):
+        super().__init__(daemon=True)
+        self.reader = reader
+        self.ring = ring
+        self.speed = speed
+        self.loop = loop
+        self.period = period
+        self.running = threading.Event()
+        self.running.set()
+
+    def run(self):
+        position = 0
+        start = time.perf_counter()
+        while self.running.is_set() and len(self.reader):
+            #everything that would have arrived by now on a live port
+            due = int((time.perf_counter() - start)*self.reader.sampleRate*self.speed)
+            block = self.reader.samples[position:due]
+            self.ring.write(block['a1'], block['a2'], block['d1'], block['d2'])
+            position += len(block)
+            if position >= len(self.reader):
+                if not self.loop:
+                    break
+                position = 0
+                start = time.perf_counter()
+            time.sleep(self.period)
+
+    def stop(self):
+        self.running.clear()
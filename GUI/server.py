@@ -0,0 +1,292 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : server.py
+## Description  : Local publish/subscribe server for
+## decoded sample blocks and its client side
+#################################################
+
+""" Stream format (little endian), after connecting:
+
+    hello    HELLO_FORMAT: magic, version, sample rate
+    blocks   BLOCK_FORMAT header (first sample number, sample count)
+             followed by count uint16 A1 codes, count uint16 A2 codes
+             and D1 and D2 packed 8 samples per byte (np.packbits,
+             little bit order), ceil(count/8) bytes each
+
+    Addresses are "tcp://host:port" or "unix:///path/to/socket".
+"""
+
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from com import SAMPLE_RATE
+
+
+MAGIC = b'BOBSTRM\x00'
+VERSION = 1
+HELLO_FORMAT = '<8sHd'
+BLOCK_FORMAT = '<QI'
+HELLO_SIZE = struct.calcsize(HELLO_FORMAT)
+BLOCK_SIZE = struct.calcsize(BLOCK_FORMAT)
+
+
+def isAddress(port):
+    return isinstance(port, str) and (port.startswith('tcp://') or port.startswith('unix://'))
+
+
+def parseAddress(address):
+
+    """ :returns:
+            A tuple (family, socket address) for an address string
+    """
+
+    if address.startswith('unix://'):
+        return socket.AF_UNIX, address[len('unix://'):]
+    if address.startswith('tcp://'):
+        host, _, port = address[len('tcp://'):].rpartition(':')
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    raise ValueError('Unknown address %s' % address)
+
+
+def encodeBlock(first, channelA1, channelA2, channelD1, channelD2):
+
+    """ Serializes a block of samples starting at sample number first
+        :returns:
+            The bytes of the block message
+    """
+
+    return b''.join((struct.pack(BLOCK_FORMAT, first, len(channelA1)),
+                     np.asarray(channelA1, dtype='<u2').tobytes(),
+                     np.asarray(channelA2, dtype='<u2').tobytes(),
+                     np.packbits(channelD1, bitorder='little').tobytes(),
+                     np.packbits(channelD2, bitorder='little').tobytes()))
+
+
+def blockSize(count):
+    return BLOCK_SIZE + 4*count + 2*((count + 7)//8)
+
+
+def decodeBlock(data):
+
+    """ Parses one block message (header included)
+        :returns:
+            A tuple (first, block) where block is a tuple of the four
+            channel arrays
+    """
+
+    first, count = struct.unpack_from(BLOCK_FORMAT, data)
+    packed = (count + 7)//8
+    offset = BLOCK_SIZE
+    channelA1 = np.frombuffer(data, dtype='<u2', count=count, offset=offset)
+    channelA2 = np.frombuffer(data, dtype='<u2', count=count, offset=offset + 2*count)
+    offset += 4*count
+    channelD1 = np.unpackbits(np.frombuffer(data, np.uint8, packed, offset), count=count, bitorder='little')
+    channelD2 = np.unpackbits(np.frombuffer(data, np.uint8, packed, offset + packed), count=count, bitorder='little')
+    return first, (channelA1, channelA2, channelD1, channelD2)
+
+
+class SampleServer(threading.Thread):
+    """ Fans the samples published in a SampleRing out to any number of
+        local clients.
+
+        Every block is read from the ring and encoded once, then queued
+        for each client. Sockets are non-blocking and serviced by one
+        selector loop, so a slow client only grows its own queue; once
+        that passes maxQueued bytes the client is dropped. Acquisition
+        writes the ring on its own thread and is never held up.
+    """
+
+    def __init__(self, ring, address, rate=SAMPLE_RATE, period=0.02, maxQueued=1 << 20):
+        super().__init__(daemon=True)
+        self.ring = ring
+        self.address = address
+        self.rate = rate
+        self.period = period
+        self.maxQueued = maxQueued
+        self.cursor = ring.written
+        self.clients = {} #socket -> bytearray of queued bytes
+        self.stats = {'clients': 0, 'served': 0, 'dropped': 0, 'bytesSent': 0, 'lost': 0}
+
+        family, self.socketAddress = parseAddress(address)
+        if family == socket.AF_UNIX and os.path.exists(self.socketAddress):
+            os.unlink(self.socketAddress)
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(self.socketAddress)
+        self.listener.listen()
+        self.listener.setblocking(False)
+        if family == socket.AF_INET: #port 0 picks a free one
+            self.address = 'tcp://%s:%d' % self.listener.getsockname()[:2]
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.running = threading.Event()
+        self.running.set()
+
+    def run(self):
+        publish = time.perf_counter()
+        while self.running.is_set():
+            for key, events in self.selector.select(timeout=max(0, publish - time.perf_counter())):
+                if key.fileobj is self.listener:
+                    self._accept()
+                elif events & selectors.EVENT_READ:
+                    self._drop(key.fileobj, counted=False) #clients never send, readable means closed
+                else:
+                    self._send(key.fileobj)
+            if time.perf_counter() >= publish:
+                self._publish()
+                publish = time.perf_counter() + self.period
+
+        for client in list(self.clients):
+            self._drop(client, counted=False)
+        self.selector.close()
+        self.listener.close()
+
+    def _accept(self):
+        try:
+            client, _ = self.listener.accept()
+        except BlockingIOError:
+            return
+        client.setblocking(False)
+        self.clients[client] = bytearray(struct.pack(HELLO_FORMAT, MAGIC, VERSION, self.rate))
+        self.selector.register(client, selectors.EVENT_READ)
+        self.stats['clients'] = len(self.clients)
+        self.stats['served'] += 1
+        self._send(client)
+
+    def _publish(self):
+        start = self.cursor
+        block, self.cursor, lost = self.ring.read(self.cursor)
+        self.stats['lost'] += lost
+        if len(block[0]) == 0 or not self.clients:
+            return
+        message = encodeBlock(start + lost, *block)
+        for client, queued in list(self.clients.items()):
+            if len(queued) + len(message) > self.maxQueued: #too slow, let it go
+                self._drop(client)
+                continue
+            queued += message
+            self._send(client)
+
+    def _send(self, client):
+        queued = self.clients.get(client)
+        if not queued:
+            return
+        try:
+            sent = client.send(queued)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._drop(client, counted=False)
+            return
+        del queued[:sent]
+        self.stats['bytesSent'] += sent
+        #only wait for writability while something is left to send
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if queued else 0)
+        if self.selector.get_key(client).events != events:
+            self.selector.modify(client, events)
+
+    def _drop(self, client, counted=True):
+        if client not in self.clients: #already gone earlier in this pass
+            return
+        self.selector.unregister(client)
+        client.close()
+        del self.clients[client]
+        self.stats['clients'] = len(self.clients)
+        if counted:
+            self.stats['dropped'] += 1
+
+    def stop(self):
+
+        """ Disconnects every client and closes the server
+        """
+
+        self.running.clear()
+
+
+class SampleClient:
+    """ Blocking reader of a SampleServer stream
+    """
+
+    def __init__(self, address, timeout=5.0):
+        family, socketAddress = parseAddress(address)
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(socketAddress)
+        self.buffer = bytearray() #received bytes not consumed yet, kept across timeouts
+        magic, self.version, self.sampleRate = struct.unpack(HELLO_FORMAT, self._receive(HELLO_SIZE))
+        if magic != MAGIC:
+            raise ValueError('%s is not a BOB stream' % address)
+
+    def _fill(self, n):
+        while len(self.buffer) < n:
+            chunk = self.socket.recv(max(n - len(self.buffer), 1 << 16))
+            if not chunk:
+                raise EOFError('stream closed by the server')
+            self.buffer += chunk
+
+    def _receive(self, n):
+        self._fill(n)
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
+
+    def read(self):
+
+        """ Waits for the next block
+            :returns:
+                A tuple (first, block) like decodeBlock
+        """
+
+        self._fill(BLOCK_SIZE)
+        first, count = struct.unpack_from(BLOCK_FORMAT, self.buffer)
+        return decodeBlock(self._receive(blockSize(count)))
+
+    def close(self):
+        self.socket.close()
+
+
+class ClientThread(threading.Thread):
+    """ Feeds the blocks of a SampleServer stream into a local SampleRing
+        so the stream can be displayed or recorded in place of a serial
+        port. Samples the server skipped are counted in ``stats``
+    """
+
+    def __init__(self, address, ring):
+        super().__init__(daemon=True)
+        self.client = SampleClient(address)
+        self.client.socket.settimeout(0.2) #lets stop() be noticed
+        self.ring = ring
+        self.sampleRate = self.client.sampleRate
+        self.next = None
+        self.stats = {'lost': 0, 'connected': True}
+        self.running = threading.Event()
+        self.running.set()
+
+    def run(self):
+        while self.running.is_set():
+            try:
+                first, block = self.client.read()
+            except socket.timeout:
+                continue
+            except (EOFError, OSError):
+                break
+            if self.next is not None and first > self.next:
+                self.stats['lost'] += first - self.next
+            self.next = first + len(block[0])
+            self.ring.write(*block)
+        self.stats['connected'] = False
+        self.client.close()
+
+    def stop(self):
+        self.running.clear()
@@ -0,0 +1,145 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : spectrum.py
+## Description  : Incremental windowed FFT spectrum
+## of analog channels
+#################################################
+
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from com import SAMPLE_RATE, convertAnalog
+
+
+def flattop(length):
+    n = np.arange(length)*2*np.pi/(length - 1)
+    return (0.21557895 - 0.41663158*np.cos(n) + 0.277263158*np.cos(2*n)
+            - 0.083578947*np.cos(3*n) + 0.006947368*np.cos(4*n))
+
+
+WINDOWS = {
+    'hann': np.hanning,
+    'hamming': np.hamming,
+    'blackman': np.blackman,
+    'flattop': flattop,
+    'rectangular': np.ones,
+}
+
+AVERAGING = ('none', 'linear', 'exponential')
+
+
+@lru_cache(maxsize=None)
+def windowCoefficients(window, length):
+
+    """ Coefficients of a window function, computed once per window and
+        length
+        :returns:
+            A read only float array of length coefficients
+    """
+
+    if window not in WINDOWS:
+        raise ValueError('Unknown window %s' % window)
+    coefficients = WINDOWS[window](length).astype(np.float64)
+    coefficients.setflags(write=False)
+    return coefficients
+
+
+@lru_cache(maxsize=None)
+def frequencyBins(length, rate):
+
+    """ :returns:
+            A read only array with the frequency (Hz) of every rfft bin
+    """
+
+    bins = np.fft.rfftfreq(length, 1/rate)
+    bins.setflags(write=False)
+    return bins
+
+
+class Spectrum:
+    """ Averaged amplitude spectrum of one analog channel.
+
+        Samples are fed as they arrive and transformed in frames of length
+        samples overlapping by half, so only the frames completed by the
+        newly arrived samples are computed. Each frame's power spectrum is
+        folded into the average: 'none' keeps the newest one, 'linear' is
+        the mean of the last count frames and 'exponential' weights the
+        newest one by factor.
+    """
+
+    def __init__(self, length=1024, window='hann', averaging='exponential', count=8, factor=0.25,
+                 rate=SAMPLE_RATE):
+        if averaging not in AVERAGING:
+            raise ValueError('Unknown averaging %s' % averaging)
+        self.length = length
+        self.hop = length//2
+        self.averaging = averaging
+        self.factor = factor
+        self.coefficients = windowCoefficients(window, length)
+        self.frequencies = frequencyBins(length, rate)
+
+        #power of a bin -> volts of amplitude: a sine of amplitude A gives
+        #|X| = A*sum(w)/2, DC gives |X| = A*sum(w)
+        gain = np.full(len(self.frequencies), 2/self.coefficients.sum())
+        gain[0] /= 2
+        self.gain = gain**2
+
+        self.pending = np.zeros(0, dtype=np.uint16) #samples from the start of the next frame on
+        self.power = None
+        self.recent = np.zeros((count, len(self.frequencies))) #last count frames, for linear averaging
+        self.frames = 0
+
+    def restart(self):
+
+        """ Drops samples waiting for a frame, for when the next ones are
+            not contiguous with them (average is kept)
+        """
+
+        self.pending = self.pending[:0]
+
+    def feed(self, data):
+
+        """ Takes the next samples of the channel (raw ADC codes)
+            :returns:
+                True if the spectrum changed
+        """
+
+        data = np.concatenate((self.pending, data))
+        if len(data) < self.length:
+            self.pending = data
+            return False
+        count = (len(data) - self.length)//self.hop + 1
+        frames = sliding_window_view(data, self.length)[::self.hop][:count]
+        self.pending = data[count*self.hop:]
+
+        power = np.abs(np.fft.rfft(convertAnalog(frames)*self.coefficients, axis=1))**2
+        for spectrum in power:
+            self._average(spectrum)
+        return True
+
+    def _average(self, spectrum):
+        self.frames += 1
+        if self.power is None or self.averaging == 'none':
+            self.power = spectrum
+        elif self.averaging == 'exponential':
+            self.power += self.factor*(spectrum - self.power)
+        if self.averaging == 'linear':
+            slot = self.frames % len(self.recent)
+            self.recent[slot] = spectrum
+            self.power = self.recent.sum(axis=0)/min(self.frames, len(self.recent))
+
+    def magnitude(self):
+
+        """ :returns:
+                Amplitude of every frequency bin in dBV, or None before the
+                first frame
+        """
+
+        if self.power is None:
+            return None
+        return 10*np.log10(self.power*self.gain + 1e-20)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+#modules of the GUI folder import each other by name, as when run from it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
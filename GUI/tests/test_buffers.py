@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from buffers import ChannelStore, SampleRing
+
+
+def blocks(n, seed=0, largest=500):
+    """ n random samples of the four channels cut into blocks of random
+        sizes, empty ones included
+    """
+
+    rng = np.random.default_rng(seed)
+    data = (rng.integers(0, 4096, n).astype(np.uint16), rng.integers(0, 4096, n).astype(np.uint16),
+            rng.integers(0, 2, n).astype(np.uint8), rng.integers(0, 2, n).astype(np.uint8))
+    cuts = np.cumsum(rng.integers(0, largest, n))
+    cuts = np.r_[0, cuts[cuts < n], n]
+    return data, [tuple(channel[first:last] for channel in data) for first, last in zip(cuts[:-1], cuts[1:])]
+
+
+def checkBlock(block, data, start, stop):
+    assert all(len(channel) == stop - start for channel in block)
+    for channel, expected in zip(block, data):
+        assert channel.dtype == expected.dtype
+        assert np.array_equal(channel, expected[start:stop])
+
+
+@pytest.mark.parametrize('every', [1, 3, 10])
+def test_read_accounts_every_sample(every):
+    #a reader checking in every few writes either gets each sample or counts it as lost
+    data, pieces = blocks(20000, every)
+    ring, cursor, received, lostTotal = SampleRing(1000), 0, 0, 0
+    for i, piece in enumerate(pieces):
+        ring.write(*piece)
+        if i % every == 0 or i == len(pieces) - 1:
+            block, following, lost = ring.read(cursor)
+            assert lost == max(0, ring.written - ring.capacity - cursor)
+            checkBlock(block, data, cursor + lost, following)
+            received += following - cursor - lost
+            lostTotal += lost
+            cursor = following
+    assert cursor == len(data[0])
+    assert received + lostTotal == len(data[0])
+    assert received >= ring.capacity
+
+
+def test_count_skips_without_losing():
+    data, pieces = blocks(5000, 1)
+    ring = SampleRing(1000)
+    for piece in pieces:
+        ring.write(*piece)
+
+    block, cursor, lost = ring.read(4500, 100)
+    checkBlock(block, data, 4900, 5000)
+    assert cursor == 5000 and lost == 0
+    #skipping past what was overwritten still counts it as lost
+    block, cursor, lost = ring.read(3000, 200)
+    checkBlock(block, data, 4800, 5000)
+    assert lost == 1000
+    checkBlock(ring.latest(300), data, 4700, 5000)
+    checkBlock(ring.latest(5000), data, 4000, 5000)
+
+
+def test_read_drops_what_the_producer_is_overwriting():
+    data, pieces = blocks(5000, 2)
+    ring = SampleRing(1000)
+    for piece in pieces:
+        ring.write(*piece)
+
+    #as if a write of 300 samples had been reserved but not yet published
+    ring.reserved = ring.written + 300
+    block, cursor, lost = ring.read(4000)
+    checkBlock(block, data, 4300, 5000)
+    assert cursor == 5000 and lost == 300
+    block, lost = ring.slice(3500, 4600)
+    checkBlock(block, data, 4300, 4600)
+    assert lost == 800
+
+
+@pytest.mark.parametrize('start, stop', [(0, 5000), (3990, 4010), (4000, 5000), (4500, 4700), (4900, 6000),
+                                         (6000, 7000), (100, 200)])
+def test_slice_matches_brute_force(start, stop):
+    data, pieces = blocks(5000, 3)
+    ring = SampleRing(1000)
+    for piece in pieces:
+        ring.write(*piece)
+
+    block, lost = ring.slice(start, stop)
+    #samples 4000 to 5000 are held
+    stop = min(stop, 5000)
+    assert lost == max(0, min(stop, 4000) - start)
+    checkBlock(block, data, start + lost, max(start + lost, stop))
+
+
+@pytest.mark.parametrize('capacity', [1, 7, 1000])
+def test_channel_store_wraps_around(capacity):
+    #blocks shorter and longer than the store, checked after every append
+    rng = np.random.default_rng(capacity)
+    data = rng.integers(0, 4096, 20000).astype(np.uint16)
+    store, first = ChannelStore(capacity), 0
+    while first < len(data):
+        size = int(rng.integers(0, 3*capacity + 2))
+        store.append(data[first:first + size])
+        first = min(first + size, len(data))
+        assert store.written == first and len(store) == min(first, capacity)
+        held = max(0, first - capacity)
+        assert np.array_equal(store.last(capacity + 5), data[held:first])
+        assert np.array_equal(store.last(1), data[first - 1:first])
+        start = int(rng.integers(held, first + 1))
+        stop = int(rng.integers(start, first + 1))
+        assert np.array_equal(store.view(start, stop), data[start:stop])
+        assert not store.view(start, stop).flags.writeable
+
+
+def test_channel_store_refuses_what_it_does_not_hold():
+    store = ChannelStore(100)
+    store.append(np.arange(250, dtype=np.uint16))
+    assert np.array_equal(store.view(150, 250), np.arange(150, 250))
+    for start, stop in ((149, 200), (200, 251), (200, 199)):
+        with pytest.raises(IndexError):
+            store.view(start, stop)
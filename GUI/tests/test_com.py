@@ -0,0 +1,208 @@
+import io
+import os
+
+import numpy as np
+import pytest
+
+from acquisition import AcquisitionManager, Board
+from com import BlockDecoder, FrameDecoder, frameBlock, packBlock, receiveData, unframeBlock
+
+
+def samples(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.integers(0, 4096, n).astype(np.uint16), rng.integers(0, 4096, n).astype(np.uint16),
+            rng.integers(0, 2, n).astype(np.uint8), rng.integers(0, 2, n).astype(np.uint8))
+
+
+class FakeSerial:
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.pipe = None
+
+    def read(self, size):
+        return self.chunks.pop(0) if self.chunks else b''
+
+    def reset_input_buffer(self):
+        pass
+
+    def fileno(self):
+        #something a selector can watch
+        self.pipe = self.pipe or os.pipe()
+        return self.pipe[0]
+
+
+def corrupt(data, seed, errors=20):
+    """ data with random bytes changed, dropped or inserted, ending with
+        whole valid frames
+    """
+
+    rng = np.random.default_rng(seed)
+    data = bytearray(data)
+    for position in np.sort(rng.integers(0, len(data) - 40, errors))[::-1]:
+        kind = rng.integers(0, 3)
+        if kind == 0:
+            data[position] = int(rng.integers(0, 256))
+        elif kind == 1:
+            del data[position]
+        else:
+            data[position:position] = bytes(rng.integers(0, 256, int(rng.integers(1, 6))).astype(np.uint8))
+    return bytes(data) + frameBlock(*samples(10, seed))
+
+
+def receiveAll(data):
+    source, stats, received = io.BytesIO(data), {}, []
+    while True:
+        sample = receiveData(source, stats)
+        if sample is None:
+            return np.array(received).reshape(-1, 4).T, stats
+        received.append(sample)
+
+
+@pytest.mark.parametrize('seed', [None] + list(range(20)))
+def test_unframe_matches_receive_data(seed):
+    data = frameBlock(*samples(2000))
+    if seed is not None:
+        data = corrupt(data, seed)
+    expected, expectedStats = receiveAll(data)
+    stats = {}
+    *decoded, remainder = unframeBlock(data, stats)
+    assert remainder == b''
+    for channel, received in zip(decoded, expected):
+        assert np.array_equal(channel, received)
+    assert stats == expectedStats
+
+
+def test_unframe_clean_chunk():
+    block = samples(100)
+    data = frameBlock(*block)
+    stats, gaps = {}, []
+    *decoded, remainder = unframeBlock(data + data[:3], stats, gaps)
+    for channel, expected in zip(decoded, block):
+        assert np.array_equal(channel, expected)
+    assert remainder == data[:3]
+    assert stats == {} and gaps == []
+
+
+@pytest.mark.parametrize('lost', [1, 2, 5])
+def test_unframe_dropped_frames(lost):
+    block = samples(100)
+    data = frameBlock(*block)
+    #frames 40 to 40+lost lose their first byte each, so none of them is valid
+    broken = b''.join(data[4*i + 1:4*i + 4] for i in range(40, 40 + lost))
+    stats, gaps = {}, []
+    *decoded, remainder = unframeBlock(data[:160] + broken + data[4*(40 + lost):], stats, gaps)
+
+    kept = np.r_[0:40, 40 + lost:100]
+    for channel, expected in zip(decoded, block):
+        assert np.array_equal(channel, expected[kept])
+    assert remainder == b''
+    assert stats['syncLosses'] == 1
+    assert stats['bytesDiscarded'] == 3*lost
+    assert stats['framesDiscarded'] == -(-3*lost//4)
+    assert gaps == [(40, -(-3*lost//4))]
+
+
+def test_unframe_several_losses():
+    block = samples(60)
+    data = frameBlock(*block)
+    corrupt = data[:40] + b'\x00\x00' + data[40:120] + b'\xff' + data[120:]
+    stats, gaps = {}, []
+    *decoded, remainder = unframeBlock(corrupt, stats, gaps)
+    for channel, expected in zip(decoded, block):
+        assert np.array_equal(channel, expected)
+    assert stats['syncLosses'] == 2
+    assert stats['bytesDiscarded'] == 3
+    assert gaps == [(10, 1), (30, 1)]
+
+
+def test_frame_decoder_across_chunks():
+    block = samples(50)
+    data = frameBlock(*block)
+    decoder, stats = FrameDecoder(), {}
+    decoded = [decoder.decode(data[i:i + 7], stats) for i in range(0, len(data), 7)]
+    for i, expected in enumerate(block):
+        assert np.array_equal(np.concatenate([d[i] for d in decoded]), expected)
+    assert stats == {} and decoder.gaps == []
+
+
+def test_block_decoder_counts_lost_blocks():
+    block = samples(64)
+    packets = [packBlock(i, *[channel[16*i:16*i + 16] for channel in block]) for i in range(4)]
+    decoder, stats = BlockDecoder(), {}
+    decoded = decoder.decode(packets[0] + b'junk' + packets[2] + packets[3], stats)
+
+    kept = np.r_[0:16, 32:64]
+    for channel, expected in zip(decoded, block):
+        assert np.array_equal(channel, expected[kept])
+    assert stats['blocksLost'] == 1
+    assert stats['framesDiscarded'] == 16
+    assert stats['blocksReceived'] == 3
+    assert stats['syncLosses'] == 1 and stats['bytesDiscarded'] == 4
+    assert decoder.gaps == [(16, 16)]
+
+
+def test_block_decoder_drops_corrupt_block():
+    block = samples(32)
+    packets = [packBlock(i, *[channel[16*i:16*i + 16] for channel in block]) for i in range(2)]
+    corrupt = bytearray(packets[0])
+    corrupt[10] ^= 0x01
+    decoder, stats = BlockDecoder(), {}
+    decoder.decode(bytes(corrupt), stats)
+    decoded = decoder.decode(packets[1], stats)
+    for channel, expected in zip(decoded, block):
+        assert np.array_equal(channel, expected[16:])
+    assert stats['checksumErrors'] == 1
+    #nothing was received before, so there is no gap to count yet
+    assert 'blocksLost' not in stats and decoder.gaps == []
+
+
+def test_board_fills_gaps_where_frames_were_lost():
+    block = samples(100)
+    data = frameBlock(*block)
+    broken = b''.join(data[4*i + 1:4*i + 4] for i in range(40, 44))
+    board = Board(FakeSerial([data[:80], data[80:160] + broken + data[176:]]))
+    board.service(0.0, 0.0)
+    board.service(0.04, 0.0)
+
+    #four frames lost a byte each: their 12 bytes are accounted as 3 frames
+    assert board.ring.written == 99
+    assert board.stats['filled'] == 3
+    for channel, expected in zip(board.ring.latest(99), block):
+        assert np.array_equal(channel[:40], expected[:40])
+        assert np.all(channel[40:43] == expected[39])
+        assert np.array_equal(channel[43:], expected[44:])
+
+
+def test_board_fills_gap_at_chunk_start():
+    block = samples(30)
+    data = frameBlock(*block)
+    board = Board(FakeSerial([data[:40], b'\x00\x00\x00', data[40:]]))
+    for i in range(3):
+        board.service(0.001*i, 0.0)
+
+    assert board.stats['filled'] == 1
+    for channel, expected in zip(board.ring.latest(31), block):
+        assert np.array_equal(channel, np.r_[expected[:10], expected[9], expected[10:]])
+
+
+def test_empty_read_has_the_ring_types():
+    manager = AcquisitionManager([FakeSerial([]), FakeSerial([])])
+    block, cursor, lost = manager.read(0)
+    assert [channel.dtype for channel in block] == [np.uint16, np.uint16, np.uint8, np.uint8]*2
+    assert all(len(channel) == 0 for channel in block)
+
+
+def test_receive_data_resyncs():
+    block = samples(3)
+    data = frameBlock(*block)
+    stats = {}
+    source = io.BytesIO(data[:4] + data[5:8] + data[8:])
+    assert receiveData(source, stats) == tuple(int(channel[0]) for channel in block)
+    assert receiveData(source, stats) == tuple(int(channel[2]) for channel in block)
+    assert stats['syncLosses'] == 1 and stats['bytesDiscarded'] == 3
+
+
+@pytest.mark.parametrize('data', [b'', b'\x00\xff', b'\x10\x80'])
+def test_receive_data_times_out(data):
+    #a BytesIO read returns b'' once exhausted, like a port whose timeout elapsed
+    assert receiveData(io.BytesIO(data)) is None
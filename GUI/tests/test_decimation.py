@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from decimation import Decimator, envelope
+
+
+DATA = np.random.default_rng(0).integers(0, 4096, 200000).astype(np.uint16)
+
+
+def checkBuckets(indexes, values, window, start, pixels):
+    size = len(window)//pixels
+    if size < 2:
+        assert np.array_equal(indexes, np.arange(len(window)))
+        assert np.array_equal(values, window)
+        return
+
+    #buckets of size samples aligned to absolute sample numbers, partial ones at both ends
+    bounds = np.arange(-(-start//size)*size, start + len(window) + 1, size) - start
+    bounds = np.unique(np.r_[0, bounds, len(window)])
+    assert len(indexes) == 2*(len(bounds) - 1)
+    for i, (first, last) in enumerate(zip(bounds[:-1], bounds[1:])):
+        bucket = window[first:last]
+        low, high = first + bucket.argmin(), first + bucket.argmax()
+        assert list(indexes[2*i:2*i + 2]) == sorted((low, high))
+        assert np.array_equal(values[2*i:2*i + 2], window[indexes[2*i:2*i + 2]])
+
+
+@pytest.mark.parametrize('start, stop', [(0, 200000), (123, 45678), (5000, 5100), (99, 99999), (0, 1)])
+@pytest.mark.parametrize('pixels', [1, 7, 640, 2000])
+def test_decimate_matches_brute_force(start, stop, pixels):
+    window = DATA[start:stop]
+    checkBuckets(*Decimator().decimate(window, pixels, start), window, start, pixels)
+    checkBuckets(*Decimator().decimate(window, pixels), window, 0, pixels)
+
+
+def test_sliding_window_reuses_buckets_exactly():
+    #a live trace moving forward by random amounts, now and then jumping back or resizing
+    decimator, rng = Decimator(), np.random.default_rng(1)
+    start, length = 0, 50000
+    for step in range(60):
+        if step % 20 == 19:
+            start, length = int(rng.integers(0, 100000)), int(rng.integers(1000, 90000))
+        else:
+            start += int(rng.integers(0, 3000))
+        window = DATA[start:start + length]
+        indexes, values = decimator.decimate(window, 640, start)
+        fresh = Decimator().decimate(window, 640, start)
+        assert np.array_equal(indexes, fresh[0]) and np.array_equal(values, fresh[1])
+        checkBuckets(indexes, values, window, start, 640)
+
+
+def test_envelope_outlines_noise_only():
+    indexes, values = Decimator().decimate(DATA[:64000], 640, 0)
+    at, outline = envelope(indexes, values)
+    high = np.maximum(values[0::2], values[1::2])
+    low = np.minimum(values[0::2], values[1::2])
+    assert np.array_equal(at, np.r_[indexes[0::2], indexes[0::2][::-1]])
+    assert np.array_equal(outline, np.r_[high, low[::-1]])
+    #a slow ramp is cheaper drawn as a line
+    ramp = np.arange(64000, dtype=np.uint16)//16
+    assert envelope(*Decimator().decimate(ramp, 640, 0)) is None
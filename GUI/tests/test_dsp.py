@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from dsp import Downsampler, FirFilter, IirFilter, MathStage, biquad, windowedSinc
+
+
+def pieces(data, seed=0):
+    """ data cut at random, empty blocks and blocks longer than an
+        IirFilter chunk included
+    """
+
+    rng = np.random.default_rng(seed)
+    cuts = np.sort(rng.integers(0, len(data), 40))
+    return np.split(data, cuts)
+
+
+def inBlocks(stage, data, seed=0):
+    return np.concatenate([stage.process(block) for block in pieces(data, seed)])
+
+
+def differenceEquation(b, a, data):
+    b, a = np.asarray(b, dtype=np.float64)/a[0], np.asarray(a, dtype=np.float64)/a[0]
+    out = np.zeros(len(data))
+    for n in range(len(data)):
+        out[n] = sum(b[k]*data[n - k] for k in range(len(b)) if n >= k)
+        out[n] -= sum(a[k]*out[n - k] for k in range(1, len(a)) if n >= k)
+    return out
+
+
+SIGNAL = np.random.default_rng(1).normal(size=3000)
+
+
+@pytest.mark.parametrize('taps', [1, 2, 63])
+def test_fir_blocks_match_whole_signal(taps):
+    coefficients = windowedSinc(100, taps=taps)
+    expected = np.convolve(SIGNAL, coefficients)[:len(SIGNAL)]
+    assert np.allclose(inBlocks(FirFilter(coefficients), SIGNAL), expected)
+
+
+@pytest.mark.parametrize('b, a', [([0.2], [1, -0.8]),
+                                  ([1, 2, 1], [4, -1, 0.5]),
+                                  ([0.1, 0.2, 0.3, 0.2], [1, -1.2, 0.6, -0.1])])
+@pytest.mark.parametrize('chunk', [1, 16, 256])
+def test_iir_blocks_match_difference_equation(b, a, chunk):
+    expected = differenceEquation(b, a, SIGNAL)
+    assert np.allclose(inBlocks(IirFilter(b, a, chunk), SIGNAL), expected)
+
+
+@pytest.mark.parametrize('kind', ['lowpass', 'highpass', 'bandpass', 'notch'])
+def test_biquad_blocks_match_one_block(kind):
+    whole = biquad(kind, 60).process(SIGNAL)
+    for seed in range(3):
+        assert np.allclose(inBlocks(biquad(kind, 60), SIGNAL, seed), whole)
+
+
+def test_reset_starts_over():
+    stage = IirFilter([1, 2, 1], [4, -1, 0.5])
+    first = stage.process(SIGNAL[:500])
+    stage.reset()
+    assert np.allclose(stage.process(SIGNAL[:500]), first)
+
+
+@pytest.mark.parametrize('factor', [2, 3, 10])
+def test_downsampler_blocks_match_one_block(factor):
+    whole = Downsampler(factor).process(SIGNAL)
+    assert len(whole) == -(-len(SIGNAL)//factor)
+    assert np.allclose(inBlocks(Downsampler(factor), SIGNAL), whole)
+
+
+def test_math_stage_blocks_match_one_block():
+    rng = np.random.default_rng(2)
+    block = (rng.integers(0, 4096, 3000).astype(np.uint16), rng.integers(0, 4096, 3000).astype(np.uint16),
+             rng.integers(0, 2, 3000).astype(np.uint8), rng.integers(0, 2, 3000).astype(np.uint8))
+    whole = MathStage('a1 - a2*d1', ['lowpass:50', 'fir:100'], 4).process(block)
+
+    stage = MathStage('a1 - a2*d1', ['lowpass:50', 'fir:100'], 4)
+    cuts = np.sort(rng.integers(0, 3000, 30))
+    out = [stage.process(tuple(channel[first:last] for channel in block))
+           for first, last in zip(np.r_[0, cuts], np.r_[cuts, 3000])]
+    assert np.allclose(np.concatenate(out), whole)
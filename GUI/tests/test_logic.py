@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from logic import EdgeStore
+
+
+def bits(n, run, seed=0):
+    """ n random 0/1 samples in runs of about run samples
+    """
+
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 2*run, 2*(n//run) + 2)
+    return (np.repeat(np.arange(len(lengths)) & 1, lengths)[:n] ^ rng.integers(0, 2)).astype(np.uint8)
+
+
+def appended(data, depth=None, seed=0):
+    store = EdgeStore(depth)
+    rng = np.random.default_rng(seed)
+    first = 0
+    while first < len(data):
+        size = int(rng.integers(1, 5000))
+        store.append(data[first:first + size])
+        first += size
+    return store
+
+
+@pytest.mark.parametrize('run', [1, 50, 5000])
+@pytest.mark.parametrize('start, stop, pixels', [(0, 100000, 640), (123, 4567, 7), (5000, 5100, 640),
+                                                 (99000, 99900, 100), (-50, 70, 10), (90000, 200000, 300)])
+def test_view_matches_brute_force(run, start, stop, pixels):
+    data = bits(100000, run, run)
+    indexes, values = appended(data).view(start, stop, pixels)
+    start, stop = max(0, start), min(stop, len(data))
+    if (stop - start)/pixels < 2:
+        assert np.array_equal(indexes, np.arange(start, stop))
+        assert np.array_equal(values, data[start:stop])
+        return
+
+    at = indexes[0::2]
+    assert np.array_equal(indexes[1::2], at)
+    assert at[0] == start and np.all(np.diff(at) > 0)
+    assert len(at) <= pixels + 2
+    for first, last, low, high in zip(at, np.r_[at[1:], stop], values[0::2], values[1::2]):
+        assert low == data[first:last].min()
+        assert high == data[first:last].max()
+
+
+def test_view_of_held_samples_only():
+    data = bits(100000, 50)
+    store = appended(data, depth=20000)
+    assert store.start == 80000
+    indexes, values = store.view(0, 100000, 640)
+    assert indexes[0] == 80000
+    for got, expected in zip((indexes, values), store.view(80000, 100000, 640)):
+        assert np.array_equal(got, expected)
+
+
+def bruteRuns(data):
+    bounds = np.r_[0, np.flatnonzero(data[1:] != data[:-1]) + 1, len(data)]
+    return data[bounds[:-1]], np.diff(bounds)
+
+
+@pytest.mark.parametrize('run', [1, 50, 5000])
+@pytest.mark.parametrize('depth', [None, 30000])
+def test_round_trip_matches_brute_force(run, depth):
+    data = bits(100000, run, run)
+    store = appended(data, depth, run)
+    held = 0 if depth is None else 100000 - depth
+    assert store.start == held and len(store) == 100000 - held and store.written == 100000
+    edges = np.flatnonzero(data[1:] != data[:-1]) + 1
+    assert np.array_equal(store.held(), edges[edges > held])
+
+    assert np.array_equal(store.levels(held, 100000), data[held:])
+    rng = np.random.default_rng(run)
+    for i in range(50):
+        start = int(rng.integers(held, 100000))
+        stop = int(rng.integers(start + 1, 100001))
+        assert store.levelAt(start) == data[start]
+        assert np.array_equal(store.levels(start, stop), data[start:stop])
+        assert np.array_equal(store.between(start, stop), edges[(edges >= start) & (edges < stop)])
+        for got, expected in zip(store.runs(start, stop), bruteRuns(data[start:stop])):
+            assert np.array_equal(got, expected)
+
+        #the step outline holds each level up to the next vertex
+        samples, levels = store.steps(start, stop)
+        assert samples[0] == start and samples[-1] == stop - 1
+        assert np.array_equal(np.repeat(levels[:-1], np.diff(samples)), data[start:stop - 1])
+
+        following, previous = store.nextEdge(start), store.previousEdge(start)
+        later, earlier = edges[edges > start], edges[(edges < start) & (edges > held)]
+        assert following == (later[0] if len(later) else None)
+        assert previous == (earlier[-1] if len(earlier) else None)
+
+    levels, lengths = bruteRuns(data[held:])
+    for level in (0, 1):
+        assert np.array_equal(store.pulseWidths(level), lengths[1:-1][levels[1:-1] == level])
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from com import convertAnalog
+from measurements import ChannelMeter
+
+
+def feedInPieces(meter, data, seed=0):
+    rng = np.random.default_rng(seed)
+    first = 0
+    while first < len(data):
+        size = int(rng.integers(1, 150))
+        meter.feed(data[first:first + size])
+        first += size
+
+
+@pytest.mark.parametrize('window', [1, 20, 31, 32, 33, 64, 65, 200])
+def test_analog_window_matches_brute_force(window):
+    data = np.random.default_rng(window).integers(0, 4096, 1000).astype(np.uint16)
+    meter = ChannelMeter(window)
+    feedInPieces(meter, data)
+
+    last = data[-window:]
+    result = meter.measure()
+    assert result['min'] == pytest.approx(convertAnalog(int(last.min())))
+    assert result['max'] == pytest.approx(convertAnalog(int(last.max())))
+    assert result['mean'] == pytest.approx(convertAnalog(last.mean()))
+
+
+@pytest.mark.parametrize('window', [1, 20, 33, 2000])
+def test_window_longer_than_a_block(window):
+    data = np.random.default_rng(1).integers(0, 4096, 5000).astype(np.uint16)
+    meter = ChannelMeter(window)
+    meter.feed(data)
+    assert meter.extremes() == (int(data[-window:].min()), int(data[-window:].max()))
+
+
+@pytest.mark.parametrize('window', [20, 200])
+def test_digital_duty_and_frequency(window):
+    data = (np.arange(1000)//5 % 2).astype(np.uint8) #period of 10 samples, 50% duty
+    meter = ChannelMeter(window, digital=True, rate=2000)
+    feedInPieces(meter, data)
+
+    result = meter.measure()
+    assert result['duty'] == pytest.approx(data[-window:].mean())
+    assert result['frequency'] == pytest.approx(200)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from persistence import Persistence
+
+
+def bruteImage(x, y, width, height):
+    image = np.zeros((height, width))
+    for a, b in zip(x, y):
+        column, row = int(np.floor(a*width)), int(np.floor(b*height))
+        if 0 <= column < width and 0 <= row < height:
+            image[row, column] += 1
+    return image
+
+
+@pytest.mark.parametrize('width, height', [(1, 1), (7, 5), (640, 480)])
+def test_add_matches_brute_force(width, height):
+    #points on both sides of every border included
+    rng = np.random.default_rng(width)
+    persistence = Persistence(width, height)
+    x, y = rng.uniform(-0.2, 1.2, 5000), rng.uniform(-0.2, 1.2, 5000)
+    x[:4], y[:4] = (0, 1, 1 - 1e-9, -1e-9), (1, 0, 1 - 1e-9, 0)
+    for first in range(0, 5000, 1234):
+        persistence.add(x[first:first + 1234], y[first:first + 1234])
+    expected = bruteImage(x, y, width, height)
+    assert np.array_equal(persistence.image, expected)
+    assert persistence.points == expected.sum()
+
+
+def test_fade_halves_every_half_life():
+    persistence = Persistence(10, 10, halfLife=0.5)
+    persistence.fade(100.0) #the first call only starts the clock
+    persistence.add([0.55]*64, [0.25]*64)
+    assert persistence.image[2, 5] == 64
+    persistence.fade(100.5)
+    assert persistence.image[2, 5] == pytest.approx(32)
+    persistence.fade(101.75)
+    assert persistence.image[2, 5] == pytest.approx(32*0.5**2.5)
+    assert persistence.image.sum() == pytest.approx(32*0.5**2.5)
+
+
+def test_no_half_life_never_fades_and_zero_clears():
+    forever = Persistence(10, 10, halfLife=None)
+    instant = Persistence(10, 10, halfLife=0)
+    for persistence in (forever, instant):
+        persistence.fade(0.0)
+        persistence.add([0.1, 0.9], [0.1, 0.9])
+        persistence.fade(1000.0)
+    assert forever.image.sum() == 2 and instant.image.sum() == 0
+    forever.clear()
+    assert forever.image.sum() == 0 and forever.points == 0
+
+
+def test_levels_scale_to_the_brightest_pixel():
+    persistence = Persistence(4, 1)
+    persistence.add([0.1]*1000 + [0.3]*10 + [0.6], [0.5]*1011)
+    levels = persistence.levels()
+    assert levels.dtype == np.uint8
+    assert levels[0, 0] == 255 and levels[0, 3] == 0
+    assert 1 <= levels[0, 2] < levels[0, 1] < 255
+    assert np.array_equal(Persistence(4, 1).levels(), np.zeros((1, 4), dtype=np.uint8))
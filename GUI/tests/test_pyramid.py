@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from pyramid import MinMaxPyramid
+
+
+DATA = np.random.default_rng(0).integers(0, 4096, 100000).astype(np.uint16)
+
+
+def appended(data, seed=0):
+    pyramid = MinMaxPyramid()
+    rng = np.random.default_rng(seed)
+    first = 0
+    while first < len(data):
+        size = int(rng.integers(1, 5000))
+        pyramid.append(data[first:first + size])
+        first += size
+    return pyramid
+
+
+PYRAMID = appended(DATA)
+
+
+def checkView(pyramid, data, start, stop, pixels):
+    indexes, values = pyramid.view(start, stop, pixels)
+    start, stop = max(0, start), min(stop, len(data))
+    if (stop - start)/pixels < 2:
+        assert np.array_equal(indexes, np.arange(start, stop))
+        assert np.array_equal(values, data[start:stop])
+        return
+
+    #columns start at every other index and end where the next one starts
+    at = indexes[0::2]
+    assert np.array_equal(indexes[1::2], at)
+    assert at[0] == start and np.all(np.diff(at) > 0)
+    #whole buckets of the coarsest level no wider than a pixel: over half a pixel each
+    assert len(at) <= 2*pixels + 2
+    for first, last, low, high in zip(at, np.r_[at[1:], stop], values[0::2], values[1::2]):
+        assert low == data[first:last].min()
+        assert high == data[first:last].max()
+
+
+@pytest.mark.parametrize('start, stop', [(0, 100000), (0, 1000), (123, 4567), (99, 99999), (5000, 5100),
+                                         (65536, 65536 + 16*4**5), (-50, 70), (90000, 200000)])
+@pytest.mark.parametrize('pixels', [1, 7, 640, 2000])
+def test_view_matches_brute_force(start, stop, pixels):
+    checkView(PYRAMID, DATA, start, stop, pixels)
+
+
+def test_view_is_aligned_to_samples():
+    #panning by less than a column keeps the columns of the samples both views show
+    a, values = PYRAMID.view(10000, 60000, 500)
+    b, values = PYRAMID.view(10037, 60037, 500)
+    inner = a[(a > 10037 + 1000) & (a < 60000 - 1000)]
+    assert np.isin(inner, b).all()
+
+
+@pytest.mark.parametrize('start, stop', [(0, 100000), (0, 1), (15, 17), (123, 4567), (99, 99999), (-5, 40),
+                                         (4096, 8192), (99990, 100010)])
+def test_extent_matches_brute_force(start, stop):
+    window = DATA[max(0, start):stop]
+    assert PYRAMID.extent(start, stop) == (window.min(), window.max())
+
+
+def test_extent_of_nothing():
+    assert PYRAMID.extent(500, 500) is None
+    assert PYRAMID.extent(200000, 300000) is None
+
+
+def test_appending_matches_one_block():
+    whole = MinMaxPyramid(data=DATA)
+    for (low, high), (lowAppended, highAppended) in zip(whole.levels(), appended(DATA, 1).levels()):
+        assert np.array_equal(low, lowAppended)
+        assert np.array_equal(high, highAppended)
+    assert len(whole.levels()) == len(PYRAMID.levels())
+
+
+def test_saved_levels_are_reused():
+    levels = MinMaxPyramid(data=DATA[:70000]).levels()
+    pyramid = MinMaxPyramid(data=DATA[:70000], levels=levels)
+    assert all(np.array_equal(low, saved) for (low, high), (saved, savedHigh) in zip(pyramid.levels(), levels))
+    for start, stop, pixels in ((0, 70000, 640), (333, 65000, 100), (1000, 1200, 50)):
+        checkView(pyramid, DATA, start, stop, pixels)
+    with pytest.raises(ValueError):
+        pyramid.append(DATA[:10])
+
+
+@pytest.mark.parametrize('depth', [100, 5000, 30000])
+def test_depth_keeps_the_last_samples(depth):
+    pyramid = MinMaxPyramid(depth=depth)
+    rng = np.random.default_rng(depth)
+    first = 0
+    while first < len(DATA):
+        size = int(rng.integers(1, 3000))
+        pyramid.append(DATA[first:first + size])
+        first += size
+        assert pyramid.written == min(first, len(DATA))
+        assert pyramid.written - 2*depth < pyramid.start <= max(0, pyramid.written - depth)
+
+    #only what is held is shown, exactly as if everything was
+    for start, stop, pixels in ((0, 100000, 640), (100000 - depth, 100000, 7), (99000, 99900, 100), (99900, 99980, 50)):
+        held = max(start, pyramid.start)
+        checkView(pyramid, DATA, held, stop, pixels)
+        for got, expected in zip(pyramid.view(start, stop, pixels), pyramid.view(held, stop, pixels)):
+            assert np.array_equal(got, expected)
+    assert pyramid.extent(0, 100000) == (DATA[pyramid.start:].min(), DATA[pyramid.start:].max())
+    assert len(pyramid.data) <= 4*depth + (1 << 16)
+
+
+def test_unsummarized_view_is_by_stride():
+    pyramid = MinMaxPyramid(data=DATA, summarize=False)
+    assert pyramid.counts == []
+    indexes, values = pyramid.view(1000, 91000, 900)
+    assert np.array_equal(indexes[0::2], np.arange(1000, 91000, 100))
+    assert np.array_equal(indexes[1::2], indexes[0::2])
+    assert np.array_equal(values, DATA[indexes])
+    #few enough samples are all shown
+    assert np.array_equal(pyramid.view(500, 600, 100)[1], DATA[500:600])
@@ -0,0 +1,105 @@
+import time
+
+import numpy as np
+import pytest
+
+from recorder import LEVELS_SUFFIX, CaptureReader, CaptureWriter
+
+
+def channels(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.integers(0, 4096, n).astype(np.uint16), rng.integers(0, 4096, n).astype(np.uint16),
+            rng.integers(0, 2, n).astype(np.uint8), rng.integers(0, 2, n).astype(np.uint8))
+
+
+def capture(path, block, chunkSize=1 << 16):
+    writer = CaptureWriter(str(path), chunkSize=chunkSize)
+    writer.write(*block)
+    writer.close()
+    return CaptureReader(str(path))
+
+
+def written(path, block, chunkSize, seed=0, close=True):
+    """ block written in pieces of random sizes, piece i stamped at time
+        1000 + i
+        :returns:
+            The writer and the first sample of every piece
+    """
+
+    writer = CaptureWriter(str(path), 5000, (1, 2, 3, 4, 5), chunkSize)
+    rng = np.random.default_rng(seed)
+    cuts = np.r_[0, np.sort(rng.integers(0, len(block[0]), 30)), len(block[0])]
+    for i, (first, last) in enumerate(zip(cuts[:-1], cuts[1:])):
+        writer.write(*[channel[first:last] for channel in block], timestamp=1000.0 + i)
+    if close:
+        writer.close()
+    return writer, cuts
+
+
+@pytest.mark.parametrize('chunkSize', [1, 1000, 1 << 16])
+def test_round_trip(tmp_path, chunkSize):
+    block = channels(100000, chunkSize)
+    written(tmp_path/'a.bob', block, chunkSize, chunkSize)
+    reader = CaptureReader(str(tmp_path/'a.bob'))
+    assert len(reader) == 100000 and reader.sampleRate == 5000 and reader.duration() == 20
+    assert reader.scales == (1, 2, 3, 4, 5)
+    assert len(reader.index) == -(-100000//chunkSize)
+    for got, expected in zip(reader.slice(0, 20), block):
+        assert np.array_equal(got, expected)
+    for got, expected in zip(reader.slice(3.5, 7.25), block):
+        assert np.array_equal(got, expected[17500:36250])
+    for name, channel in (('d1', block[2]), ('d2', block[3])):
+        edges = reader.edges(name, 777)
+        assert np.array_equal(edges.levels(0, 100000), channel)
+
+
+@pytest.mark.parametrize('chunkSize', [1, 1000, 1 << 16])
+def test_time_of_uses_the_chunk_index(tmp_path, chunkSize):
+    block = channels(100000)
+    writer, cuts = written(tmp_path/'a.bob', block, chunkSize)
+    reader = CaptureReader(str(tmp_path/'a.bob'))
+    for sample in np.random.default_rng(1).integers(0, 100000, 200):
+        #a chunk is stamped with the time of the piece its first sample came in
+        chunk = sample//chunkSize*chunkSize
+        piece = np.searchsorted(cuts, chunk, side='right') - 1
+        assert reader.timeOf(sample) == pytest.approx(1000 + piece + (sample - chunk)/5000)
+
+
+def test_unclosed_capture_is_readable(tmp_path):
+    block = channels(10000)
+    writer, cuts = written(tmp_path/'a.bob', block, 1000, close=False)
+    writer.flush()
+    writer.write(*[channel[:500] for channel in block]) #never reaches the disk
+    writer.file.flush()
+
+    reader = CaptureReader(str(tmp_path/'a.bob'))
+    assert len(reader) == 10000 and len(reader.index) == 0
+    for got, expected in zip(reader.slice(0, 10), block):
+        assert np.array_equal(got, expected)
+    #without the index times come from the start time and the rate
+    assert reader.timeOf(0) == reader.startTime == writer.startTime
+    assert reader.timeOf(7500) == pytest.approx(writer.startTime + 1.5)
+    writer.file.close()
+
+
+def test_pyramids_built_in_background(tmp_path):
+    block = channels(300000)
+    reader = capture(tmp_path/'a.bob', block)
+    pyramids = reader.pyramids(background=True)
+    assert not any(pyramid.summarized for pyramid in pyramids)
+
+    deadline = time.monotonic() + 30
+    while reader.summary is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert all(pyramid.summarized for pyramid in reader.summary)
+    for pyramid, channel in zip(reader.summary, block):
+        assert pyramid.extent(0, len(channel)) == (channel.min(), channel.max())
+    assert (tmp_path/('a.bob' + LEVELS_SUFFIX)).exists()
+
+    #saved levels are used straight away by the next open
+    again = CaptureReader(str(tmp_path/'a.bob'))
+    pyramids = again.pyramids(background=True)
+    assert pyramids is again.summary and all(pyramid.summarized for pyramid in pyramids)
+    for pyramid, saved in zip(pyramids, reader.summary):
+        for (low, high), (savedLow, savedHigh) in zip(pyramid.levels(), saved.levels()):
+            assert np.array_equal(low, savedLow) and np.array_equal(high, savedHigh)
@@ -0,0 +1,58 @@
+import socket
+
+import numpy as np
+import pytest
+
+from buffers import SampleRing
+from server import SampleClient, SampleServer, blockSize, decodeBlock, encodeBlock, parseAddress
+
+
+def channels(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.integers(0, 4096, n).astype(np.uint16), rng.integers(0, 4096, n).astype(np.uint16),
+            rng.integers(0, 2, n).astype(np.uint8), rng.integers(0, 2, n).astype(np.uint8))
+
+
+@pytest.mark.parametrize('count', [0, 1, 7, 8, 9, 1000])
+def test_decode_inverts_encode(count):
+    block = channels(count, count)
+    message = encodeBlock(123456789012, *block)
+    assert len(message) == blockSize(count)
+    first, decoded = decodeBlock(message)
+    assert first == 123456789012
+    for channel, expected in zip(decoded, block):
+        assert np.array_equal(channel, expected)
+
+
+def test_parse_address():
+    assert parseAddress('unix:///tmp/bob.sock') == (socket.AF_UNIX, '/tmp/bob.sock')
+    assert parseAddress('tcp://:5000') == (socket.AF_INET, ('127.0.0.1', 5000))
+    assert parseAddress('tcp://0.0.0.0:80') == (socket.AF_INET, ('0.0.0.0', 80))
+    with pytest.raises(ValueError):
+        parseAddress('COM3')
+
+
+def test_client_receives_every_published_sample(tmp_path):
+    block = channels(20000)
+    ring = SampleRing(1 << 16)
+    server = SampleServer(ring, 'unix://%s' % (tmp_path/'bob.sock'), rate=5000, period=0.001)
+    server.start()
+    client = SampleClient(server.address)
+    assert client.sampleRate == 5000
+    try:
+        cuts = np.r_[0, np.sort(np.random.default_rng(1).integers(0, 20000, 20)), 20000]
+        for first, last in zip(cuts[:-1], cuts[1:]):
+            ring.write(*[channel[first:last] for channel in block])
+
+        received = []
+        while sum(len(piece[0]) for piece in received) < 20000:
+            first, piece = client.read()
+            assert first == sum(len(piece[0]) for piece in received) #contiguous, nothing skipped
+            received.append(piece)
+        for channel, expected in zip(zip(*received), block):
+            assert np.array_equal(np.concatenate(channel), expected)
+        assert server.stats['lost'] == 0 and server.stats['dropped'] == 0
+    finally:
+        client.close()
+        server.stop()
+        server.join()
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from trigger import MODES, Trigger, schmitt
+
+
+def square(n, period, channel):
+
+    """ Block of the four channels with a square wave of period samples
+        on channel and the others constant
+    """
+
+    wave = (np.arange(n)//(period//2) % 2).astype(np.uint8)
+    block = [np.full(n, 2048, np.uint16), np.full(n, 2048, np.uint16), np.zeros(n, np.uint8), np.zeros(n, np.uint8)]
+    block[channel] = wave.astype(np.uint16)*4000 if channel < 2 else wave
+    return tuple(block)
+
+
+def sweeps(trigger, block, size=97):
+    found = []
+    for first in range(0, len(block[0]), size):
+        sweep = trigger.feed(tuple(channel[first:first + size] for channel in block))
+        if sweep is not None:
+            found.append(sweep)
+    return found
+
+
+@pytest.mark.parametrize('channel', range(4))
+@pytest.mark.parametrize('mode', ['rising', 'falling'])
+def test_edges_on_every_channel(channel, mode):
+    block = square(4000, 100, channel)
+    trigger = Trigger(channel, mode, pre=20, post=30)
+    found = sweeps(trigger, block)
+
+    assert trigger.sweeps >= 30
+    for sweep in found:
+        before, after = sweep[channel][19], sweep[channel][20] #around the trigger point
+        assert (after > before) if mode == 'rising' else (after < before)
+
+
+@pytest.mark.parametrize('channel', range(4))
+def test_levels_on_every_channel(channel):
+    block = square(4000, 100, channel)
+    for mode in ('high', 'low'):
+        trigger = Trigger(channel, mode, pre=10, post=10)
+        points = trigger.find(block[channel])
+        high = block[channel][points] > (0 if channel >= 2 else 2048)
+        assert len(points) == 2000
+        assert high.all() if mode == 'high' else not high.any()
+
+
+def test_no_sweep_without_edges():
+    block = square(4000, 100, 0)
+    block = (block[0], block[1], np.ones(4000, np.uint8), block[3])
+    for mode in MODES[:2]:
+        assert sweeps(Trigger(2, mode, pre=10, post=10), block) == []
+
+
+def test_schmitt_holds_between_thresholds():
+    data = np.array([0, 5, 10, 5, 0, 5, 10])
+    assert schmitt(data, 10, 0).tolist() == [0, 0, 1, 1, 0, 0, 1]
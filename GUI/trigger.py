@@ -0,0 +1,127 @@
+#!python 3.x
+#################################################
+## Author       : Jose Moran
+## Github       : jose0796
+## email        : jmoran071996@gmail.com
+## file         : trigger.py
+## Description  : Trigger engine finding aligned
+## sweeps in blocks of samples
+#################################################
+
+import numpy as np
+
+from buffers import ChannelStore
+
+
+MODES = ('rising', 'falling', 'high', 'low')
+
+
+def schmitt(data, high, low, state=-1):
+
+    """ Vectorized Schmitt trigger: output goes to 1 once data reaches
+        high and back to 0 once it is at or below low, holding in between.
+        state is the output before the first sample (-1 unknown)
+        :returns:
+            The output at every sample of data
+    """
+
+    armed = data <= low
+    fired = data >= high
+    #last decided state at every sample, carrying the previous one
+    last = np.where(armed | fired, np.arange(len(data)), -1)
+    np.maximum.accumulate(last, out=last)
+    return np.where(last >= 0, fired[last], state)
+
+
+class Trigger:
+    """ Edge/level trigger over blocks of raw samples.
+
+        channel is 0-3 (A1, A2, D1, D2) and level is in raw units (ADC
+        codes for A1/A2, 0/1 for D1/D2). Edges use a Schmitt trigger: a
+        rising edge fires when the signal reaches level after having been
+        at or below level - hysteresis (mirrored for falling), so noise
+        around the level does not retrigger. Digital channels always
+        switch at 1 and 0. Every sweep holds pre samples
+        before the trigger point and post samples from it on; a new
+        trigger is only accepted once the previous sweep is complete.
+    """
+
+    def __init__(self, channel=0, mode='rising', level=2048, hysteresis=40, pre=1000, post=1000):
+        if mode not in MODES:
+            raise ValueError('Unknown trigger mode %s' % mode)
+        if channel >= 2: #digital: the only edges are 0 <-> 1
+            level, hysteresis = 1, 1
+        self.channel = channel
+        self.mode = mode
+        self.level = level
+        self.hysteresis = hysteresis
+        self.pre = pre
+        self.post = post
+
+        depth = 2*(pre + post)
+        self.history = (ChannelStore(depth, np.uint16), ChannelStore(depth, np.uint16),
+                        ChannelStore(depth, np.uint8), ChannelStore(depth, np.uint8))
+        self.state = -1 #Schmitt trigger state carried between blocks, -1 unknown
+        self.pending = [] #trigger points waiting for their post samples
+        self.holdoff = 0 #first sample a new trigger may fire at
+        self.sweeps = 0
+
+    def find(self, data):
+
+        """ Vectorized search of trigger points in a block of one channel
+            :returns:
+                Indexes of the samples the trigger fires at
+        """
+
+        data = data.astype(np.int32)
+        if self.mode == 'high':
+            return np.flatnonzero(data >= self.level)
+        if self.mode == 'low':
+            return np.flatnonzero(data <= self.level - (self.hysteresis if self.channel >= 2 else 0))
+        if self.mode == 'falling' and self.channel >= 2: #a rising edge of the inverted bit
+            data, level = 1 - data, self.level
+        elif self.mode == 'falling':
+            data, level = -data, -self.level
+        else:
+            level = self.level
+
+        state = schmitt(data, level, level - self.hysteresis, self.state)
+        previous = np.concatenate(([self.state], state[:-1]))
+        if len(state):
+            self.state = int(state[-1])
+        return np.flatnonzero((state == 1) & (previous == 0))
+
+    def feed(self, block):
+
+        """ Takes the next block of samples (tuple of the four channels)
+            :returns:
+                The newest sweep completed by this block as a tuple of the
+                four channel arrays, or None
+        """
+
+        sweep = None
+        size = self.pre + self.post
+        for first in range(0, len(block[0]), size): #pieces never overrun the history
+            piece = [channel[first:first + size] for channel in block]
+            start = self.history[0].written
+            for store, channel in zip(self.history, piece):
+                store.append(channel)
+
+            points = self.find(piece[self.channel]) + start
+            i = np.searchsorted(points, self.holdoff)
+            while i < len(points): #one step per sweep, not per trigger point
+                point = int(points[i])
+                if point - self.pre >= 0:
+                    self.pending.append(point)
+                    self.holdoff = point + self.post
+                i = np.searchsorted(points, max(self.holdoff, point + 1))
+
+            written = self.history[0].written
+            while self.pending and self.pending[0] + self.post <= written:
+                point = self.pending.pop(0)
+                if point - self.pre >= written - self.history[0].capacity:
+                    sweep = tuple(store.view(point - self.pre, point + self.post).copy()
+                                  for store in self.history)
+                    self.sweeps += 1
+
+        return sweep